@@ -0,0 +1,369 @@
+"""Offline benchmark of the OpenAI Control conversation agent.
+
+Drives OpenAIAgent.async_process against an in-memory Home Assistant instance
+with synthetic registries of lights and switches, and a local stand-in for
+the chat completions endpoint with a configurable latency and canned replies.
+No API key or network access is needed.
+
+Run from the repository root:
+
+    python benchmarks/bench_agent.py --sizes 10 100 1000 5000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any
+
+from aiohttp import web
+
+# the conversation component has to be imported after bootstrap
+import homeassistant.bootstrap  # noqa: F401  pylint: disable=unused-import
+from homeassistant.components import conversation
+from homeassistant.const import CONF_API_KEY
+from homeassistant.core import Context, HomeAssistant
+from homeassistant.helpers import area_registry, device_registry, entity_registry
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from custom_components.openai_control import OpenAIAgent  # noqa: E402
+from custom_components.openai_control.catalog import EntityCatalog  # noqa: E402
+from custom_components.openai_control.client import OpenAIClient  # noqa: E402
+from custom_components.openai_control.const import (  # noqa: E402
+    CONF_CACHE_SIZE,
+    CONF_DELTA_STATE,
+    CONF_ENTITY_FORMAT,
+    CONF_FAST_PATH,
+    CONF_PLAN_REPEATS,
+    CONF_PROMPT_LAYOUT,
+    CONF_RESPONSE_FORMAT,
+    CONF_TOP_K,
+    DEFAULT_DOMAINS,
+    LANGUAGE_AND_MODE,
+)
+from custom_components.openai_control.domains import DomainRegistry  # noqa: E402
+from custom_components.openai_control.models import ModelCache  # noqa: E402
+from custom_components.openai_control.tokens import (  # noqa: E402
+    count_message_tokens,
+    count_tokens,
+)
+
+ROOMS = [
+    "kitchen",
+    "living room",
+    "office",
+    "bedroom",
+    "bathroom",
+    "hallway",
+    "garage",
+    "garden",
+    "attic",
+    "guest room",
+]
+
+UTTERANCES = [
+    "Turn off the kitchen lights",
+    "Make the living room cozy",
+    "Switch on the office lamp and dim the hallway",
+    "Is the garage light on?",
+]
+
+
+class MockOpenAI:
+    """Local stand-in for the chat completions endpoint."""
+
+    def __init__(self, latency: float, reply: dict[str, Any]) -> None:
+        """Initialize the mock."""
+        self.latency = latency
+        self.reply = reply
+        self.last_messages: list[dict[str, Any]] = []
+
+    @staticmethod
+    def domain(entity_id: str) -> str:
+        """Return the domain of an entity id, compact handles are lights."""
+        return entity_id.split(".", 1)[0] if "." in entity_id else "light"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Answer a chat completion request after the configured latency."""
+        body = await request.json()
+        self.last_messages = body["messages"]
+        await asyncio.sleep(self.latency)
+        message: dict[str, Any] = {
+            "role": "assistant",
+            "content": json.dumps(self.reply),
+        }
+        if "tools" in body:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{index}",
+                        "type": "function",
+                        "function": {
+                            "name": f"{self.domain(entity['id'])}_{entity['action']}",
+                            "arguments": json.dumps({"entity_ids": [entity["id"]]}),
+                        },
+                    }
+                    for index, entity in enumerate(self.reply["entities"])
+                ],
+            }
+        return web.json_response(
+            {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            }
+        )
+
+    async def async_start(self) -> tuple[web.AppRunner, str]:
+        """Start the server and return its runner and API base url."""
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+        return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Create an in-memory Home Assistant instance with empty registries."""
+    try:
+        hass = HomeAssistant(config_dir)  # type: ignore[call-arg]
+    except TypeError:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    await area_registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+
+    async def async_service(call: Any) -> None:
+        """Accept any light or switch service call."""
+
+    for domain in ("light", "switch"):
+        for service in ("turn_on", "turn_off", "toggle"):
+            hass.services.async_register(domain, service, async_service)
+    return hass
+
+
+def populate(hass: HomeAssistant, size: int) -> list[str]:
+    """Register and expose size lights and switches spread over the rooms."""
+    areas = area_registry.async_get(hass)
+    entities = entity_registry.async_get(hass)
+    area_ids = [areas.async_get_or_create(room).id for room in ROOMS]
+
+    entity_ids = []
+    for index in range(size):
+        domain = "switch" if index % 5 == 4 else "light"
+        room = ROOMS[index % len(ROOMS)]
+        entry = entities.async_get_or_create(
+            domain,
+            "bench",
+            f"{domain}_{index}",
+            suggested_object_id=f"{room.replace(' ', '_')}_{domain}_{index}",
+            get_initial_options=lambda: {"conversation": {"should_expose": True}},
+        )
+        entities.async_update_entity(
+            entry.entity_id, area_id=area_ids[index % len(area_ids)]
+        )
+        attributes: dict[str, Any] = {"friendly_name": f"{room} {domain} {index}"}
+        if domain == "light":
+            attributes.update({"brightness": 128, "hs_color": (30.0, 80.0)})
+        hass.states.async_set(entry.entity_id, "on", attributes)
+        entity_ids.append(entry.entity_id)
+    return entity_ids
+
+
+def conversation_input(text: str) -> conversation.ConversationInput:
+    """Create a conversation input for the agent."""
+    kwargs: dict[str, Any] = {
+        "text": text,
+        "context": Context(),
+        "conversation_id": None,
+        "device_id": None,
+        "language": "en",
+    }
+    try:
+        return conversation.ConversationInput(**kwargs)
+    except TypeError:
+        return conversation.ConversationInput(agent_id=None, **kwargs)
+
+
+def shared_prefix_tokens(
+    previous: list[dict[str, Any]], messages: list[dict[str, Any]]
+) -> int:
+    """Return the number of tokens at the start of two requests that are identical."""
+    first, second = (
+        "".join(f"{message['role']}\n{message['content']}\n" for message in request)
+        for request in (previous, messages)
+    )
+    return count_tokens(os.path.commonprefix([first, second]), "gpt-3.5-turbo")
+
+
+async def async_bench_size(
+    size: int, args: argparse.Namespace, mock: MockOpenAI, api_base: str
+) -> dict[str, Any]:
+    """Benchmark the agent against a house of size entities."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        entity_ids = populate(hass, size)
+        mock.reply = {
+            "entities": [{"id": entity_ids[0], "action": "turn_off"}],
+            "assistant": "Done.",
+        }
+
+        entry = SimpleNamespace(
+            entry_id="bench",
+            title="bench",
+            data={CONF_API_KEY: "sk-bench"},
+            options={
+                LANGUAGE_AND_MODE: args.mode,
+                CONF_ENTITY_FORMAT: args.entity_format,
+                CONF_RESPONSE_FORMAT: args.response_format,
+                CONF_DELTA_STATE: args.delta_state,
+                CONF_PROMPT_LAYOUT: args.prompt_layout,
+                CONF_TOP_K: args.top_k,
+                CONF_FAST_PATH: False,
+                CONF_CACHE_SIZE: 0,
+                CONF_PLAN_REPEATS: 0,
+            },
+            async_on_unload=lambda func: None,
+        )
+        domains = DomainRegistry(hass, DEFAULT_DOMAINS)
+        domains.async_start()
+        catalog = EntityCatalog(hass, domains)
+        catalog.async_start()
+        client = OpenAIClient(hass, "sk-bench", 5, 30, api_base=api_base)
+        agent = OpenAIAgent(
+            hass, entry, catalog, client, ModelCache(hass, "sk-bench")
+        )
+
+        # warm up the connection pool and caches
+        await agent.async_process(conversation_input(UTTERANCES[0]))
+
+        latencies = []
+        overheads = []
+        tokens = []
+        prefixes = []
+        previous = mock.last_messages
+        for index in range(args.requests):
+            for changed in range(args.state_changes):
+                entity_id = entity_ids[(index * args.state_changes + changed) % size]
+                state = hass.states.get(entity_id)
+                hass.states.async_set(
+                    entity_id,
+                    "off" if state.state == "on" else "on",
+                    state.attributes,
+                )
+            start = time.perf_counter()
+            await agent.async_process(
+                conversation_input(UTTERANCES[index % len(UTTERANCES)])
+            )
+            elapsed = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed)
+            overheads.append(elapsed - (agent.metrics.stages["openai"].last or 0))
+            tokens.append(count_message_tokens(mock.last_messages, "gpt-3.5-turbo"))
+            prefixes.append(shared_prefix_tokens(previous, mock.last_messages))
+            previous = mock.last_messages
+
+        # allocations are measured in a separate pass, tracing slows everything down
+        allocations = []
+        tracemalloc.start()
+        for index in range(min(args.requests, 20)):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            await agent.async_process(
+                conversation_input(UTTERANCES[index % len(UTTERANCES)])
+            )
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - before)
+        tracemalloc.stop()
+
+        catalog.async_stop()
+        await hass.async_stop(force=True)
+
+    return {
+        "entities": size,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95) - 1],
+        "overhead_p50_ms": statistics.median(overheads),
+        "prompt_tokens": statistics.median(tokens),
+        "prefix_tokens": statistics.median(prefixes),
+        "peak_alloc_kib": statistics.median(allocations) / 1024,
+    }
+
+
+async def async_main(args: argparse.Namespace) -> None:
+    """Run the benchmark for every size and print a table."""
+    mock = MockOpenAI(args.latency / 1000, {})
+    runner, api_base = await mock.async_start()
+
+    print(
+        f"{'entities':>8} {'p50 ms':>9} {'p95 ms':>9} {'overhead':>9}"
+        f" {'tokens':>8} {'prefix':>8} {'alloc KiB':>10}"
+    )
+    try:
+        for size in args.sizes:
+            result = await async_bench_size(size, args, mock, api_base)
+            print(
+                f"{result['entities']:>8} {result['p50_ms']:>9.2f}"
+                f" {result['p95_ms']:>9.2f} {result['overhead_p50_ms']:>9.2f}"
+                f" {result['prompt_tokens']:>8.0f} {result['prefix_tokens']:>8.0f}"
+                f" {result['peak_alloc_kib']:>10.1f}"
+            )
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    """Parse the arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000]
+    )
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="model latency in milliseconds"
+    )
+    parser.add_argument("--mode", default="English + brightness + color control")
+    parser.add_argument("--entity-format", default="standard")
+    parser.add_argument("--response-format", default="json")
+    parser.add_argument("--top-k", type=int, default=0)
+    parser.add_argument("--delta-state", action="store_true")
+    parser.add_argument("--prompt-layout", default="standard")
+    parser.add_argument(
+        "--state-changes",
+        type=int,
+        default=0,
+        help="entity states changed before every request",
+    )
+    asyncio.run(async_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
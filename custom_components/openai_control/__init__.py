@@ -1,78 +1,186 @@
 """The OpenAI Control integration."""
 from __future__ import annotations
 
+import asyncio
+import copy
+import dataclasses
 import json
 import re
 
-from functools import partial
 import logging
+import time
 from typing import Any, Literal
 
-from string import Template
-
-import openai
 from openai import error
 
 from homeassistant.components import conversation
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_API_KEY, MATCH_ALL
-from homeassistant.core import HomeAssistant
-from homeassistant.exceptions import ConfigEntryNotReady, TemplateError
-from homeassistant.helpers import intent, template, entity_registry
+from homeassistant.const import (
+    CONF_API_KEY,
+    EVENT_CORE_CONFIG_UPDATE,
+    MATCH_ALL,
+    Platform,
+)
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.exceptions import TemplateError
+from homeassistant.helpers import intent, template, entity_registry as er
 from homeassistant.util import ulid
 
 from .const import (
+    BATCH_CONCURRENCY,
+    CONF_BREAKER_RESET,
+    CONF_BREAKER_THRESHOLD,
+    CONF_CACHE_SIZE,
+    CONF_CACHE_TTL,
     CONF_CHAT_MODEL,
+    CONF_CONNECT_TIMEOUT,
+    CONF_DEADLINE,
+    CONF_DOMAINS,
+    CONF_ENTITY_FORMAT,
+    CONF_FALLBACK_MODEL,
+    CONF_FAST_PATH,
+    CONF_HEDGE,
+    CONF_HISTORY_TURNS,
+    CONF_MAX_CONCURRENCY,
+    CONF_MAX_RETRIES,
     CONF_MAX_TOKENS,
+    CONF_OPTIMIZE_ACTIONS,
+    CONF_PLAN_REPEATS,
     CONF_PROMPT,
+    CONF_REQUEST_TIMEOUT,
+    CONF_REQUESTS_PER_MINUTE,
+    CONF_STREAM,
     CONF_TEMPERATURE,
+    CONF_TOKEN_BUDGET,
+    CONF_TOKENS_PER_MINUTE,
+    CONF_TOP_K,
     CONF_TOP_P,
+    DEFAULT_BREAKER_RESET,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL,
     DEFAULT_CHAT_MODEL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_DEADLINE,
+    DEFAULT_DOMAINS,
+    DEFAULT_FALLBACK_MODEL,
+    DEFAULT_FAST_PATH,
+    DEFAULT_HEDGE,
+    DEFAULT_HISTORY_TURNS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
     DEFAULT_MAX_TOKENS,
+    DEFAULT_OPTIMIZE_ACTIONS,
+    DEFAULT_PLAN_REPEATS,
     DEFAULT_PROMPT,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_STREAM,
     DEFAULT_TEMPERATURE,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_TOKENS_PER_MINUTE,
+    DEFAULT_TOP_K,
     DEFAULT_TOP_P,
-    ENTITY_TEMPLATE,
-    COLOR_ENTITY_TEMPLATE,
-    PROMPT_TEMPLATE,
-    COLOR_PROMPT_TEMPLATE,
-    DUTCH_PROMPT_TEMPLATE,
-    DUTCH_COLOR_PROMPT_TEMPLATE,
-    LANGUAGE_AND_MODE,
-    TEST_PROMPT_TEMPLATE,
-    TEST_ENTITY_TEMPLATE,
+    DOMAIN,
+    HISTORY_MAX_CONVERSATIONS,
+    HISTORY_MAX_TURNS,
+    HISTORY_TTL,
+    PREPARE_TTL,
+)
+from .actions import (
+    Action,
+    ParsedReply,
+    async_execute_actions,
+    merge_actions,
+    optimize_actions,
 )
+from .cache import ResponseCache, normalize_text
+from .catalog import EntityCatalog
+from .client import OpenAIClient
+from .domains import DomainRegistry
+from .fast_path import FastPathMatcher
+from .history import ConversationHistory, Turn
+from .mode import Mode, resolve_mode
+from .models import ModelCache
+from .plans import Plan, PlanStore
+from .resilience import CallPolicy, CircuitBreaker, CircuitOpenError, ResilientClient
+from .retrieval import mentions_attributes
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RequestScheduler
+from .services import async_setup_services, async_unload_services
+from .stats import Metrics
+from .streaming import EntityStreamParser
+from .tokens import context_window, count_message_tokens, count_tokens, load_encoding
+from .tools import parse_tool_calls
 
 _LOGGER = logging.getLogger(__name__)
 
 _LOGGER.info("Testing the logs")
 
+PLATFORMS = [Platform.SENSOR]
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up OpenAI Agent from a config entry."""
 
-    openai.api_key = entry.data[CONF_API_KEY]
-
-    try:
-        await hass.async_add_executor_job(
-            partial(openai.Model.list, request_timeout=10)
+    client = OpenAIClient(
+        hass,
+        entry.data[CONF_API_KEY],
+        entry.options.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT),
+        entry.options.get(CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT),
+    )
+
+    models = ModelCache(hass, entry.data[CONF_API_KEY])
+    await models.async_load()
+
+    domains = DomainRegistry(hass, entry.options.get(CONF_DOMAINS, DEFAULT_DOMAINS))
+    domains.async_start()
+    entry.async_on_unload(domains.async_stop)
+
+    catalog = EntityCatalog(hass, domains)
+    catalog.async_start()
+    entry.async_on_unload(catalog.async_stop)
+    entry.async_on_unload(domains.async_add_listener(catalog.async_refresh))
+
+    # tiktoken reads or downloads its encoding the first time it is used
+    hass.async_add_executor_job(
+        load_encoding, entry.options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+    )
+
+    agent = OpenAIAgent(hass, entry, catalog, client, models)
+    await agent.plans.async_load()
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = agent
+    conversation.async_set_agent(hass, entry, agent)
+    async_setup_services(hass)
+
+    # the agent is usable right away, a slow or offline connection must not
+    # delay startup
+    if not models.is_fresh:
+        task = hass.async_create_background_task(
+            agent.async_validate(), f"{DOMAIN} validate {entry.entry_id}"
         )
-    except error.AuthenticationError as err:
-        _LOGGER.error("Invalid API key: %s", err)
-        return False
-    except error.OpenAIError as err:
-        raise ConfigEntryNotReady(err) from err
+        entry.async_on_unload(task.cancel)
 
-    conversation.async_set_agent(hass, entry, OpenAIAgent(hass, entry))
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload OpenAI Agent."""
-    openai.api_key = None
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
     conversation.async_unset_agent(hass, entry)
+    hass.data[DOMAIN].pop(entry.entry_id)
+    async_unload_services(hass)
     return True
 
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options to the running agent without a reload."""
+    agent: OpenAIAgent = hass.data[DOMAIN][entry.entry_id]
+    agent.async_update_options()
+
+
 def _entry_ext_dict(entry: er.RegistryEntry) -> dict[str, Any]:
     """Convert entry to API format."""
     data = entry.as_partial_dict
@@ -86,11 +194,157 @@ def _entry_ext_dict(entry: er.RegistryEntry) -> dict[str, Any]:
 class OpenAIAgent(conversation.AbstractConversationAgent):
     """OpenAI Control Agent."""
 
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry: ConfigEntry,
+        catalog: EntityCatalog,
+        client: OpenAIClient,
+        models: ModelCache,
+    ) -> None:
         """Initialize the agent."""
         self.hass = hass
         self.entry = entry
-        self.history: dict[str, list[dict]] = {}
+        self.catalog = catalog
+        self.client = client
+        self.models = models
+        self.fast_path = FastPathMatcher(catalog)
+        self.cache = ResponseCache(
+            int(entry.options.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE)),
+            entry.options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL),
+        )
+        entry.async_on_unload(catalog.async_add_listener(self._async_entity_changed))
+        self.history = ConversationHistory(
+            HISTORY_MAX_CONVERSATIONS, HISTORY_MAX_TURNS, HISTORY_TTL
+        )
+        self.plans = PlanStore(
+            hass,
+            entry.entry_id,
+            int(entry.options.get(CONF_PLAN_REPEATS, DEFAULT_PLAN_REPEATS)),
+        )
+        self.metrics = Metrics()
+        # interactive requests go before background requests within the limits
+        self.scheduler = RequestScheduler(
+            hass,
+            self.metrics,
+            int(entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)),
+            entry.options.get(CONF_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE),
+            entry.options.get(CONF_TOKENS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE),
+        )
+        entry.async_on_unload(self.scheduler.async_stop)
+        self.resilient = ResilientClient(
+            client,
+            CircuitBreaker(
+                int(
+                    entry.options.get(CONF_BREAKER_THRESHOLD, DEFAULT_BREAKER_THRESHOLD)
+                ),
+                entry.options.get(CONF_BREAKER_RESET, DEFAULT_BREAKER_RESET),
+            ),
+            self.scheduler,
+            self.metrics,
+        )
+        self.mode: Mode = resolve_mode(entry.options, catalog.domains)
+        # the mode with the compact encoding, resolved when a prompt is too large
+        self._compact_mode: Mode | None = None
+        # the tools and field descriptions of the mode depend on the services
+        entry.async_on_unload(
+            catalog.domains.async_add_listener(self._async_services_changed)
+        )
+        self._prompt_template = template.Template(
+            entry.options.get(CONF_PROMPT, DEFAULT_PROMPT), hass
+        )
+        # the rendered system prompt, None when it has to be rendered again
+        self._prompt: str | None = None
+        # time and system prompt rendered by async_prepare for the next utterance
+        self._prepared_prompt: tuple[float, str] | None = None
+        # requests being processed, keyed by normalized text and mode
+        self._in_flight: dict[
+            tuple[Any, ...], asyncio.Task[conversation.ConversationResult]
+        ] = {}
+        # the prompt renders the location name
+        entry.async_on_unload(
+            hass.bus.async_listen(EVENT_CORE_CONFIG_UPDATE, self._async_core_config_updated)
+        )
+
+    @callback
+    def async_update_options(self) -> None:
+        """Resolve the mode, prompt, client and cache from the current options."""
+        options = self.entry.options
+        self.catalog.domains.async_set_domains(
+            options.get(CONF_DOMAINS, DEFAULT_DOMAINS)
+        )
+        previous = self.mode
+        self.mode = resolve_mode(options, self.catalog.domains)
+        self._compact_mode = None
+        # the replies of the plans are in the language of the mode
+        if self.mode.name != previous.name:
+            self.plans.async_clear()
+        self.plans.repeats = int(options.get(CONF_PLAN_REPEATS, DEFAULT_PLAN_REPEATS))
+        self._prompt_template = template.Template(
+            options.get(CONF_PROMPT, DEFAULT_PROMPT), self.hass
+        )
+        self._prompt = None
+        self._prepared_prompt = None
+
+        self.client.connect_timeout = options.get(
+            CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT
+        )
+        self.client.request_timeout = options.get(
+            CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT
+        )
+
+        breaker = self.resilient.breaker
+        breaker.failure_threshold = int(
+            options.get(CONF_BREAKER_THRESHOLD, DEFAULT_BREAKER_THRESHOLD)
+        )
+        breaker.reset_timeout = options.get(CONF_BREAKER_RESET, DEFAULT_BREAKER_RESET)
+
+        self.scheduler.async_set_limits(
+            int(options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)),
+            options.get(CONF_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE),
+            options.get(CONF_TOKENS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE),
+        )
+
+        max_size = int(options.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE))
+        ttl = options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL)
+        if (max_size, ttl) != (self.cache.max_size, self.cache.ttl):
+            self.cache = ResponseCache(max_size, ttl)
+
+        self.hass.async_add_executor_job(
+            load_encoding, options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+        )
+
+    async def async_validate(self) -> None:
+        """Validate the API key and refresh the cached model list."""
+        try:
+            await self.models.async_validate(self.client)
+        except error.AuthenticationError as err:
+            _LOGGER.error("Invalid API key: %s", err)
+            self.models.error = "invalid_auth"
+        except error.OpenAIError as err:
+            _LOGGER.warning("Unable to validate the API key: %s", err)
+            self.models.error = "cannot_connect"
+
+    @callback
+    def _async_entity_changed(self, entity_id: str) -> None:
+        """Drop the cached replies and plans that depend on a changed entity."""
+        self.cache.invalidate(entity_id)
+        # an entity that only lost its state, like while its integration
+        # reloads, keeps its plans
+        if not self.catalog.is_exposed(entity_id):
+            self.plans.async_invalidate(entity_id)
+
+    @callback
+    def _async_services_changed(self) -> None:
+        """Resolve the mode again after the controlled services changed."""
+        self.mode = resolve_mode(self.entry.options, self.catalog.domains)
+        self._compact_mode = None
+
+    @callback
+    def _async_core_config_updated(self, event: Event) -> None:
+        """Render the system prompt again after the location name changed."""
+        self._prompt = None
+        self._prepared_prompt = None
 
     @property
     def attribution(self):
@@ -102,27 +356,388 @@ class OpenAIAgent(conversation.AbstractConversationAgent):
         """Return a list of supported languages."""
         return MATCH_ALL
 
+    async def async_prepare(self, language: str | None = None) -> None:
+        """Prepare for an utterance that is about to arrive.
+
+        Renders the system prompt and the entity list and opens the connection
+        to OpenAI, so only the model call is left once the text arrives.
+        Called by the conversation/prepare websocket command and the
+        openai_control.prepare service, for example when a wake word fires.
+        """
+        self.metrics.increment("prepares")
+        self._prepared_prompt = None
+        try:
+            prompt = self._async_generate_prompt()
+        except TemplateError as err:
+            _LOGGER.error("Error rendering prompt: %s", err)
+        else:
+            # a prompt that renders states is a snapshot of the time of the prepare
+            if self._prompt is None:
+                self._prepared_prompt = (time.monotonic(), prompt)
+
+        # the full entity list is sent when the index is not confident of a match
+        mode = self.mode
+        if mode.prefix_cache:
+            self.catalog.async_render_split(mode.name, set(), mode.compact)
+        else:
+            self.catalog.async_render(mode.name, None, mode.compact)
+        if mode.delta_state and not mode.prefix_cache:
+            self.catalog.async_render(mode.name, None, mode.compact, set())
+
+        await self.client.async_warm_up()
+        self.metrics.notify()
+
     async def async_process(
         self, user_input: conversation.ConversationInput
     ) -> conversation.ConversationResult:
-        
-        _LOGGER.info("LANGUAGE_AND_MODE =  %s ", self.entry.options.get(LANGUAGE_AND_MODE))
+        """Process a sentence.
+
+        Concurrent identical sentences share a single OpenAI call and a single
+        execution of the actions, each caller gets its own conversation id.
+        With history only sentences of the same conversation are shared.
+        """
+        self.metrics.increment("requests")
+        key: tuple[Any, ...] = (
+            normalize_text(user_input.text),
+            self.mode.name,
+            self.mode.tools is not None,
+        )
+        # with history the same sentence means something else in another conversation
+        if int(self.entry.options.get(CONF_HISTORY_TURNS, DEFAULT_HISTORY_TURNS)) > 0:
+            key += (user_input.conversation_id,)
+        try:
+            with self.metrics.time("total"):
+                if (task := self._in_flight.get(key)) is None:
+                    task = self.hass.async_create_task(self._async_process(user_input))
+                    self._in_flight[key] = task
+                    task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+                    # a cancelled caller does not cancel the callers sharing the task
+                    return await asyncio.shield(task)
+
+                self.metrics.increment("coalesced_requests")
+                return self._async_share_result(user_input, await asyncio.shield(task))
+        finally:
+            self.metrics.notify()
+
+    async def async_process_batch(self, texts: list[str]) -> list[dict[str, Any]]:
+        """Process several sentences and execute their actions in one pass.
+
+        All sentences are resolved against the same system prompt and entity
+        list. Identical sentences are sent once, the others in parallel with
+        at most BATCH_CONCURRENCY requests at a time. The actions of all
+        sentences are merged and executed together. Returns the reply, the
+        actions and the error of each sentence, in order.
+        """
+        self.metrics.increment("batches")
+        self.metrics.increment("requests", len(texts))
+        mode = self.mode
+        top_k = int(self.entry.options.get(CONF_TOP_K, DEFAULT_TOP_K))
+
+        try:
+            with self.metrics.time("prompt"):
+                prompt = self._async_generate_prompt()
+
+            # the entities relevant to any of the sentences
+            with self.metrics.time("entities"):
+                candidates: set[str] | None = set()
+                for text in texts:
+                    if (matched := self.catalog.index.match(text, top_k)) is None:
+                        candidates = None
+                        break
+                    candidates |= matched
+                mode, candidates, entities_template, states, _ = (
+                    self._async_fit_prompt(
+                        mode, prompt, " ".join(texts), None, candidates, None
+                    )
+                )
+
+            semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+            async def async_resolve(
+                text: str,
+            ) -> tuple[list[Action], str, str | None]:
+                async with semaphore:
+                    return await self._async_resolve(
+                        mode, prompt, entities_template, states, text
+                    )
+
+            unique: dict[str, str] = {}
+            for text in texts:
+                unique.setdefault(normalize_text(text), text)
+            self.metrics.increment("coalesced_requests", len(texts) - len(unique))
+            resolved = dict(
+                zip(
+                    unique,
+                    await asyncio.gather(
+                        *(async_resolve(text) for text in unique.values())
+                    ),
+                )
+            )
+
+            with self.metrics.time("services"):
+                failed = set(
+                    await self._async_execute(
+                        merge_actions(
+                            [action for key in unique for action in resolved[key][0]]
+                        )
+                    )
+                )
+        finally:
+            self.metrics.notify()
+
+        results = []
+        for text in texts:
+            actions, reply, err = resolved[normalize_text(text)]
+            results.append(
+                {
+                    "text": text,
+                    "reply": reply,
+                    "actions": [
+                        {
+                            "entity_id": action.entity_id,
+                            "service": f"{action.domain}.{action.service}",
+                            "data": action.data,
+                        }
+                        for action in actions
+                    ],
+                    "success": err is None
+                    and not any(action.entity_id in failed for action in actions),
+                    "error": err,
+                }
+            )
+        return results
+
+    async def _async_resolve(
+        self, mode: Mode, prompt: str, entities_template: str, states: str, text: str
+    ) -> tuple[list[Action], str, str | None]:
+        """Return the actions, reply and error of a sentence without executing them."""
+        options = self.entry.options
+        if options.get(CONF_FAST_PATH, DEFAULT_FAST_PATH) and (
+            fast_path := self._fast_path_actions(text)
+        ) is not None:
+            return (*fast_path, None)
+
+        model = options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": mode.render(entities_template, text, states)},
+        ]
+        tokens = count_message_tokens(
+            messages, model, (prompt, entities_template, states)
+        )
+        kwargs = {"tools": mode.tools} if mode.tools is not None else {}
+        try:
+            with self.metrics.time("openai"):
+                result = await self.resilient.async_chat_completion(
+                    self._call_policy(PRIORITY_BACKGROUND, tokens),
+                    model=model,
+                    messages=messages,
+                    max_tokens=options.get(CONF_MAX_TOKENS, DEFAULT_MAX_TOKENS),
+                    top_p=options.get(CONF_TOP_P, DEFAULT_TOP_P),
+                    temperature=options.get(CONF_TEMPERATURE, DEFAULT_TEMPERATURE),
+                    **kwargs,
+                )
+        except error.OpenAIError as err:
+            _LOGGER.error("Error processing %s: %s", text, err)
+            return [], "", str(err)
+
+        self._record_usage(result)
+        try:
+            parsed = self._parse_reply(mode, self._reply_content(mode, result))
+        except (AttributeError, KeyError, IndexError, TypeError, ValueError) as err:
+            _LOGGER.error("Error parsing the reply to %s: %s", text, err)
+            return [], "", f"The reply of OpenAI could not be parsed: {err}"
+        return parsed.actions, parsed.text or "", parsed.error
+
+    @staticmethod
+    def _reply_content(mode: Mode, result: dict[str, Any]) -> str:
+        """Return the content of a completion, the whole message with tools."""
+        message = result["choices"][0]["message"]
+        # the whole message is cached when the reply has tool calls
+        if mode.tools is not None:
+            return json.dumps(message)
+        return message.get("content") or ""
+
+    def _async_fit_prompt(
+        self,
+        mode: Mode,
+        prompt: str,
+        text: str,
+        conversation_id: str | None,
+        candidates: set[str] | None,
+        detailed: set[str] | None,
+    ) -> tuple[Mode, set[str] | None, str, str, list[dict[str, str]]]:
+        """Render the entity list within the token budget of a request.
+
+        Over budget, brightness and color are left out first, then the compact
+        encoding is used and then the entity list is narrowed down to the best
+        matches of the text. Earlier turns of the conversation are added while
+        they fit. Returns the mode, candidates, entity list, states and history.
+        """
+        options = self.entry.options
+        model = options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+        budget = int(options.get(CONF_TOKEN_BUDGET, DEFAULT_TOKEN_BUDGET))
+        budget = (budget or context_window(model)) - options.get(
+            CONF_MAX_TOKENS, DEFAULT_MAX_TOKENS
+        )
+        if mode.tools is not None:
+            budget -= count_tokens(json.dumps(mode.tools), model)
+
+        # the entities listed in the prefix cache layout, all unless narrowed down
+        listed: set[str] | None = None
+
+        def render() -> tuple[str, str, int]:
+            if mode.prefix_cache:
+                entities_template, states = self.catalog.async_render_split(
+                    mode.name, candidates, mode.compact, detailed, listed
+                )
+            else:
+                entities_template = self.catalog.async_render(
+                    mode.name, candidates, mode.compact, detailed
+                )
+                states = ""
+            messages = [
+                {"content": prompt},
+                {"content": mode.render(entities_template, text, states)},
+            ]
+            # only the template around the entity list and the utterance are
+            # counted again, the prompt, entity list and states are cached
+            return entities_template, states, count_message_tokens(
+                messages, model, (prompt, entities_template, states)
+            )
+
+        entities_template, states, tokens = render()
+        if tokens > budget:
+            _LOGGER.info("Prompt of %s tokens is over the budget of %s", tokens, budget)
+
+        if tokens > budget and mode.color and detailed != set():
+            detailed = set()
+            entities_template, states, tokens = render()
+            _LOGGER.info("Left out brightness and color: %s tokens", tokens)
+
+        if tokens > budget and not mode.compact:
+            if self._compact_mode is None:
+                self._compact_mode = resolve_mode(
+                    {**options, CONF_ENTITY_FORMAT: "compact"}, self.catalog.domains
+                )
+            mode = self._compact_mode
+            entities_template, states, tokens = render()
+            _LOGGER.info("Switched to the compact encoding: %s tokens", tokens)
+
+        if tokens > budget:
+            ranked = self.catalog.index.rank(text)
+            matched = set(ranked)
+            ranked += [
+                entity_id
+                for entity_id in self.catalog.entities
+                if entity_id not in matched
+            ]
+            if candidates is not None:
+                ranked = [entity_id for entity_id in ranked if entity_id in candidates]
+            limit = len(ranked)
+            while tokens > budget and limit > 1:
+                # the entity list is most of the prompt, aim a little below budget
+                limit = max(1, min(limit - 1, limit * budget * 9 // (tokens * 10)))
+                candidates = listed = set(ranked[:limit])
+                entities_template, states, tokens = render()
+                _LOGGER.info("Narrowed down to %s entities: %s tokens", limit, tokens)
+
+        if tokens > budget:
+            _LOGGER.warning(
+                "Prompt of %s tokens is still over the budget of %s", tokens, budget
+            )
+
+        # the most recent turns that fit in the remaining budget
+        history: list[dict[str, str]] = []
+        max_turns = int(options.get(CONF_HISTORY_TURNS, DEFAULT_HISTORY_TURNS))
+        if conversation_id is not None and max_turns > 0:
+            for turn in reversed(self.history.turns(conversation_id)[-max_turns:]):
+                reply = turn.reply
+                if turn.actions:
+                    reply += f" ({', '.join(turn.actions)})"
+                messages = [
+                    {"role": "user", "content": turn.text},
+                    {"role": "assistant", "content": reply},
+                ]
+                # without the 3 tokens that prime the reply, already counted
+                turn_tokens = count_message_tokens(messages, model) - 3
+                if tokens + turn_tokens > budget:
+                    break
+                history[:0] = messages
+                tokens += turn_tokens
+            if history:
+                _LOGGER.debug(
+                    "Added %s earlier turns: %s tokens", len(history) // 2, tokens
+                )
+
+        return mode, candidates, entities_template, states, history
+
+    def _async_share_result(
+        self,
+        user_input: conversation.ConversationInput,
+        result: conversation.ConversationResult,
+    ) -> conversation.ConversationResult:
+        """Return the result of a coalesced request in the caller's conversation."""
+        if user_input.conversation_id in self.history:
+            conversation_id = user_input.conversation_id
+        else:
+            conversation_id = ulid.ulid()
+
+        if turns := self.history.turns(result.conversation_id):
+            self.history.append(conversation_id, turns[-1])
+
+        return dataclasses.replace(
+            result,
+            response=copy.copy(result.response),
+            conversation_id=conversation_id,
+        )
+
+    async def _async_process(
+        self, user_input: conversation.ConversationInput
+    ) -> conversation.ConversationResult:
 
         """ Options input """
 
-        raw_prompt = self.entry.options.get(CONF_PROMPT, DEFAULT_PROMPT)
+        mode = self.mode
+        priority = self._priority(user_input)
         model = self.entry.options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
         max_tokens = self.entry.options.get(CONF_MAX_TOKENS, DEFAULT_MAX_TOKENS)
         top_p = self.entry.options.get(CONF_TOP_P, DEFAULT_TOP_P)
         temperature = self.entry.options.get(CONF_TEMPERATURE, DEFAULT_TEMPERATURE)
+        top_k = int(self.entry.options.get(CONF_TOP_K, DEFAULT_TOP_K))
+
+        """ Fast path """
+
+        # simple commands like "turn off the kitchen lights" are resolved locally,
+        # OpenAI is only called when the command can't be resolved unambiguously
+        if self.entry.options.get(CONF_FAST_PATH, DEFAULT_FAST_PATH):
+            if (result := await self._async_fast_path(user_input)) is not None:
+                return result
+
+        """ Learned plans """
+
+        # commands OpenAI resolved to the same actions several times are
+        # replayed locally, unless earlier turns may change their meaning
+        learn = user_input.conversation_id not in self.history or not int(
+            self.entry.options.get(CONF_HISTORY_TURNS, DEFAULT_HISTORY_TURNS)
+        )
+        if learn and (
+            plan := self.plans.match(user_input.text, self.catalog.entities)
+        ) is not None:
+            return await self._async_run_plan(user_input, plan)
 
         """ Start a sentence """
 
         # check if the conversation is continuing or new
+        if user_input.conversation_id in self.history:
+            conversation_id = user_input.conversation_id
+        else:
+            conversation_id = ulid.ulid()
 
         # generate the prompt to be added to the sending messages later
         try:
-            prompt = self._async_generate_prompt(raw_prompt)
+            with self.metrics.time("prompt"):
+                prompt = self._async_generate_prompt()
         except TemplateError as err:
 
             _LOGGER.error("Error rendering prompt: %s", err)
@@ -136,169 +751,254 @@ class OpenAIAgent(conversation.AbstractConversationAgent):
                 response=intent_response, conversation_id=conversation_id
             )
 
-        # if continuing then get the messages from the conversation history
-        if user_input.conversation_id in self.history:
-            conversation_id = user_input.conversation_id
-            messages = self.history[conversation_id]
-        # if new then create a new conversation history
-        else:
-            conversation_id = ulid.ulid()
-            # add the conversation starter to the begining of the conversation
-            # this is to give the assistant more personality
-            messages = [{"role": "system", "content": prompt}]
-
-        # Standaardwaarden
-        prompt_template = Template(PROMPT_TEMPLATE)
-        entity_template = Template(ENTITY_TEMPLATE)
-
-        # Check voor "color" modus in combinatie met taal
-        if "color" in self.entry.options.get(LANGUAGE_AND_MODE):
-            entity_template = Template(COLOR_ENTITY_TEMPLATE)
-            
-            if "English" in self.entry.options.get(LANGUAGE_AND_MODE):
-                prompt_template = Template(COLOR_PROMPT_TEMPLATE)
-                _LOGGER.info("Mode: English color mode")
-            elif "Dutch" in self.entry.options.get(LANGUAGE_AND_MODE):
-                prompt_template = Template(DUTCH_COLOR_PROMPT_TEMPLATE)
-                _LOGGER.info("Mode: Dutch color mode")
-            else:
-                _LOGGER.warning("Color mode active but unknown language.")
-            
-        elif "English" in self.entry.options.get(LANGUAGE_AND_MODE):
-            _LOGGER.info("Mode: English mode")
-
-        elif "Dutch" in self.entry.options.get(LANGUAGE_AND_MODE):
-            prompt_template = Template(DUTCH_PROMPT_TEMPLATE)
-            _LOGGER.info("Mode: Dutch mode")
-
-        elif self.entry.options.get(LANGUAGE_AND_MODE) == "Test":
-            prompt_template = Template(TEST_PROMPT_TEMPLATE)
-            entity_template = Template(TEST_ENTITY_TEMPLATE)
-            _LOGGER.info("Mode: Test mode")
-
-        else:
-            _LOGGER.warning("Default mode active, unknown language or mode value.")
-
         """ Entities """
 
-        # Get all entities exposed to the Conversation Assistant
-        # NOTE: for the first release only lights and switches are supported
-
-        registry = entity_registry.async_get(self.hass)
-        entity_ids = self.hass.states.async_entity_ids(['light', 'switch'])
-
-        entities_template = ''
-
-        for entity_id in entity_ids:
-            # get entities from the registry
-            # to determine if they are exposed to the Conversation Assistant
-            # registry entries have the propert "options['conversation']['should_expose']"
-            entity = registry.entities.get(entity_id)
-
-            if entity.options['conversation']['should_expose'] is not True:
-                continue
-
-            if "color" in self.entry.options.get(LANGUAGE_AND_MODE):
-                # get the status string
-                status_object = self.hass.states.get(entity_id)
-                status_string = status_object.state
-
-                _LOGGER.info("status_object  %s ", status_object)
-                _LOGGER.info("status_string  %s ", status_string)
-
-                # Extract brightness and color if they exist.
-                brightness = status_object.attributes.get('brightness', None)
-                hs_color = status_object.attributes.get('hs_color', None)
-
-                _LOGGER.debug("Entity ID: %s, Brightness: %s, HS_Color: %s", entity_id, brightness, hs_color)
-
-                # Basislijst met services
-                services = ['toggle', 'turn_off', 'turn_on']  # 'turn_on' is al aanwezig voor zowel helderheid als kleur.
+        # The entities exposed to the Conversation Assistant are kept up to date
+        # by the catalog, so the entity list is a single cached join
 
-                # Update the entity_template population code.
-                entities_template += entity_template.substitute(
-                    id=entity_id,
-                    # name=entity.name or entity_id,
-                    status=status_string or "unknown",
-                    action=','.join(services),
-                    brightness=brightness if brightness is not None else "",
-                    hs_color=",".join(map(str, hs_color)) if hs_color is not None else ""
-                )
-            else:
-                # get the status string
-                status_object = self.hass.states.get(entity_id)
-                status_string = status_object.state
-
-                # TODO: change this to dynamic call once more than lights are supported
-                services = ['toggle', 'turn_off', 'turn_on']
-
-                # append the entitites tempalte
-                entities_template += entity_template.substitute(
-                    id=entity_id,
-                    # name=entity.name or entity_id,
-                    status=status_string or "unknown",
-                    action=','.join(services),
+        with self.metrics.time("entities"):
+            # only send the entities relevant to the prompt,
+            # or all of them when the index is not confident about the match
+            candidates = self.catalog.index.match(user_input.text, top_k)
+            if candidates is not None:
+                _LOGGER.debug(
+                    "Sending %s of %s entities", len(candidates), len(self.catalog.entities)
                 )
 
-        # generate the prompt using the prompt_template
-        prompt_render = prompt_template.substitute(
-            entities=entities_template,
-            prompt=user_input.text
-        )
+            # brightness and color are left out for the entities the utterance
+            # is not about, unless it asks for a brightness or color change
+            detailed = None
+            if mode.delta_state and not mentions_attributes(user_input.text):
+                detailed = self.catalog.index.related(user_input.text)
 
-        messages.append({"role": "user", "content": prompt_render})
+            # the entity list is reduced until the request fits the token budget
+            mode, candidates, entities_template, states, history = (
+                self._async_fit_prompt(
+                    mode, prompt, user_input.text, conversation_id, candidates, detailed
+                )
+            )
 
-        _LOGGER.debug("Prompt for %s: %s", model, messages)
+        # generate the prompt using the prompt_template of the mode
+        prompt_render = mode.render(entities_template, user_input.text, states)
 
         """ OpenAI Call """
 
-        # NOTE: this version does not support a full conversation history
+        # NOTE: the full conversation history is not sent
         # this is because the prompt_template and entities list
         # can quickly increase the size of a conversation
         # causing an error where the payload is too large
 
         # to that end we create a new list of messages to be sent
-        # sending only the system role message and the current user message
+        # sending the system role message, the earlier turns that fit the
+        # token budget and the current user message
         sending_messages = [
             {"role": "system", "content": prompt},
+            *history,
             {"role": "user", "content": prompt_render}
         ]
 
+        _LOGGER.debug("Prompt for %s: %s", model, sending_messages)
+
+        # the estimate the scheduler counts against the tokens per minute limit
+        tokens = count_message_tokens(
+            sending_messages, model, (prompt, entities_template, states)
+        )
+
+        # entities already executed while the reply was streaming
+        dispatched: list[dict[str, Any]] = []
+        # ids of the entities whose call failed while the reply was streaming
+        failed: list[str] = []
+
+        # repeated phrases against the same entity states replay the cached reply
+        cache_key = (
+            normalize_text(user_input.text),
+            mode.name,
+            mode.tools is not None,
+            model,
+            temperature,
+            hash(prompt),
+            hash(entities_template),
+            hash(states),
+            tuple(message["content"] for message in history),
+        )
+
         # call OpenAI
-        try:
-            result = await openai.ChatCompletion.acreate(
-                model=model,
-                messages=sending_messages,
-                max_tokens=max_tokens,
-                top_p=top_p,
-                temperature=temperature,
-                user=conversation_id
-            )
-        except error.OpenAIError as err:
+        if (content := self.cache.get(cache_key)) is not None:
+            _LOGGER.debug("Replaying cached response for %s", user_input.text)
+            # a replayed reply is not another resolution of the sentence
+            learn = False
+        else:
+            try:
+                with self.metrics.time("openai"):
+                    # tool calls are only parsed from complete replies
+                    if mode.tools is None and self.entry.options.get(
+                        CONF_STREAM, DEFAULT_STREAM
+                    ):
+                        content = await self._async_stream_completion(
+                            dispatched,
+                            failed,
+                            priority,
+                            tokens,
+                            model=model,
+                            messages=sending_messages,
+                            max_tokens=max_tokens,
+                            top_p=top_p,
+                            temperature=temperature,
+                            user=conversation_id
+                        )
+                    else:
+                        if mode.tools is not None:
+                            kwargs = {"tools": mode.tools}
+                        else:
+                            kwargs = {}
+                        result = await self.resilient.async_chat_completion(
+                            self._call_policy(priority, tokens),
+                            model=model,
+                            messages=sending_messages,
+                            max_tokens=max_tokens,
+                            top_p=top_p,
+                            temperature=temperature,
+                            user=conversation_id,
+                            **kwargs,
+                        )
+                        self._record_usage(result)
+                        content = self._reply_content(mode, result)
+            except error.OpenAIError as err:
+                # simple commands still work while OpenAI is unavailable, unless
+                # a streamed reply already executed some of its actions
+                if (
+                    self.entry.options.get(CONF_FAST_PATH, DEFAULT_FAST_PATH)
+                    and not dispatched
+                    and (result := await self._async_fast_path(user_input)) is not None
+                ):
+                    _LOGGER.warning("Handled %s locally: %s", user_input.text, err)
+                    return result
+
+                intent_response = intent.IntentResponse(language=user_input.language)
+                if isinstance(err, CircuitOpenError):
+                    message = f"Sorry, {err}"
+                else:
+                    message = f"Sorry, I had a problem talking to OpenAI: {err}"
+                intent_response.async_set_error(
+                    intent.IntentResponseErrorCode.UNKNOWN, message
+                )
+                return conversation.ConversationResult(
+                    response=intent_response, conversation_id=conversation_id
+                )
+
+        # only plans resolved without earlier turns are learned
+        learn = learn and not history
+
+        _LOGGER.debug("Response for %s: %s", model, content)
+
+        parsed = self._parse_reply(mode, content)
+
+        # call the needed services on the specific entities
+        actions = []
+        # the actions of the reply, including those executed while streaming
+        planned = []
+        for entry, action in parsed.entries:
+            streamed = entry in dispatched
+            if streamed:
+                dispatched.remove(entry)
+            if action is not None:
+                planned.append(action)
+                if not streamed:
+                    actions.append(action)
+
+        with self.metrics.time("services"):
+            failed.extend(await self._async_execute(actions))
+
+        if parsed.text is not None:
+            self.cache.set(cache_key, content, candidates)
+            # only plans that ran successfully are learned
+            if learn and not failed:
+                self.plans.async_record(user_input.text, planned, parsed.text)
+            reply = parsed.text
+        elif parsed.error is None:
+            _LOGGER.error('Error extracting assistant response %s', user_input.text)
             intent_response = intent.IntentResponse(language=user_input.language)
             intent_response.async_set_error(
                 intent.IntentResponseErrorCode.UNKNOWN,
-                f"Sorry, I had a problem talking to OpenAI: {err}",
+                "Sorry, there was an error understanding OpenAI: 'assistant'",
             )
             return conversation.ConversationResult(
                 response=intent_response, conversation_id=conversation_id
             )
+        else:
+            # a reply without JSON is spoken as it is
+            reply = content
+
+        # only the user text and the compact action list are kept,
+        # not the rendered prompt with the entity list
+        self.history.append(
+            conversation_id,
+            Turn(
+                user_input.text,
+                reply,
+                tuple(f"{action.service} {action.entity_id}" for action in planned),
+            ),
+        )
 
-        content = result["choices"][0]["message"]["content"]
+        intent_response = intent.IntentResponse(language=user_input.language)
+        intent_response.async_set_speech(reply)
+        return conversation.ConversationResult(
+            response=intent_response, conversation_id=conversation_id
+        )
 
-        # set a default reply
-        # this will be changed if a better reply is found
-        reply = content
+    def _record_usage(self, result: dict[str, Any]) -> None:
+        """Count the tokens used by a completion."""
+        if usage := result.get("usage"):
+            self.metrics.increment("prompt_tokens", usage["prompt_tokens"])
+            self.metrics.increment("completion_tokens", usage["completion_tokens"])
+
+    def _parse_reply(self, mode: Mode, content: str) -> ParsedReply:
+        """Parse the text and actions of a reply.
+
+        With tools the content is the JSON of the reply message, otherwise the
+        JSON object of the prompt. A malformed reply is returned with its error
+        instead of raising.
+        """
+        with self.metrics.time("parse"):
+            if mode.tools is not None:
+                try:
+                    message = json.loads(content)
+                except json.JSONDecodeError:
+                    message = None
+                if not isinstance(message, dict):
+                    return ParsedReply(content, error="The reply of OpenAI is not a message")
+                return ParsedReply(
+                    message.get("content") or mode.tools_reply,
+                    [
+                        (tool_action, self._validate_action(tool_action))
+                        for tool_action in parse_tool_calls(message, self.catalog.domains)
+                    ],
+                )
 
-        _LOGGER.debug("Response for %s: %s", model, content)
+            if (json_response := self._extract_json(content)) is None:
+                return ParsedReply(content, error="The reply of OpenAI is not valid JSON")
+            entities = json_response.get("entities") or []
+            if not isinstance(entities, list):
+                _LOGGER.warning("Ignoring entities that are not a list: %s", entities)
+                entities = []
+            text = json_response.get("assistant")
+            return ParsedReply(
+                None if text is None else str(text),
+                [(entity, self._parse_entity(entity)) for entity in entities],
+            )
 
-        json_response = None
+    def _extract_json(self, content: str) -> dict[str, Any] | None:
+        """Extract the JSON object from a reply."""
 
         # all responses should come back as a JSON, since we requested such in the prompt_template
         try:
             json_response = json.loads(content)
         except json.JSONDecodeError as err:
             _LOGGER.error('Error on first parsing of JSON message from OpenAI %s', err)
+        else:
+            if isinstance(json_response, dict):
+                return json_response
+            _LOGGER.error('The JSON message from OpenAI is not an object: %s', content)
 
         # if the response did not come back as a JSON
         # attempt to extract JSON from the response
@@ -307,85 +1007,220 @@ class OpenAIAgent(conversation.AbstractConversationAgent):
         start_idx = content.find('{')
         end_idx = content.rfind('}') + 1
 
-        if start_idx is not -1 and end_idx is not -1:
+        if start_idx != -1 and end_idx != 0:
             json_string = content[start_idx:end_idx]
             try:
                 json_response = json.loads(json_string)
             except json.JSONDecodeError as err:
                 _LOGGER.error('Error on second parsing of JSON message from OpenAI %s', err)
+            else:
+                self.metrics.increment("fallback_extractions")
+                return json_response
         else:
             _LOGGER.error('Error on second extraction of JSON message from OpenAI, %s', content)
 
-        # only operate on JSON actions if JSON was extracted
-        if json_response is not None:
+        self.metrics.increment("json_parse_failures")
+        return None
+
+    async def _async_stream_completion(
+        self,
+        dispatched: list[dict[str, Any]],
+        failed: list[str],
+        priority: int,
+        tokens: int,
+        **kwargs: Any,
+    ) -> str:
+        """Stream a completion and execute each entity as soon as it is complete.
+
+        The stream has the deadline, retries and circuit breaker of the call
+        policy, but isn't hedged.
+        """
+        parser = EntityStreamParser()
+        # the service calls run while the rest of the reply streams in
+        executions: list[asyncio.Task[list[str]]] = []
+
+        @callback
+        def async_on_content(delta: str) -> None:
+            for entity in parser.feed(delta):
+                if (action := self._parse_entity(entity)) is not None:
+                    executions.append(
+                        self.hass.async_create_task(self._async_execute([action]))
+                    )
+                dispatched.append(entity)
+
+        await self.resilient.async_stream_chat_completion(
+            self._call_policy(priority, tokens), async_on_content, **kwargs
+        )
 
-            # call the needed services on the specific entities
-            call_action = None
+        for result in await asyncio.gather(*executions):
+            failed.extend(result)
+        return parser.content
+
+    def _call_policy(
+        self, priority: int = PRIORITY_INTERACTIVE, tokens: int | None = None
+    ) -> CallPolicy:
+        """Return the retry, hedging and fallback policy of the options."""
+        options = self.entry.options
+        return CallPolicy(
+            options.get(CONF_DEADLINE, DEFAULT_DEADLINE),
+            int(options.get(CONF_MAX_RETRIES, DEFAULT_MAX_RETRIES)),
+            options.get(CONF_HEDGE, DEFAULT_HEDGE),
+            options.get(CONF_FALLBACK_MODEL, DEFAULT_FALLBACK_MODEL) or None,
+            priority,
+            tokens,
+        )
 
-            try:
-                for entity in json_response["entities"]:
-                    entity_id = entity['id']
-                    entity_action = entity['action']
-                    service_data = {'entity_id': entity_id}
-                    
-                    if "color" in self.entry.options.get(LANGUAGE_AND_MODE):
-                        status_object = self.hass.states.get(entity_id)  # Definieer status_object
-
-                        if 'brightness' in entity and entity['brightness']:
-                            try:
-                                service_data['brightness'] = int(entity['brightness'])
-                            except ValueError:
-                                _LOGGER.error("Invalid brightness value for entity: %s. Expected integer or convertible string, got: %s.", entity_id, entity['brightness'])
-                        if 'hs_color' in entity and entity['hs_color']:
-                            try:
-                                hs_values = [float(value) for value in entity['hs_color'].split(',')]
-                                if len(hs_values) == 2:
-                                    service_data['hs_color'] = hs_values
-                                else:
-                                    _LOGGER.error("Invalid hs_color value for entity: %s. Expected two convertible strings or numbers separated by a comma, got: %s.", entity_id, entity['hs_color'])
-                            except ValueError:
-                                _LOGGER.error("Invalid hs_color value for entity: %s. Expected two convertible strings or numbers, got: %s.", entity_id, entity['hs_color'])
-
-                    if entity_id.startswith("switch."):
-                        call_action = "switch"
-                    elif entity_id.startswith("light."):
-                        call_action = "light"
-                    
-                    await self.hass.services.async_call(call_action, entity_action, service_data)
-                    _LOGGER.info("Executed %s action with data %s on entity: %s", entity_action, service_data, entity_id)
-
-            except KeyError as err:
-                _LOGGER.warn('Error processing entity: %s. Missing key: %s', entity_id, err)
-
-            # resond with the "assistant" field of the json_response
+    @staticmethod
+    def _priority(user_input: conversation.ConversationInput) -> int:
+        """Return the scheduling priority of a sentence.
+
+        Sentences of an automation or script have a parent context and no
+        user, those of a person waiting for the answer are interactive.
+        """
+        context = user_input.context
+        if context.user_id is None and context.parent_id is not None:
+            return PRIORITY_BACKGROUND
+        return PRIORITY_INTERACTIVE
+
+    async def _async_execute(self, actions: list[Action]) -> list[str]:
+        """Execute actions, skipping those that wouldn't change anything.
+
+        Returns the ids of the entities whose call failed.
+        """
+        if self.entry.options.get(CONF_OPTIMIZE_ACTIONS, DEFAULT_OPTIMIZE_ACTIONS):
+            optimized = optimize_actions(self.hass, actions)
+            self.metrics.increment("skipped_actions", len(actions) - len(optimized))
+            actions = optimized
+        return await async_execute_actions(self.hass, actions)
+
+    def _parse_entity(self, entity: dict[str, Any]) -> Action | None:
+        """Convert an entity of the reply to an action on an exposed entity."""
+        # the compact entity format refers to entities by a numeric handle
+        if isinstance(entity, dict) and "id" in entity:
+            entity = {**entity, "id": self.catalog.async_resolve(entity["id"])}
 
-            try:
-                reply = json_response['assistant']
-            except KeyError as err:
-                _LOGGER.error('Error extracting assistant response %s', user_input.text)
-                intent_response = intent.IntentResponse(language=user_input.language)
-                intent_response.async_set_error(
-                    intent.IntentResponseErrorCode.UNKNOWN,
-                    f"Sorry, there was an error understanding OpenAI: {err}",
-                )
-                return conversation.ConversationResult(
-                    response=intent_response, conversation_id=conversation_id
-                )
+        try:
+            action = self.mode.parse_entity(entity)
+        except KeyError as err:
+            _LOGGER.warn('Error processing entity: %s. Missing key: %s', entity, err)
+            return None
+        except TypeError as err:
+            _LOGGER.warning('Error processing entity: %s. %s', entity, err)
+            return None
+
+        if (action := self._validate_action(action)) is not None:
+            # service data like the position of a cover
+            action.data.update(
+                self.catalog.domains.parse_fields(action.domain, action.service, entity)
+            )
+        return action
+
+    def _validate_action(self, action: Action) -> Action | None:
+        """Return the action on the exposed entity it refers to, or None."""
+        # tool calls may still refer to entities by their compact handle
+        entity_id = self.catalog.async_resolve(action.entity_id)
+        domain = entity_id.split(".", 1)[0]
+        if (entity_id, domain) != (action.entity_id, action.domain):
+            # brightness and color only apply to lights, service data of a
+            # tool only to the domain of the tool
+            data = action.data if domain in ("light", action.domain) else {}
+            action = Action(entity_id, domain, action.service, data)
+
+        if action.entity_id not in self.catalog.entities:
+            _LOGGER.warning("Ignoring action on unknown or unexposed entity: %s", action.entity_id)
+            return None
+
+        if action.service not in self.catalog.entities[action.entity_id].services:
+            _LOGGER.warning(
+                "Ignoring unsupported action %s on %s", action.service, action.entity_id
+            )
+            return None
+
+        return action
 
-        messages.append(reply)
-        self.history[conversation_id] = messages
+    async def _async_run_plan(
+        self, user_input: conversation.ConversationInput, plan: Plan
+    ) -> conversation.ConversationResult:
+        """Execute a learned plan and respond with its reply."""
+        self.metrics.increment("plan_hits")
+        with self.metrics.time("services"):
+            await self._async_execute(list(plan.actions))
+
+        # a follow-up in the same conversation can refer to the actions
+        if user_input.conversation_id in self.history:
+            conversation_id = user_input.conversation_id
+        else:
+            conversation_id = ulid.ulid()
+        self.history.append(
+            conversation_id,
+            Turn(
+                user_input.text,
+                plan.reply,
+                tuple(f"{action.service} {action.entity_id}" for action in plan.actions),
+            ),
+        )
 
         intent_response = intent.IntentResponse(language=user_input.language)
-        intent_response.async_set_speech(reply)
+        intent_response.async_set_speech(plan.reply)
         return conversation.ConversationResult(
             response=intent_response, conversation_id=conversation_id
         )
 
-    def _async_generate_prompt(self, raw_prompt: str) -> str:
-        """Generate a prompt for the user."""
-        return template.Template(raw_prompt, self.hass).async_render(
+    async def _async_fast_path(
+        self, user_input: conversation.ConversationInput
+    ) -> conversation.ConversationResult | None:
+        """Handle a simple command without calling OpenAI."""
+        if (fast_path := self._fast_path_actions(user_input.text)) is None:
+            return None
+
+        actions, reply = fast_path
+        await self._async_execute(actions)
+
+        intent_response = intent.IntentResponse(language=user_input.language)
+        intent_response.async_set_speech(reply)
+        return conversation.ConversationResult(
+            response=intent_response,
+            conversation_id=user_input.conversation_id or ulid.ulid(),
+        )
+
+    def _fast_path_actions(self, text: str) -> tuple[list[Action], str] | None:
+        """Return the actions and reply of a simple command, if it is one."""
+        if self.mode.language is None:
+            return None
+
+        if (match := self.fast_path.match(text, self.mode.language)) is None:
+            return None
+
+        actions = []
+        for entity_id in match.entity_ids:
+            domain = entity_id.split(".", 1)[0]
+            data = match.service_data if domain == "light" else {}
+            actions.append(Action(entity_id, domain, match.service, data))
+        return actions, match.reply
+
+    def _async_generate_prompt(self) -> str:
+        """Generate a prompt for the user.
+
+        The rendered prompt is reused until the options or the location name
+        change, unless it depends on entity states or the time. Such a prompt
+        rendered by async_prepare is used once by the next utterance.
+        """
+        if self._prompt is not None:
+            return self._prompt
+
+        if self._prepared_prompt is not None:
+            prepared_at, prompt = self._prepared_prompt
+            self._prepared_prompt = None
+            if time.monotonic() - prepared_at < PREPARE_TTL:
+                return prompt
+
+        info = self._prompt_template.async_render_to_info(
             {
                 "ha_name": self.hass.config.location_name,
             },
             parse_result=False,
-        )
\ No newline at end of file
+        )
+        prompt = info.result()
+        if not (info.entities or info.domains or info.all_states or info.has_time):
+            self._prompt = prompt
+        return prompt
\ No newline at end of file
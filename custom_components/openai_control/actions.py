@@ -0,0 +1,237 @@
+"""Parsing and execution of the actions returned by OpenAI."""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+import logging
+import math
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, State
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import ACTION_TIMEOUT
+from .domains import DOMAIN_SPECS, TOGGLE_SERVICES
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Action:
+    """A single service call on a single entity."""
+
+    entity_id: str
+    domain: str
+    service: str
+    data: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ParsedReply:
+    """The text and actions of a reply of OpenAI."""
+
+    # the text to respond with, None when the reply has none
+    text: str | None
+    # each entry of the "entities" array or tool call with its action, the
+    # action is None when the entry is invalid or not allowed
+    entries: list[tuple[Any, Action | None]] = field(default_factory=list)
+    # why the reply couldn't be parsed
+    error: str | None = None
+
+    @property
+    def actions(self) -> list[Action]:
+        """Return the actions of the valid entries."""
+        return [action for _, action in self.entries if action is not None]
+
+
+def _parse_hs_color(value: Any) -> list[float] | None:
+    """Parse an HS color given as a list or a comma separated string."""
+    if isinstance(value, str):
+        value = value.split(',')
+    try:
+        hs_values = [float(item) for item in value]
+    except (TypeError, ValueError):
+        return None
+    return hs_values if len(hs_values) == 2 else None
+
+
+def parse_entity(entity: dict[str, Any], color: bool) -> Action:
+    """Convert an entry of the "entities" array to an action.
+
+    Raises KeyError when the id or action is missing and TypeError when the
+    entry is not an object or its id or action is not a string.
+    """
+    if not isinstance(entity, dict):
+        raise TypeError(f"expected an object, got {type(entity).__name__}")
+    entity_id = entity['id']
+    entity_action = entity['action']
+    if not isinstance(entity_id, str) or not isinstance(entity_action, str):
+        raise TypeError("the id and action must be strings")
+    data: dict[str, Any] = {}
+
+    if color:
+        if 'brightness' in entity and entity['brightness']:
+            try:
+                data['brightness'] = int(entity['brightness'])
+            except (TypeError, ValueError):
+                _LOGGER.error("Invalid brightness value for entity: %s. Expected integer or convertible string, got: %s.", entity_id, entity['brightness'])
+        if 'hs_color' in entity and entity['hs_color']:
+            if (hs_values := _parse_hs_color(entity['hs_color'])) is not None:
+                data['hs_color'] = hs_values
+            else:
+                _LOGGER.error("Invalid hs_color value for entity: %s. Expected two numbers, as a list or separated by a comma, got: %s.", entity_id, entity['hs_color'])
+
+    return Action(entity_id, entity_id.split(".", 1)[0], entity_action, data)
+
+
+def merge_actions(actions: list[Action]) -> list[Action]:
+    """Drop duplicate and superseded actions.
+
+    Of the actions that call the same service on the same entity only the
+    last one is kept, turning an entity on, off or toggling it count as the
+    same service. The remaining actions keep the order of their last call.
+    """
+    merged: dict[tuple[str, str], Action] = {}
+    for action in actions:
+        service = "power" if action.service in TOGGLE_SERVICES else action.service
+        key = (action.entity_id, service)
+        merged.pop(key, None)
+        merged[key] = action
+    return list(merged.values())
+
+
+def _same_value(value: Any, current: Any) -> bool:
+    """Return True if a service data value equals the current value.
+
+    Integers like the brightness are compared exactly, other numbers within
+    1% because Home Assistant converts colors and rounds values.
+    """
+    if isinstance(value, (list, tuple)) and isinstance(current, (list, tuple)):
+        return len(value) == len(current) and all(
+            _same_value(item, current_item) for item, current_item in zip(value, current)
+        )
+    if isinstance(value, bool) or isinstance(current, bool):
+        return value == current
+    if isinstance(value, int) and isinstance(current, int):
+        return value == current
+    if isinstance(value, (int, float)) and isinstance(current, (int, float)):
+        return math.isclose(value, current, rel_tol=0.01, abs_tol=0.01)
+    return value == current
+
+
+def _optimize_action(action: Action, state: State) -> Action | None:
+    """Return the part of an action that changes the entity, None for a no-op."""
+    spec = DOMAIN_SPECS.get(action.domain)
+    if spec is None:
+        return action
+
+    # a group reports "on" as soon as one member is on, and averages the
+    # attributes of its members, so its state says nothing about the others
+    if "entity_id" in state.attributes:
+        return action
+
+    service = action.service
+    # a toggle of a group depends on which of its members are on
+    if service == "toggle" and state.state in ("on", "off"):
+        service = "turn_off" if state.state == "on" else "turn_on"
+        if service not in spec.services:
+            return action
+
+    target = spec.states.get(service)
+    if target is not None and target != state.state:
+        # brightness and color of a toggle only apply when it turns a light on
+        data = {} if service == "turn_off" else action.data
+        return Action(action.entity_id, action.domain, service, data)
+
+    data = {}
+    for name, value in action.data.items():
+        if (attribute := spec.current.get(name)) is None:
+            data[name] = value
+            continue
+        current = state.state if attribute == "state" else state.attributes.get(attribute)
+        if not _same_value(value, current):
+            data[name] = value
+
+    # services without a target state only change their data
+    if (target is not None or action.data) and not data:
+        return None
+    return Action(action.entity_id, action.domain, service, data)
+
+
+def optimize_actions(hass: HomeAssistant, actions: list[Action]) -> list[Action]:
+    """Drop the actions that wouldn't change anything.
+
+    Duplicate actions are merged, toggles become an explicit turn_on or
+    turn_off, and calls that would leave an entity in its current state are
+    dropped, as is service data equal to the current attributes.
+    """
+    optimized = []
+    for action in merge_actions(actions):
+        if (state := hass.states.get(action.entity_id)) is None:
+            optimized.append(action)
+        elif (optimized_action := _optimize_action(action, state)) is None:
+            _LOGGER.debug(
+                "Skipping %s on %s, it is already %s",
+                action.service,
+                action.entity_id,
+                state.state,
+            )
+        else:
+            optimized.append(optimized_action)
+    return optimized
+
+
+def _group_key(action: Action) -> tuple[str, str, str]:
+    """Return the key of the service call group an action belongs to."""
+    return (action.domain, action.service, repr(sorted(action.data.items())))
+
+
+async def _async_call(hass: HomeAssistant, group: list[Action]) -> bool:
+    """Call the service of a group of actions and return True if it succeeded."""
+    action = group[0]
+    entity_ids = [action.entity_id for action in group]
+    service_data = {**action.data, 'entity_id': entity_ids}
+    try:
+        await hass.services.async_call(
+            action.domain, action.service, service_data, blocking=True
+        )
+    except (HomeAssistantError, vol.Invalid) as err:
+        _LOGGER.error("Error executing %s action with data %s on entities: %s: %s", action.service, action.data, entity_ids, err)
+        return False
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception("Unexpected error executing %s action with data %s on entities: %s", action.service, action.data, entity_ids)
+        return False
+    _LOGGER.info("Executed %s action with data %s on entities: %s", action.service, action.data, entity_ids)
+    return True
+
+
+async def async_execute_actions(hass: HomeAssistant, actions: list[Action]) -> list[str]:
+    """Execute actions with one service call per group of identical calls.
+
+    Actions are grouped by domain, service and service data and the groups are
+    called concurrently, waiting up to ACTION_TIMEOUT seconds for them to
+    finish. Returns the ids of the entities whose call failed or didn't finish
+    in time, calls that are still running are left to finish.
+    """
+    groups: dict[tuple[str, str, str], list[Action]] = {}
+    for action in actions:
+        groups.setdefault(_group_key(action), []).append(action)
+    if not groups:
+        return []
+
+    tasks = {
+        hass.async_create_task(_async_call(hass, group)): group
+        for group in groups.values()
+    }
+    _, pending = await asyncio.wait(tasks, timeout=ACTION_TIMEOUT)
+
+    failed: list[str] = []
+    for task, group in tasks.items():
+        if task in pending:
+            _LOGGER.warning("The %s action on entities %s did not finish within %s seconds", group[0].service, [action.entity_id for action in group], ACTION_TIMEOUT)
+        elif task.result():
+            continue
+        failed.extend(action.entity_id for action in group)
+    return failed
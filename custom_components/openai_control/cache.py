@@ -0,0 +1,102 @@
+"""Response cache for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import re
+import time
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize an utterance so repeats of the same phrase share a key."""
+    return _WHITESPACE_RE.sub(" ", text.lower()).strip(" .!?")
+
+
+@dataclass
+class CachedResponse:
+    """A cached OpenAI reply and the entities it depends on."""
+
+    content: str
+    entity_ids: frozenset[str] | None
+    expires: float
+
+
+class ResponseCache:
+    """LRU cache with a time to live for OpenAI replies.
+
+    Keys include a hash of the entity block that was sent, so a reply is only
+    replayed for the same entity states. Entries are dropped as soon as one of
+    the entities they depend on is added, removed, renamed or moved.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """Initialize the cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[Any, ...], CachedResponse] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of cached replies."""
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the share of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: tuple[Any, ...]) -> str | None:
+        """Return the cached reply for a key."""
+        if self.max_size <= 0:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires < time.monotonic():
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        _LOGGER.debug("Cache hit (hit rate: %.2f)", self.hit_rate)
+        return entry.content
+
+    def set(
+        self, key: tuple[Any, ...], content: str, entity_ids: set[str] | None
+    ) -> None:
+        """Cache a reply, entity_ids None means it depends on all entities."""
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = CachedResponse(
+            content,
+            frozenset(entity_ids) if entity_ids is not None else None,
+            time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, entity_id: str) -> None:
+        """Drop every reply that depends on an entity."""
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if entry.entity_ids is None or entity_id in entry.entity_ids
+        ]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop all replies."""
+        self._entries.clear()
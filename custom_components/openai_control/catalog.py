@@ -0,0 +1,520 @@
+"""Entity catalog for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import logging
+from string import Template
+from typing import Any
+
+from homeassistant.const import ATTR_SUPPORTED_FEATURES, EVENT_STATE_CHANGED
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, State, callback
+from homeassistant.helpers import area_registry, device_registry, entity_registry
+from homeassistant.util import slugify
+
+from .const import (
+    COLOR_ENTITY_TEMPLATE,
+    ENTITY_TEMPLATE,
+    LANGUAGE_AND_MODE_OPTIONS,
+    TEST_ENTITY_TEMPLATE,
+)
+from .domains import DomainRegistry
+from .retrieval import EntityIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+# keys of the compact encoding in the pre-rendered lines of an entity
+COMPACT = "compact"
+COMPACT_COLOR = "compact_color"
+
+# keys of the prefix cache layout, entity lines without their state and state lines
+STATIC = "static"
+STATIC_COMPACT = "static_compact"
+STATES = "states"
+STATES_COLOR = "states_color"
+STATES_COMPACT = "states_compact"
+STATES_COMPACT_COLOR = "states_compact_color"
+
+# templates without brightness and color for the entities a command is not about
+PLAIN_TEMPLATES = {
+    COLOR_ENTITY_TEMPLATE: ENTITY_TEMPLATE,
+    COMPACT_COLOR: COMPACT,
+    STATES_COLOR: STATES,
+    STATES_COMPACT_COLOR: STATES_COMPACT,
+}
+
+
+def entity_template_for_mode(mode: str | None, compact: bool = False) -> str:
+    """Return the entity template used by a language and mode option.
+
+    For the compact encoding the COMPACT or COMPACT_COLOR key is returned.
+    """
+    if mode == "Test":
+        return TEST_ENTITY_TEMPLATE
+    if mode and "color" in mode:
+        return COMPACT_COLOR if compact else COLOR_ENTITY_TEMPLATE
+    return COMPACT if compact else ENTITY_TEMPLATE
+
+
+def _is_exposed(entry: entity_registry.RegistryEntry | None) -> bool:
+    """Return True if the registry entry is exposed to the Conversation Assistant."""
+    # registry entries have the property "options['conversation']['should_expose']"
+    if entry is None:
+        return False
+    return entry.options.get("conversation", {}).get("should_expose") is True
+
+
+class CatalogEntity:
+    """A single exposed entity and its pre-rendered prompt lines."""
+
+    __slots__ = (
+        "entity_id",
+        "handle",
+        "domain",
+        "name",
+        "aliases",
+        "area",
+        "state",
+        "brightness",
+        "hs_color",
+        "services",
+        "lines",
+    )
+
+    def __init__(self, entity_id: str, handle: int) -> None:
+        """Initialize the entity."""
+        self.entity_id = entity_id
+        self.handle = handle
+        self.domain = entity_id.split(".", 1)[0]
+        self.name: str | None = None
+        self.aliases: list[str] = []
+        self.area: str | None = None
+        self.state = "unknown"
+        self.brightness: int | None = None
+        self.hs_color: tuple[float, float] | None = None
+        self.services: tuple[str, ...] = ()
+        self.lines: dict[str, str] = {}
+
+    def update(
+        self,
+        state: State | None,
+        templates: dict[str, Template],
+        domains: DomainRegistry,
+    ) -> None:
+        """Refresh the state fields and re-render the prompt lines."""
+        status = self.state
+        supported_features = 0
+        if state is not None:
+            self.state = status = state.state or "unknown"
+            self.brightness = state.attributes.get("brightness")
+            self.hs_color = state.attributes.get("hs_color")
+            supported_features = state.attributes.get(ATTR_SUPPORTED_FEATURES) or 0
+            # attributes like the position of a cover are part of the state
+            for attribute in domains.attributes(self.domain):
+                if (value := state.attributes.get(attribute)) is not None:
+                    status += f" {attribute}={value}"
+        self.services = domains.entity_services(self.domain, supported_features)
+
+        fields: dict[str, Any] = {
+            "id": self.entity_id,
+            "status": status,
+            "action": ",".join(self.services),
+            "brightness": self.brightness if self.brightness is not None else "",
+            "hs_color": ",".join(map(str, self.hs_color))
+            if self.hs_color is not None
+            else "",
+        }
+        self.lines = {
+            raw: template.substitute(**fields) for raw, template in templates.items()
+        }
+
+        # the compact encoding uses the handle and drops the domain, the area of
+        # its group header and empty fields, the color is rounded and an off
+        # light has no brightness or color
+        compact = [str(self.handle), self._compact_name(), status]
+        self.lines[COMPACT] = "<>".join(compact) + "\n"
+        if self.state != "off":
+            compact += [
+                str(fields["brightness"]),
+                ",".join(str(round(value)) for value in self.hs_color)
+                if self.hs_color is not None
+                else "",
+            ]
+        while not compact[-1]:
+            compact.pop()
+        self.lines[COMPACT_COLOR] = "<>".join(compact) + "\n"
+
+        # the prefix cache layout lists the state apart from the entity
+        self.lines[STATIC] = f"{self.entity_id}<>{fields['action']}\n"
+        self.lines[STATIC_COMPACT] = "<>".join(compact[:2]) + "\n"
+        self.lines[STATES] = f"{self.entity_id}<>{status}\n"
+        self.lines[STATES_COLOR] = "<>".join(
+            [self.entity_id, status, str(fields["brightness"]), fields["hs_color"]]
+        ) + "\n"
+        self.lines[STATES_COMPACT] = f"{self.handle}<>{status}\n"
+        self.lines[STATES_COMPACT_COLOR] = "<>".join([compact[0], *compact[2:]]) + "\n"
+
+
+    def _compact_name(self) -> str:
+        """Return the object id without the area the entity is grouped under."""
+        object_id = self.entity_id.split(".", 1)[-1]
+        if self.area:
+            prefix = f"{slugify(self.area)}_"
+            if object_id.startswith(prefix) and len(object_id) > len(prefix):
+                return object_id[len(prefix) :]
+        return object_id
+
+
+class EntityCatalog:
+    """Incrementally maintained list of entities exposed to the agent.
+
+    The catalog is built once and then kept up to date from state and
+    entity registry events, so rendering the entity block for a prompt is a
+    single cached join instead of a walk over every light and switch.
+    """
+
+    def __init__(self, hass: HomeAssistant, domains: DomainRegistry) -> None:
+        """Initialize the catalog."""
+        self.hass = hass
+        self.domains = domains
+        self.entities: dict[str, CatalogEntity] = {}
+        self.handles: dict[str, str] = {}
+        self._next_handle = 1
+        self._templates = {
+            raw: Template(raw)
+            for raw in {
+                entity_template_for_mode(mode) for mode in LANGUAGE_AND_MODE_OPTIONS
+            }
+        }
+        self.index = EntityIndex()
+        self._rendered: dict[str, str] = {}
+        # entity blocks without states, kept when only states change
+        self._static: dict[str, str] = {}
+        self._unsub: list[CALLBACK_TYPE] = []
+        self._listeners: list[Callable[[str], None]] = []
+
+    @callback
+    def async_start(self) -> None:
+        """Build the catalog and start listening for changes."""
+        registry = entity_registry.async_get(self.hass)
+        self.entities = {}
+        self.handles = {}
+        self._next_handle = 1
+        self.index = EntityIndex()
+        for entity_id in self.hass.states.async_entity_ids(self.domains.domains):
+            if not _is_exposed(registry.entities.get(entity_id)):
+                continue
+            self._async_add(entity_id)
+        self._rendered = {}
+        self._static = {}
+
+        self._unsub = [
+            self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._async_state_changed),
+            self.hass.bus.async_listen(
+                entity_registry.EVENT_ENTITY_REGISTRY_UPDATED,
+                self._async_registry_updated,
+            ),
+            self.hass.bus.async_listen(
+                area_registry.EVENT_AREA_REGISTRY_UPDATED, self._async_areas_updated
+            ),
+            self.hass.bus.async_listen(
+                device_registry.EVENT_DEVICE_REGISTRY_UPDATED,
+                self._async_device_updated,
+            ),
+        ]
+        _LOGGER.debug("Entity catalog built with %s entities", len(self.entities))
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop listening for changes."""
+        while self._unsub:
+            self._unsub.pop()()
+
+    @callback
+    def async_refresh(self) -> None:
+        """Rebuild the catalog after the controlled domains or services changed."""
+        self.async_stop()
+        self.async_start()
+
+    @callback
+    def async_add_listener(self, listener: Callable[[str], None]) -> CALLBACK_TYPE:
+        """Call listener with the entity id when an entity is added, removed or renamed.
+
+        State changes are not reported, they are reflected in the rendered lines.
+        Removals from the entity registry are reported even without a state.
+        """
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def is_exposed(self, entity_id: str) -> bool:
+        """Return True if an entity is exposed, whether or not it has a state."""
+        return _is_exposed(entity_registry.async_get(self.hass).entities.get(entity_id))
+
+    @callback
+    def async_render(
+        self,
+        mode: str | None,
+        entity_ids: set[str] | None = None,
+        compact: bool = False,
+        detailed: set[str] | None = None,
+    ) -> str:
+        """Return the entity block for a language and mode option.
+
+        When entity_ids is given only those entities are rendered, in catalog
+        order; the full block is cached until an entity changes. When detailed
+        is given, brightness and color are left out for the other entities.
+        """
+        raw = entity_template_for_mode(mode, compact)
+        if detailed is not None and not detailed:
+            # no entity keeps its details, the plain block can be cached
+            raw, detailed = PLAIN_TEMPLATES.get(raw, raw), None
+        if entity_ids is not None or detailed is not None:
+            return self._render(
+                raw,
+                [
+                    entity
+                    for entity_id, entity in self.entities.items()
+                    if entity_ids is None or entity_id in entity_ids
+                ],
+                detailed,
+            )
+        if (rendered := self._rendered.get(raw)) is None:
+            rendered = self._rendered[raw] = self._render(
+                raw, list(self.entities.values())
+            )
+        return rendered
+
+    @callback
+    def async_render_split(
+        self,
+        mode: str | None,
+        entity_ids: set[str] | None = None,
+        compact: bool = False,
+        detailed: set[str] | None = None,
+        listed: set[str] | None = None,
+    ) -> tuple[str, str]:
+        """Return the entity block without states and the states, sorted by entity id.
+
+        The entity block holds the listed entities, or all of them, and is
+        cached until an entity is added, removed, renamed or its actions
+        change. The states are rendered for entity_ids, or all entities, and
+        leave out brightness and color for the entities not in detailed.
+        """
+        static = STATIC_COMPACT if compact else STATIC
+        if listed is not None:
+            entities = self._render(
+                static, [self.entities[entity_id] for entity_id in sorted(listed)]
+            )
+        elif (entities := self._static.get(static)) is None:
+            entities = self._static[static] = self._render(
+                static,
+                [self.entities[entity_id] for entity_id in sorted(self.entities)],
+            )
+
+        # the test mode lists brightness and color like the color modes
+        color = mode is not None and ("color" in mode or mode == "Test")
+        if compact:
+            raw = STATES_COMPACT_COLOR if color else STATES_COMPACT
+        else:
+            raw = STATES_COLOR if color else STATES
+        if detailed is not None and not detailed:
+            raw, detailed = PLAIN_TEMPLATES.get(raw, raw), None
+        plain = PLAIN_TEMPLATES.get(raw, raw) if detailed is not None else raw
+        states = "".join(
+            self.entities[entity_id].lines[
+                raw if plain == raw or entity_id in detailed else plain
+            ]
+            for entity_id in sorted(self.entities if entity_ids is None else entity_ids)
+            if entity_id in self.entities
+        )
+        return entities, states
+
+    @callback
+    def async_resolve(self, entity_id: Any) -> Any:
+        """Map a numeric handle of the compact encoding back to its entity id."""
+        return self.handles.get(str(entity_id), entity_id)
+
+    def _render(
+        self,
+        raw: str,
+        entities: list[CatalogEntity],
+        detailed: set[str] | None = None,
+    ) -> str:
+        """Join the lines of the entities, grouped by domain and area if compact."""
+        plain = PLAIN_TEMPLATES.get(raw, raw) if detailed is not None else raw
+
+        def line(entity: CatalogEntity) -> str:
+            if plain == raw or entity.entity_id in detailed:
+                return entity.lines[raw]
+            return entity.lines[plain]
+
+        if raw not in (COMPACT, COMPACT_COLOR, STATIC_COMPACT):
+            return "".join(line(entity) for entity in entities)
+
+        groups: dict[tuple[str, str], list[str]] = {}
+        for entity in entities:
+            groups.setdefault((entity.domain, entity.area or ""), []).append(
+                line(entity)
+            )
+
+        # entities list the actions of their domain once instead of on every line
+        actions = "; ".join(
+            f"{domain}={','.join(self.domains.services(domain))}"
+            for domain in sorted({domain for domain, _ in groups})
+        )
+        rendered = [f"\nActions: {actions}\n"]
+        for (domain, area), lines in sorted(groups.items()):
+            rendered.append(f"{domain} {area}:\n" if area else f"{domain}:\n")
+            rendered.extend(lines)
+        return "".join(rendered)
+
+    @callback
+    def _async_add(self, entity_id: str) -> None:
+        """Add or refresh an entity from its current state."""
+        entity = self.entities.get(entity_id)
+        if entity is None:
+            entity = self.entities[entity_id] = CatalogEntity(
+                entity_id, self._next_handle
+            )
+            self.handles[str(self._next_handle)] = entity_id
+            self._next_handle += 1
+            self._async_update_metadata(entity)
+        state = self.hass.states.get(entity_id)
+        if state is not None and state.name != entity.name:
+            self._async_update_metadata(entity)
+        static = (entity.lines.get(STATIC), entity.lines.get(STATIC_COMPACT))
+        entity.update(state, self._templates, self.domains)
+        self._rendered = {}
+        if static != (entity.lines[STATIC], entity.lines[STATIC_COMPACT]):
+            self._static = {}
+
+    @callback
+    def _async_update_metadata(self, entity: CatalogEntity) -> None:
+        """Refresh the name, aliases and area of an entity and re-index it."""
+        registry_entry = entity_registry.async_get(self.hass).entities.get(
+            entity.entity_id
+        )
+        state = self.hass.states.get(entity.entity_id)
+
+        entity.name = state.name if state is not None else None
+        entity.aliases = sorted(registry_entry.aliases) if registry_entry else []
+        previous_area = entity.area
+        entity.area = None
+
+        area_id = registry_entry.area_id if registry_entry else None
+        if area_id is None and registry_entry and registry_entry.device_id:
+            device = device_registry.async_get(self.hass).async_get(
+                registry_entry.device_id
+            )
+            area_id = device.area_id if device else None
+        if area_id is not None:
+            area = area_registry.async_get(self.hass).async_get_area(area_id)
+            entity.area = area.name if area else None
+
+        # the compact lines leave out the area the entity is grouped under
+        if entity.lines and entity.area != previous_area:
+            entity.update(state, self._templates, self.domains)
+
+        self.index.add(
+            entity.entity_id,
+            [text for text in (entity.name, *entity.aliases) if text],
+            entity.area,
+        )
+        self._async_changed(entity.entity_id)
+
+    @callback
+    def _async_remove(self, entity_id: str, unregistered: bool = False) -> None:
+        """Remove an entity from the catalog.
+
+        Listeners are notified when the entity was in the catalog, and with
+        unregistered also when it left the registry or was unexposed while it
+        had no state.
+        """
+        if (entity := self.entities.pop(entity_id, None)) is not None:
+            self.handles.pop(str(entity.handle), None)
+            self.index.remove(entity_id)
+            self._async_changed(entity_id)
+        elif unregistered:
+            for listener in self._listeners:
+                listener(entity_id)
+
+    @callback
+    def _async_changed(self, entity_id: str) -> None:
+        """Drop the rendered blocks and notify listeners of a changed entity."""
+        self._rendered = {}
+        self._static = {}
+        for listener in self._listeners:
+            listener(entity_id)
+
+    @callback
+    def _async_state_changed(self, event: Event) -> None:
+        """Update an entity when its state changes."""
+        entity_id: str = event.data["entity_id"]
+        if entity_id.split(".", 1)[0] not in self.domains.domains:
+            return
+
+        new_state: State | None = event.data.get("new_state")
+        if new_state is None:
+            self._async_remove(entity_id)
+            return
+
+        if entity_id in self.entities:
+            self._async_add(entity_id)
+            return
+
+        # a new state for an entity we have not seen yet
+        registry = entity_registry.async_get(self.hass)
+        if _is_exposed(registry.entities.get(entity_id)):
+            self._async_add(entity_id)
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        """Update the catalog when an entity is added, removed or (un)exposed."""
+        entity_id: str = event.data["entity_id"]
+        if old_entity_id := event.data.get("old_entity_id"):
+            self._async_remove(old_entity_id, True)
+
+        if entity_id.split(".", 1)[0] not in self.domains.domains:
+            return
+
+        if event.data["action"] == "remove":
+            self._async_remove(entity_id, True)
+            return
+
+        registry = entity_registry.async_get(self.hass)
+        if _is_exposed(registry.entities.get(entity_id)) and self.hass.states.get(
+            entity_id
+        ):
+            if entity := self.entities.get(entity_id):
+                self._async_update_metadata(entity)
+            self._async_add(entity_id)
+        else:
+            self._async_remove(entity_id, True)
+
+    @callback
+    def _async_areas_updated(self, event: Event) -> None:
+        """Re-index all entities when areas change."""
+        for entity in self.entities.values():
+            self._async_update_metadata(entity)
+
+    @callback
+    def _async_device_updated(self, event: Event) -> None:
+        """Re-index the entities of a device when it moved to another area.
+
+        Devices are updated for every firmware or connection change, those
+        don't change what the entities are called.
+        """
+        if event.data["action"] != "update" or "area_id" not in event.data.get(
+            "changes", {}
+        ):
+            return
+
+        for registry_entry in entity_registry.async_entries_for_device(
+            entity_registry.async_get(self.hass), event.data["device_id"]
+        ):
+            if (entity := self.entities.get(registry_entry.entity_id)) is not None:
+                self._async_update_metadata(entity)
@@ -0,0 +1,94 @@
+"""OpenAI client for the OpenAI Control integration."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+import logging
+from typing import Any
+
+import aiohttp
+import async_timeout
+import openai
+from openai import error
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class OpenAIClient:
+    """OpenAI client owned by a single config entry.
+
+    Requests go through Home Assistant's shared aiohttp session, so
+    connections are pooled and kept alive between utterances, and the API key
+    is passed per request instead of through the global openai module state.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api_key: str,
+        connect_timeout: float,
+        request_timeout: float,
+        api_base: str | None = None,
+    ) -> None:
+        """Initialize the client."""
+        self.hass = hass
+        self.api_key = api_key
+        self.api_base = api_base
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self._session = async_get_clientsession(hass)
+
+    async def async_chat_completion(self, **kwargs: Any) -> Any:
+        """Create a chat completion.
+
+        With stream=True an async iterator of completion chunks is returned.
+        """
+        token = openai.aiosession.set(self._session)
+        try:
+            return await openai.ChatCompletion.acreate(
+                api_key=self.api_key,
+                api_base=self.api_base,
+                request_timeout=(self.connect_timeout, self.request_timeout),
+                **kwargs,
+            )
+        finally:
+            openai.aiosession.reset(token)
+
+    async def async_stream_chat_completion(
+        self, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """Create a streamed chat completion and iterate over its chunks."""
+        async for chunk in await self.async_chat_completion(stream=True, **kwargs):
+            yield chunk
+
+    async def async_warm_up(self) -> None:
+        """Open a connection to the API ahead of the next request.
+
+        The connection is kept alive in the pool of the shared session, so the
+        next completion skips the DNS lookup and TLS handshake. Errors are
+        ignored, the completion will simply open its own connection.
+        """
+        url = self.api_base or openai.api_base
+        try:
+            async with async_timeout.timeout(self.connect_timeout):
+                async with self._session.head(url) as response:
+                    _LOGGER.debug("Warmed up %s: %s", url, response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("Unable to warm up %s: %s", url, err)
+
+    async def async_list_models(self) -> list[str]:
+        """Return the ids of the models available to the API key."""
+        token = openai.aiosession.set(self._session)
+        try:
+            async with async_timeout.timeout(self.request_timeout):
+                result = await openai.Model.alist(
+                    api_key=self.api_key, api_base=self.api_base
+                )
+        except asyncio.TimeoutError as err:
+            raise error.Timeout("Request timed out") from err
+        finally:
+            openai.aiosession.reset(token)
+        return [model["id"] for model in result["data"]]
@@ -1,13 +1,11 @@
 """Config flow for OpenAI Control integration."""
 from __future__ import annotations
 
-from functools import partial
 import logging
 import types
 from types import MappingProxyType
 from typing import Any
 
-import openai
 from openai import error
 import voluptuous as vol
 
@@ -18,25 +16,85 @@ from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers.selector import (
     NumberSelector,
     NumberSelectorConfig,
+    NumberSelectorMode,
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
     TemplateSelector,
 )
 
 from .const import (
+    CONF_BREAKER_RESET,
+    CONF_BREAKER_THRESHOLD,
+    CONF_CACHE_SIZE,
+    CONF_CACHE_TTL,
     CONF_CHAT_MODEL,
+    CONF_CONNECT_TIMEOUT,
+    CONF_DEADLINE,
+    CONF_DELTA_STATE,
+    CONF_DOMAINS,
+    CONF_ENTITY_FORMAT,
+    CONF_FALLBACK_MODEL,
+    CONF_FAST_PATH,
+    CONF_HEDGE,
+    CONF_HISTORY_TURNS,
+    CONF_MAX_CONCURRENCY,
+    CONF_MAX_RETRIES,
     CONF_MAX_TOKENS,
+    CONF_OPTIMIZE_ACTIONS,
+    CONF_PLAN_REPEATS,
     CONF_PROMPT,
+    CONF_PROMPT_LAYOUT,
+    CONF_REQUESTS_PER_MINUTE,
+    CONF_REQUEST_TIMEOUT,
+    CONF_RESPONSE_FORMAT,
+    CONF_STREAM,
     CONF_TEMPERATURE,
+    CONF_TOKENS_PER_MINUTE,
+    CONF_TOKEN_BUDGET,
+    CONF_TOP_K,
     CONF_TOP_P,
+    DEFAULT_BREAKER_RESET,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL,
     DEFAULT_CHAT_MODEL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_DEADLINE,
+    DEFAULT_DELTA_STATE,
+    DEFAULT_DOMAINS,
+    DEFAULT_ENTITY_FORMAT,
+    DEFAULT_FALLBACK_MODEL,
+    DEFAULT_FAST_PATH,
+    DEFAULT_HEDGE,
+    DEFAULT_HISTORY_TURNS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
     DEFAULT_MAX_TOKENS,
+    DEFAULT_OPTIMIZE_ACTIONS,
+    DEFAULT_PLAN_REPEATS,
     DEFAULT_PROMPT,
+    DEFAULT_PROMPT_LAYOUT,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_RESPONSE_FORMAT,
+    DEFAULT_STREAM,
     DEFAULT_TEMPERATURE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_TOP_K,
     DEFAULT_TOP_P,
     DOMAIN,
+    DOMAINS_OPTIONS,
+    ENTITY_FORMAT_OPTIONS,
     LANGUAGE_AND_MODE,
     LANGUAGE_AND_MODE_OPTIONS,
+    PROMPT_LAYOUT_OPTIONS,
+    RESPONSE_FORMAT_OPTIONS,
     DEFAULT_LANGUAGE_AND_MODE
 )
+from .client import OpenAIClient
+from .models import ModelCache
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -51,9 +109,34 @@ DEFAULT_OPTIONS = types.MappingProxyType(
         CONF_PROMPT: DEFAULT_PROMPT,
         CONF_CHAT_MODEL: DEFAULT_CHAT_MODEL,
         LANGUAGE_AND_MODE: DEFAULT_LANGUAGE_AND_MODE,
+        CONF_ENTITY_FORMAT: DEFAULT_ENTITY_FORMAT,
+        CONF_RESPONSE_FORMAT: DEFAULT_RESPONSE_FORMAT,
         CONF_MAX_TOKENS: DEFAULT_MAX_TOKENS,
         CONF_TOP_P: DEFAULT_TOP_P,
         CONF_TEMPERATURE: DEFAULT_TEMPERATURE,
+        CONF_TOP_K: DEFAULT_TOP_K,
+        CONF_FAST_PATH: DEFAULT_FAST_PATH,
+        CONF_STREAM: DEFAULT_STREAM,
+        CONF_CACHE_SIZE: DEFAULT_CACHE_SIZE,
+        CONF_CACHE_TTL: DEFAULT_CACHE_TTL,
+        CONF_CONNECT_TIMEOUT: DEFAULT_CONNECT_TIMEOUT,
+        CONF_REQUEST_TIMEOUT: DEFAULT_REQUEST_TIMEOUT,
+        CONF_DEADLINE: DEFAULT_DEADLINE,
+        CONF_MAX_RETRIES: DEFAULT_MAX_RETRIES,
+        CONF_HEDGE: DEFAULT_HEDGE,
+        CONF_FALLBACK_MODEL: DEFAULT_FALLBACK_MODEL,
+        CONF_BREAKER_THRESHOLD: DEFAULT_BREAKER_THRESHOLD,
+        CONF_BREAKER_RESET: DEFAULT_BREAKER_RESET,
+        CONF_DELTA_STATE: DEFAULT_DELTA_STATE,
+        CONF_DOMAINS: DEFAULT_DOMAINS,
+        CONF_TOKEN_BUDGET: DEFAULT_TOKEN_BUDGET,
+        CONF_HISTORY_TURNS: DEFAULT_HISTORY_TURNS,
+        CONF_PROMPT_LAYOUT: DEFAULT_PROMPT_LAYOUT,
+        CONF_OPTIMIZE_ACTIONS: DEFAULT_OPTIMIZE_ACTIONS,
+        CONF_PLAN_REPEATS: DEFAULT_PLAN_REPEATS,
+        CONF_MAX_CONCURRENCY: DEFAULT_MAX_CONCURRENCY,
+        CONF_REQUESTS_PER_MINUTE: DEFAULT_REQUESTS_PER_MINUTE,
+        CONF_TOKENS_PER_MINUTE: DEFAULT_TOKENS_PER_MINUTE,
     }
 )
 
@@ -62,9 +145,12 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> None:
     """Validate the user input allows us to connect.
 
     Data has the keys from STEP_USER_DATA_SCHEMA with values provided by the user.
+    The model list is cached, so setting up the entry doesn't validate again.
     """
-    openai.api_key = data[CONF_API_KEY]
-    await hass.async_add_executor_job(partial(openai.Model.list, request_timeout=10))
+    client = OpenAIClient(
+        hass, data[CONF_API_KEY], DEFAULT_CONNECT_TIMEOUT, DEFAULT_REQUEST_TIMEOUT
+    )
+    await ModelCache(hass, data[CONF_API_KEY]).async_validate(client)
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -120,17 +206,28 @@ class OptionsFlow(config_entries.OptionsFlow):
         """Manage the options."""
         if user_input is not None:
             return self.async_create_entry(title="OpenAI Control", data=user_input)
-        schema = openai_config_option_schema(self.config_entry.options)
+        # the models cached by the agent, the form must not wait for OpenAI
+        models = []
+        if agent := self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id):
+            models = agent.models.chat_models()
+        schema = openai_config_option_schema(self.config_entry.options, models)
         return self.async_show_form(
             step_id="init",
             data_schema=vol.Schema(schema),
         )
 
 
-def openai_config_option_schema(options: MappingProxyType[str, Any]) -> dict:
-    """Return a schema for OpenAI Control completion options."""
+def openai_config_option_schema(
+    options: MappingProxyType[str, Any], models: list[str] | None = None
+) -> dict:
+    """Return a schema for OpenAI Control completion options.
+
+    The chat model can be picked from models, other models can be typed in.
+    """
     if not options:
         options = DEFAULT_OPTIONS
+    chat_model = options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+    model_options = sorted({*(models or []), chat_model, DEFAULT_CHAT_MODEL})
     return {
         vol.Optional(
             CONF_PROMPT,
@@ -141,14 +238,36 @@ def openai_config_option_schema(options: MappingProxyType[str, Any]) -> dict:
             CONF_CHAT_MODEL,
             description={
                 # New key in HA 2023.4
-                "suggested_value": options.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL)
+                "suggested_value": chat_model
             },
             default=DEFAULT_CHAT_MODEL,
-        ): str,
+        ): SelectSelector(
+            SelectSelectorConfig(
+                options=model_options,
+                custom_value=True,
+                mode=SelectSelectorMode.DROPDOWN,
+            )
+        ),
         vol.Optional(
             LANGUAGE_AND_MODE,
             default=DEFAULT_LANGUAGE_AND_MODE,
         ): vol.In(LANGUAGE_AND_MODE_OPTIONS),
+        vol.Optional(
+            CONF_ENTITY_FORMAT,
+            description={
+                "suggested_value": options.get(CONF_ENTITY_FORMAT, DEFAULT_ENTITY_FORMAT)
+            },
+            default=DEFAULT_ENTITY_FORMAT,
+        ): vol.In(ENTITY_FORMAT_OPTIONS),
+        vol.Optional(
+            CONF_RESPONSE_FORMAT,
+            description={
+                "suggested_value": options.get(
+                    CONF_RESPONSE_FORMAT, DEFAULT_RESPONSE_FORMAT
+                )
+            },
+            default=DEFAULT_RESPONSE_FORMAT,
+        ): vol.In(RESPONSE_FORMAT_OPTIONS),
         vol.Optional(
             CONF_MAX_TOKENS,
             description={"suggested_value": options[CONF_MAX_TOKENS]},
@@ -164,4 +283,205 @@ def openai_config_option_schema(options: MappingProxyType[str, Any]) -> dict:
             description={"suggested_value": options[CONF_TEMPERATURE]},
             default=DEFAULT_TEMPERATURE,
         ): NumberSelector(NumberSelectorConfig(min=0, max=1, step=0.05)),
+        vol.Optional(
+            CONF_TOP_K,
+            description={
+                "suggested_value": options.get(CONF_TOP_K, DEFAULT_TOP_K)
+            },
+            default=DEFAULT_TOP_K,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=500, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_FAST_PATH,
+            description={
+                "suggested_value": options.get(CONF_FAST_PATH, DEFAULT_FAST_PATH)
+            },
+            default=DEFAULT_FAST_PATH,
+        ): bool,
+        vol.Optional(
+            CONF_STREAM,
+            description={"suggested_value": options.get(CONF_STREAM, DEFAULT_STREAM)},
+            default=DEFAULT_STREAM,
+        ): bool,
+        vol.Optional(
+            CONF_CACHE_SIZE,
+            description={
+                "suggested_value": options.get(CONF_CACHE_SIZE, DEFAULT_CACHE_SIZE)
+            },
+            default=DEFAULT_CACHE_SIZE,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=1000, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_CACHE_TTL,
+            description={
+                "suggested_value": options.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL)
+            },
+            default=DEFAULT_CACHE_TTL,
+        ): NumberSelector(
+            NumberSelectorConfig(
+                min=0,
+                max=86400,
+                step=1,
+                unit_of_measurement="s",
+                mode=NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_CONNECT_TIMEOUT,
+            description={
+                "suggested_value": options.get(
+                    CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT
+                )
+            },
+            default=DEFAULT_CONNECT_TIMEOUT,
+        ): NumberSelector(
+            NumberSelectorConfig(min=1, max=60, step=1, unit_of_measurement="s")
+        ),
+        vol.Optional(
+            CONF_REQUEST_TIMEOUT,
+            description={
+                "suggested_value": options.get(
+                    CONF_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT
+                )
+            },
+            default=DEFAULT_REQUEST_TIMEOUT,
+        ): NumberSelector(
+            NumberSelectorConfig(min=1, max=300, step=1, unit_of_measurement="s")
+        ),
+        vol.Optional(
+            CONF_DEADLINE,
+            description={
+                "suggested_value": options.get(CONF_DEADLINE, DEFAULT_DEADLINE)
+            },
+            default=DEFAULT_DEADLINE,
+        ): NumberSelector(
+            NumberSelectorConfig(min=1, max=300, step=1, unit_of_measurement="s")
+        ),
+        vol.Optional(
+            CONF_MAX_RETRIES,
+            description={
+                "suggested_value": options.get(CONF_MAX_RETRIES, DEFAULT_MAX_RETRIES)
+            },
+            default=DEFAULT_MAX_RETRIES,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=10, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_HEDGE,
+            description={
+                "suggested_value": options.get(CONF_HEDGE, DEFAULT_HEDGE)
+            },
+            default=DEFAULT_HEDGE,
+        ): bool,
+        vol.Optional(
+            CONF_FALLBACK_MODEL,
+            description={
+                "suggested_value": options.get(CONF_FALLBACK_MODEL, DEFAULT_FALLBACK_MODEL)
+            },
+            default=DEFAULT_FALLBACK_MODEL,
+        ): str,
+        vol.Optional(
+            CONF_BREAKER_THRESHOLD,
+            description={
+                "suggested_value": options.get(CONF_BREAKER_THRESHOLD, DEFAULT_BREAKER_THRESHOLD)
+            },
+            default=DEFAULT_BREAKER_THRESHOLD,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=100, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_BREAKER_RESET,
+            description={
+                "suggested_value": options.get(CONF_BREAKER_RESET, DEFAULT_BREAKER_RESET)
+            },
+            default=DEFAULT_BREAKER_RESET,
+        ): NumberSelector(
+            NumberSelectorConfig(min=1, max=3600, step=1, unit_of_measurement="s")
+        ),
+        vol.Optional(
+            CONF_DELTA_STATE,
+            description={
+                "suggested_value": options.get(CONF_DELTA_STATE, DEFAULT_DELTA_STATE)
+            },
+            default=DEFAULT_DELTA_STATE,
+        ): bool,
+        vol.Optional(
+            CONF_DOMAINS,
+            description={
+                "suggested_value": options.get(CONF_DOMAINS, DEFAULT_DOMAINS)
+            },
+            default=DEFAULT_DOMAINS,
+        ): SelectSelector(
+            SelectSelectorConfig(options=DOMAINS_OPTIONS, multiple=True)
+        ),
+        vol.Optional(
+            CONF_TOKEN_BUDGET,
+            description={
+                "suggested_value": options.get(CONF_TOKEN_BUDGET, DEFAULT_TOKEN_BUDGET)
+            },
+            default=DEFAULT_TOKEN_BUDGET,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=200000, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_HISTORY_TURNS,
+            description={
+                "suggested_value": options.get(CONF_HISTORY_TURNS, DEFAULT_HISTORY_TURNS)
+            },
+            default=DEFAULT_HISTORY_TURNS,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=10, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_PROMPT_LAYOUT,
+            description={
+                "suggested_value": options.get(CONF_PROMPT_LAYOUT, DEFAULT_PROMPT_LAYOUT)
+            },
+            default=DEFAULT_PROMPT_LAYOUT,
+        ): vol.In(PROMPT_LAYOUT_OPTIONS),
+        vol.Optional(
+            CONF_OPTIMIZE_ACTIONS,
+            description={
+                "suggested_value": options.get(CONF_OPTIMIZE_ACTIONS, DEFAULT_OPTIMIZE_ACTIONS)
+            },
+            default=DEFAULT_OPTIMIZE_ACTIONS,
+        ): bool,
+        vol.Optional(
+            CONF_PLAN_REPEATS,
+            description={
+                "suggested_value": options.get(CONF_PLAN_REPEATS, DEFAULT_PLAN_REPEATS)
+            },
+            default=DEFAULT_PLAN_REPEATS,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=20, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_MAX_CONCURRENCY,
+            description={
+                "suggested_value": options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)
+            },
+            default=DEFAULT_MAX_CONCURRENCY,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=50, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_REQUESTS_PER_MINUTE,
+            description={
+                "suggested_value": options.get(CONF_REQUESTS_PER_MINUTE, DEFAULT_REQUESTS_PER_MINUTE)
+            },
+            default=DEFAULT_REQUESTS_PER_MINUTE,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=100000, step=1, mode=NumberSelectorMode.BOX)
+        ),
+        vol.Optional(
+            CONF_TOKENS_PER_MINUTE,
+            description={
+                "suggested_value": options.get(CONF_TOKENS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+            },
+            default=DEFAULT_TOKENS_PER_MINUTE,
+        ): NumberSelector(
+            NumberSelectorConfig(min=0, max=10000000, step=1, mode=NumberSelectorMode.BOX)
+        ),
     }
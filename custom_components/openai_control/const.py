@@ -9,6 +9,27 @@ COLOR_ENTITY_TEMPLATE = """$id<>$status<>$action<>$brightness<>$hs_color
 TEST_ENTITY_TEMPLATE = """$id<>$status<>$action<>$brightness<>$hs_color
 """
 
+ENTITY_FORMAT = """Each entity has an entity id, state, possible actions to perform, separated by "<>"."""
+COLOR_ENTITY_FORMAT = """Each entity has an entity id, state, possible actions to perform, brightness (0-255), and HS color (Hue(0-360), Saturation(0-100)), separated by "<>"."""
+DUTCH_ENTITY_FORMAT = """Elke entiteit heeft een entity id, state, possible actions to perform, gescheiden door "<>"."""
+DUTCH_COLOR_ENTITY_FORMAT = """Elke entiteit heeft een entity id, state, possible actions to perform, brightness (0-255), en HS color (Hue(0-360),Saturation(0-100)), gescheiden door "<>"."""
+COMPACT_ENTITY_FORMAT = """Entities are grouped under "domain area:" headers. Each entity has a numeric id, name and state, separated by "<>". Every entity supports the actions of its domain on the "Actions:" line. Use the numeric id as "id" in your answer."""
+COMPACT_COLOR_ENTITY_FORMAT = """Entities are grouped under "domain area:" headers. Each entity has a numeric id, name, state, and if known brightness (0-255) and HS color (Hue(0-360), Saturation(0-100)), separated by "<>". Every entity supports the actions of its domain on the "Actions:" line. Use the numeric id as "id" in your answer."""
+DUTCH_COMPACT_ENTITY_FORMAT = """Entiteiten zijn gegroepeerd onder "domein ruimte:" kopjes. Elke entiteit heeft een numeriek id, naam en state, gescheiden door "<>". Elke entiteit ondersteunt de acties van zijn domein op de "Actions:" regel. Gebruik het numerieke id als "id" in je antwoord."""
+DUTCH_COMPACT_COLOR_ENTITY_FORMAT = """Entiteiten zijn gegroepeerd onder "domein ruimte:" kopjes. Elke entiteit heeft een numeriek id, naam, state, en indien bekend brightness (0-255) en HS color (Hue(0-360),Saturation(0-100)), gescheiden door "<>". Elke entiteit ondersteunt de acties van zijn domein op de "Actions:" regel. Gebruik het numerieke id als "id" in je antwoord."""
+PREFIX_ENTITY_FORMAT = """Each entity has an entity id and possible actions to perform, separated by "<>". The current state of each entity is listed under "States:" as entity id and state, separated by "<>"."""
+PREFIX_COLOR_ENTITY_FORMAT = """Each entity has an entity id and possible actions to perform, separated by "<>". The current state of each entity is listed under "States:" as entity id, state, brightness (0-255), and HS color (Hue(0-360), Saturation(0-100)), separated by "<>"."""
+DUTCH_PREFIX_ENTITY_FORMAT = """Elke entiteit heeft een entity id en possible actions to perform, gescheiden door "<>". De huidige state van elke entiteit staat onder "States:" als entity id en state, gescheiden door "<>"."""
+DUTCH_PREFIX_COLOR_ENTITY_FORMAT = """Elke entiteit heeft een entity id en possible actions to perform, gescheiden door "<>". De huidige state van elke entiteit staat onder "States:" als entity id, state, brightness (0-255), en HS color (Hue(0-360),Saturation(0-100)), gescheiden door "<>"."""
+PREFIX_COMPACT_ENTITY_FORMAT = """Entities are grouped under "domain area:" headers. Each entity has a numeric id and name, separated by "<>". Every entity supports the actions of its domain on the "Actions:" line. The current state of each entity is listed under "States:" as numeric id and state, separated by "<>". Use the numeric id as "id" in your answer."""
+PREFIX_COMPACT_COLOR_ENTITY_FORMAT = """Entities are grouped under "domain area:" headers. Each entity has a numeric id and name, separated by "<>". Every entity supports the actions of its domain on the "Actions:" line. The current state of each entity is listed under "States:" as numeric id, state, and if known brightness (0-255) and HS color (Hue(0-360), Saturation(0-100)), separated by "<>". Use the numeric id as "id" in your answer."""
+DUTCH_PREFIX_COMPACT_ENTITY_FORMAT = """Entiteiten zijn gegroepeerd onder "domein ruimte:" kopjes. Elke entiteit heeft een numeriek id en naam, gescheiden door "<>". Elke entiteit ondersteunt de acties van zijn domein op de "Actions:" regel. De huidige state van elke entiteit staat onder "States:" als numeriek id en state, gescheiden door "<>". Gebruik het numerieke id als "id" in je antwoord."""
+DUTCH_PREFIX_COMPACT_COLOR_ENTITY_FORMAT = """Entiteiten zijn gegroepeerd onder "domein ruimte:" kopjes. Elke entiteit heeft een numeriek id en naam, gescheiden door "<>". Elke entiteit ondersteunt de acties van zijn domein op de "Actions:" regel. De huidige state van elke entiteit staat onder "States:" als numeriek id, state, en indien bekend brightness (0-255) en HS color (Hue(0-360),Saturation(0-100)), gescheiden door "<>". Gebruik het numerieke id als "id" in je antwoord."""
+DELTA_STATE_FORMAT = """Brightness and HS color are only listed for the entities the prompt is about."""
+DUTCH_DELTA_STATE_FORMAT = """Brightness en HS color worden alleen vermeld voor de entiteiten waar de prompt over gaat."""
+FIELDS_FORMAT = """Actions that need a value take it as an extra field of the entity: $fields."""
+DUTCH_FIELDS_FORMAT = """Acties die een waarde nodig hebben krijgen die als extra veld van de entiteit: $fields."""
+
 PROMPT_TEMPLATE = """
 Based on the given prompt you need to identify the relevant entities in the list below and perform the appropriate actions for each of them.
 
@@ -16,7 +37,7 @@ Prompt: "$prompt"
 
 Entities: $entities
 
-Each entity has an entity id, state, possible actions to perform, separated by "<>".
+$format
 Use this information to complete the following tasks:
 
 - Identify and select the entity or entities from the prompt that match the description. The room of the entity can always be found in the name of the entity immediately after "light.", for example in "kitchenlamp_ceiling", "kitchen" is the room. If a general room, such as "living room" is mentioned, then select all entities that have this room in their name.
@@ -34,7 +55,7 @@ Prompt: "$prompt"
 
 Entities: $entities
 
-Elke entiteit heeft een entity id, state, possible actions to perform, gescheiden door "<>".
+$format
 Gebruik deze informatie om de volgende taken uit te voeren:
 
 - Identificeer en kies de entiteit of entiteiten in de prompt die overeenkomen met de omschrijving. De ruimte van de entiteit is altijd te vinden in de naam van de entiteit direct na "light.", bijvoorbeeld in "keukenlamp_plafond" is "keuken" de ruimte. Als er wordt verwezen naar een algemene ruimte zoals "woonkamer", selecteer dan alle entiteiten die deze ruimte in hun naam hebben.
@@ -52,7 +73,7 @@ Prompt: "$prompt"
 
 Entities: $entities
 
-Each entity has an entity id, state, possible actions to perform, brightness (0-255), and HS color (Hue(0-360), Saturation(0-100)), separated by "<>".
+$format
 Use this information to complete the following tasks:
 
 - Identify and select the entity or entities from the prompt that match the description. The room of the entity can always be found in the name of the entity immediately after "light.", for example in "kitchenlamp_ceiling", "kitchen" is the room. If a general room, such as "living room" is mentioned, then select all entities that have this room in their name.
@@ -72,7 +93,7 @@ Prompt: "$prompt"
 
 Entities: $entities
 
-Elke entiteit heeft een entity id, state, possible actions to perform, brightness (0-255), en HS color (Hue(0-360),Saturation(0-100)), gescheiden door "<>".
+$format
 Gebruik deze informatie om de volgende taken uit te voeren:
 
 - Identificeer en kies de entiteit of entiteiten in de prompt die overeenkomen met de omschrijving. De ruimte van de entiteit is altijd te vinden in de naam van de entiteit direct na "light.", bijvoorbeeld in "keukenlamp_plafond" is "keuken" de ruimte. Als er wordt verwezen naar een algemene ruimte zoals "woonkamer", selecteer dan alle entiteiten die deze ruimte in hun naam hebben.
@@ -106,6 +127,79 @@ Identify:
 Use the above JSON Template format for the response, including a natural language explanation in the "assistant" field.
 """
 
+TOOLS_PROMPT_TEMPLATE = """
+Control the entities below with the available tools, taking their current state into account. If a room is mentioned, select all entities in that room. If the prompt is not a command, answer it normally.
+
+Prompt: "$prompt"
+
+Entities: $entities
+
+$format
+"""
+DUTCH_TOOLS_PROMPT_TEMPLATE = """
+Bedien de onderstaande entiteiten met de beschikbare tools, rekening houdend met hun huidige status. Als er een ruimte wordt genoemd, selecteer dan alle entiteiten in die ruimte. Als de prompt geen opdracht is, beantwoord deze dan normaal.
+
+Prompt: "$prompt"
+
+Entities: $entities
+
+$format
+"""
+
+# spoken reply when the model only returned tool calls
+TOOLS_REPLY = "Done."
+DUTCH_TOOLS_REPLY = "Klaar."
+
+"""History"""
+
+# the conversation history keeps the user text and compact reply of each turn
+HISTORY_MAX_CONVERSATIONS = 100
+HISTORY_MAX_TURNS = 10
+HISTORY_TTL = 1800
+
+"""Services"""
+
+SERVICE_PREPARE = "prepare"
+SERVICE_PROCESS_BATCH = "process_batch"
+
+# the entry whose agent processes a batch, needed when several are loaded
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+
+# OpenAI requests a batch of utterances sends at the same time
+BATCH_CONCURRENCY = 4
+
+# seconds a system prompt rendered by a prepare call is used for the next utterance
+PREPARE_TTL = 15
+
+"""Actions"""
+
+# seconds the service calls of a reply may take before they count as failed
+ACTION_TIMEOUT = 10
+
+"""Models"""
+
+# seconds a validated API key and its model list are used without calling OpenAI
+MODELS_TTL = 86400
+MODELS_STORAGE_VERSION = 1
+
+"""Plans"""
+
+# utterances and the actions they were resolved to, kept across restarts
+PLANS_MAX_SIZE = 200
+PLANS_SAVE_DELAY = 30
+PLANS_STORAGE_VERSION = 1
+
+# shortest word a typo is accepted in, shorter words like "on" and "of" or
+# "open" and "oven" have to match exactly for a plan to be served
+PLAN_TYPO_MIN_LENGTH = 5
+# words that may be added or left out of a learned utterance
+PLAN_FILLER_WORDS = frozenset(
+    {
+        "a", "an", "and", "can", "could", "for", "me", "please", "the", "you",
+        "alsjeblieft", "de", "een", "even", "graag", "het", "je", "kun", "wil",
+    }
+)
+
 """Options"""
 
 CONF_PROMPT = "prompt"
@@ -123,6 +217,45 @@ DEFAULT_TOP_P = 1
 CONF_TEMPERATURE = "temperature"
 DEFAULT_TEMPERATURE = 0.5
 
+CONF_TOP_K = "top_k"
+DEFAULT_TOP_K = 20
+
+CONF_FAST_PATH = "fast_path"
+DEFAULT_FAST_PATH = True
+
+CONF_STREAM = "stream"
+DEFAULT_STREAM = False
+
+CONF_CONNECT_TIMEOUT = "connect_timeout"
+DEFAULT_CONNECT_TIMEOUT = 10
+
+CONF_REQUEST_TIMEOUT = "request_timeout"
+DEFAULT_REQUEST_TIMEOUT = 30
+
+CONF_CACHE_SIZE = "cache_size"
+DEFAULT_CACHE_SIZE = 64
+
+CONF_CACHE_TTL = "cache_ttl"
+DEFAULT_CACHE_TTL = 3600
+
+CONF_DEADLINE = "deadline"
+DEFAULT_DEADLINE = 30
+
+CONF_MAX_RETRIES = "max_retries"
+DEFAULT_MAX_RETRIES = 2
+
+CONF_HEDGE = "hedge"
+DEFAULT_HEDGE = False
+
+CONF_FALLBACK_MODEL = "fallback_model"
+DEFAULT_FALLBACK_MODEL = ""
+
+CONF_BREAKER_THRESHOLD = "breaker_threshold"
+DEFAULT_BREAKER_THRESHOLD = 5
+
+CONF_BREAKER_RESET = "breaker_reset"
+DEFAULT_BREAKER_RESET = 60
+
 LANGUAGE_AND_MODE_OPTIONS = [
     "Dutch + brightness + color control",
     "English + brightness + color control",
@@ -132,4 +265,65 @@ LANGUAGE_AND_MODE_OPTIONS = [
 ]
 
 LANGUAGE_AND_MODE = "language_and_mode"
-DEFAULT_LANGUAGE_AND_MODE = "English"
\ No newline at end of file
+DEFAULT_LANGUAGE_AND_MODE = "English"
+
+ENTITY_FORMAT_OPTIONS = [
+    "standard",
+    "compact",
+]
+
+CONF_ENTITY_FORMAT = "entity_format"
+DEFAULT_ENTITY_FORMAT = "standard"
+
+RESPONSE_FORMAT_OPTIONS = [
+    "json",
+    "tools",
+]
+
+CONF_RESPONSE_FORMAT = "response_format"
+DEFAULT_RESPONSE_FORMAT = "json"
+
+CONF_DELTA_STATE = "delta_state"
+DEFAULT_DELTA_STATE = False
+
+DOMAINS_OPTIONS = [
+    "light",
+    "switch",
+    "cover",
+    "climate",
+    "fan",
+    "media_player",
+    "scene",
+]
+
+CONF_DOMAINS = "domains"
+DEFAULT_DOMAINS = ["light", "switch"]
+
+CONF_TOKEN_BUDGET = "token_budget"
+DEFAULT_TOKEN_BUDGET = 0
+
+CONF_HISTORY_TURNS = "history_turns"
+DEFAULT_HISTORY_TURNS = 0
+
+PROMPT_LAYOUT_OPTIONS = [
+    "standard",
+    "prefix_cache",
+]
+
+CONF_PROMPT_LAYOUT = "prompt_layout"
+DEFAULT_PROMPT_LAYOUT = "standard"
+
+CONF_OPTIMIZE_ACTIONS = "optimize_actions"
+DEFAULT_OPTIMIZE_ACTIONS = True
+
+CONF_PLAN_REPEATS = "plan_repeats"
+DEFAULT_PLAN_REPEATS = 3
+
+CONF_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_MAX_CONCURRENCY = 4
+
+CONF_REQUESTS_PER_MINUTE = "requests_per_minute"
+DEFAULT_REQUESTS_PER_MINUTE = 0
+
+CONF_TOKENS_PER_MINUTE = "tokens_per_minute"
+DEFAULT_TOKENS_PER_MINUTE = 0
@@ -0,0 +1,63 @@
+"""Diagnostics support for OpenAI Control."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_API_KEY
+from homeassistant.core import HomeAssistant
+
+from . import OpenAIAgent
+from .const import DOMAIN
+
+TO_REDACT = {CONF_API_KEY}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    agent: OpenAIAgent = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "metrics": agent.metrics.as_dict(),
+        "fast_path": {
+            "hits": agent.fast_path.hits,
+            "misses": agent.fast_path.misses,
+        },
+        "cache": {
+            "hits": agent.cache.hits,
+            "misses": agent.cache.misses,
+            "hit_rate": agent.cache.hit_rate,
+            "size": len(agent.cache),
+        },
+        "circuit_breaker": {
+            "state": agent.resilient.breaker.state,
+            "failures": agent.resilient.breaker.failures,
+        },
+        "scheduler": {
+            "queued": agent.scheduler.depth(),
+            "active": agent.scheduler.active,
+        },
+        "catalog": {
+            "entities": len(agent.catalog.entities),
+        },
+        "models": {
+            "count": len(agent.models.models),
+            "validated_at": agent.models.validated_at,
+            "fresh": agent.models.is_fresh,
+            "error": agent.models.error,
+        },
+        "plans": {
+            "recorded": len(agent.plans),
+            "promoted": agent.plans.promoted,
+        },
+        "history": {
+            "conversations": len(agent.history),
+        },
+    }
@@ -0,0 +1,281 @@
+"""Controllable domains and their services for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+import logging
+from typing import Any
+
+from homeassistant.components.climate.const import ClimateEntityFeature, HVACMode
+from homeassistant.components.cover import CoverEntityFeature
+from homeassistant.components.fan import FanEntityFeature
+from homeassistant.components.media_player.const import MediaPlayerEntityFeature
+from homeassistant.const import EVENT_SERVICE_REGISTERED, EVENT_SERVICE_REMOVED
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DomainSpec:
+    """The services of a domain the agent may call."""
+
+    services: tuple[str, ...]
+    # supported feature an entity needs for a service
+    features: dict[str, int] = field(default_factory=dict)
+    # JSON schemas of the service data fields of each service
+    fields: dict[str, dict[str, dict[str, Any]]] = field(default_factory=dict)
+    # state attributes that are added to the state in the prompt
+    attributes: tuple[str, ...] = ()
+    # state an entity is in after a service, for services that don't depend on data
+    states: dict[str, str] = field(default_factory=dict)
+    # state attribute with the current value of a service data field, "state"
+    # when the field is compared with the state itself
+    current: dict[str, str] = field(default_factory=dict)
+
+
+TOGGLE_SERVICES = ("toggle", "turn_off", "turn_on")
+TOGGLE_STATES = {"turn_off": "off", "turn_on": "on"}
+
+DOMAIN_SPECS: dict[str, DomainSpec] = {
+    # brightness and color of lights have their own fields in the color modes
+    "light": DomainSpec(
+        TOGGLE_SERVICES,
+        states=TOGGLE_STATES,
+        current={"brightness": "brightness", "hs_color": "hs_color"},
+    ),
+    "switch": DomainSpec(TOGGLE_SERVICES, states=TOGGLE_STATES),
+    "cover": DomainSpec(
+        ("open_cover", "close_cover", "stop_cover", "set_cover_position"),
+        features={
+            "open_cover": CoverEntityFeature.OPEN,
+            "close_cover": CoverEntityFeature.CLOSE,
+            "stop_cover": CoverEntityFeature.STOP,
+            "set_cover_position": CoverEntityFeature.SET_POSITION,
+        },
+        fields={
+            "set_cover_position": {
+                "position": {"type": "integer", "minimum": 0, "maximum": 100},
+            },
+        },
+        attributes=("current_position",),
+        states={"open_cover": "open", "close_cover": "closed"},
+        current={"position": "current_position"},
+    ),
+    "climate": DomainSpec(
+        ("turn_off", "turn_on", "set_hvac_mode", "set_temperature"),
+        features={"set_temperature": ClimateEntityFeature.TARGET_TEMPERATURE},
+        fields={
+            "set_hvac_mode": {
+                "hvac_mode": {
+                    "type": "string",
+                    "enum": [mode.value for mode in HVACMode],
+                },
+            },
+            "set_temperature": {"temperature": {"type": "number"}},
+        },
+        attributes=("current_temperature", "temperature"),
+        states={"turn_off": "off"},
+        current={"hvac_mode": "state", "temperature": "temperature"},
+    ),
+    "fan": DomainSpec(
+        (*TOGGLE_SERVICES, "set_percentage"),
+        features={"set_percentage": FanEntityFeature.SET_SPEED},
+        fields={
+            "set_percentage": {
+                "percentage": {"type": "integer", "minimum": 0, "maximum": 100},
+            },
+        },
+        attributes=("percentage",),
+        states=TOGGLE_STATES,
+        current={"percentage": "percentage"},
+    ),
+    "media_player": DomainSpec(
+        (
+            "turn_off",
+            "turn_on",
+            "media_pause",
+            "media_play",
+            "media_stop",
+            "volume_mute",
+            "volume_set",
+        ),
+        features={
+            "turn_off": MediaPlayerEntityFeature.TURN_OFF,
+            "turn_on": MediaPlayerEntityFeature.TURN_ON,
+            "media_pause": MediaPlayerEntityFeature.PAUSE,
+            "media_play": MediaPlayerEntityFeature.PLAY,
+            "media_stop": MediaPlayerEntityFeature.STOP,
+            "volume_mute": MediaPlayerEntityFeature.VOLUME_MUTE,
+            "volume_set": MediaPlayerEntityFeature.VOLUME_SET,
+        },
+        fields={
+            "volume_mute": {"is_volume_muted": {"type": "boolean"}},
+            "volume_set": {
+                "volume_level": {"type": "number", "minimum": 0, "maximum": 1},
+            },
+        },
+        attributes=("volume_level",),
+        states={"turn_off": "off", "media_pause": "paused", "media_play": "playing"},
+        current={
+            "is_volume_muted": "is_volume_muted",
+            "volume_level": "volume_level",
+        },
+    ),
+    "scene": DomainSpec(("turn_on",)),
+}
+
+
+def coerce_value(schema: dict[str, Any], value: Any) -> Any | None:
+    """Convert a value from a reply to the type of its JSON schema.
+
+    Numbers are clamped to the minimum and maximum of the schema. Returns
+    None when the value can't be converted.
+    """
+    kind = schema.get("type")
+    try:
+        if kind == "boolean":
+            if isinstance(value, str):
+                return value.strip().lower() in ("true", "yes", "1", "on")
+            return bool(value)
+        if kind in ("integer", "number"):
+            number = float(value)
+            if "minimum" in schema:
+                number = max(schema["minimum"], number)
+            if "maximum" in schema:
+                number = min(schema["maximum"], number)
+            return round(number) if kind == "integer" else number
+    except (TypeError, ValueError):
+        return None
+
+    if kind == "string":
+        value = str(value)
+        if "enum" in schema and value not in schema["enum"]:
+            return None
+        return value
+    return None
+
+
+class DomainRegistry:
+    """The services of the controlled domains that are available in Home Assistant.
+
+    The services are derived from the registered services and the supported
+    features of each entity once, and refreshed when services are registered
+    or removed.
+    """
+
+    def __init__(self, hass: HomeAssistant, domains: list[str]) -> None:
+        """Initialize the registry."""
+        self.hass = hass
+        self.domains = [domain for domain in domains if domain in DOMAIN_SPECS]
+        self._services: dict[str, tuple[str, ...]] = {}
+        self._entity_services: dict[tuple[str, int], tuple[str, ...]] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self._unsub: list[CALLBACK_TYPE] = []
+
+    @callback
+    def async_start(self) -> None:
+        """Derive the services and start listening for service changes."""
+        self._async_refresh()
+        self._unsub = [
+            self.hass.bus.async_listen(event_type, self._async_services_changed)
+            for event_type in (EVENT_SERVICE_REGISTERED, EVENT_SERVICE_REMOVED)
+        ]
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop listening for service changes."""
+        while self._unsub:
+            self._unsub.pop()()
+
+    @callback
+    def async_set_domains(self, domains: list[str]) -> None:
+        """Change the controlled domains."""
+        domains = [domain for domain in domains if domain in DOMAIN_SPECS]
+        if domains != self.domains:
+            self.domains = domains
+            self._async_refresh()
+            self._async_notify()
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call listener when the domains or their services change."""
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def services(self, domain: str) -> tuple[str, ...]:
+        """Return the available services of a domain."""
+        return self._services.get(domain, ())
+
+    def entity_services(self, domain: str, supported_features: int) -> tuple[str, ...]:
+        """Return the available services an entity supports."""
+        key = (domain, supported_features)
+        if (services := self._entity_services.get(key)) is None:
+            features = DOMAIN_SPECS[domain].features if domain in DOMAIN_SPECS else {}
+            services = self._entity_services[key] = tuple(
+                service
+                for service in self.services(domain)
+                if service not in features
+                or supported_features & features[service]
+            )
+        return services
+
+    def attributes(self, domain: str) -> tuple[str, ...]:
+        """Return the state attributes of a domain that matter for the prompt."""
+        spec = DOMAIN_SPECS.get(domain)
+        return spec.attributes if spec else ()
+
+    def fields(self, domain: str, service: str) -> dict[str, dict[str, Any]]:
+        """Return the JSON schemas of the service data fields of a service."""
+        spec = DOMAIN_SPECS.get(domain)
+        return spec.fields.get(service, {}) if spec else {}
+
+    def parse_fields(
+        self, domain: str, service: str, values: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Return the service data of a service from the fields of a reply."""
+        data = {}
+        for name, schema in self.fields(domain, service).items():
+            if name not in values:
+                continue
+            if (value := coerce_value(schema, values[name])) is None:
+                _LOGGER.error(
+                    "Invalid %s for %s.%s: %s", name, domain, service, values[name]
+                )
+                continue
+            data[name] = value
+        return data
+
+    @callback
+    def _async_refresh(self) -> None:
+        """Derive the available services of the controlled domains."""
+        registered = self.hass.services.async_services()
+        self._services = {
+            domain: tuple(
+                service
+                for service in DOMAIN_SPECS[domain].services
+                if service in registered.get(domain, {})
+            )
+            for domain in self.domains
+        }
+        self._entity_services = {}
+        _LOGGER.debug("Available services: %s", self._services)
+
+    @callback
+    def _async_services_changed(self, event: Event) -> None:
+        """Refresh the services when a service of a controlled domain changes."""
+        if event.data.get("domain") not in self.domains:
+            return
+        self._async_refresh()
+        self._async_notify()
+
+    @callback
+    def _async_notify(self) -> None:
+        """Notify the listeners of changed domains or services."""
+        for listener in self._listeners:
+            listener()
@@ -0,0 +1,235 @@
+"""Local fast path for simple commands in the OpenAI Control integration."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import logging
+import re
+from typing import Any
+
+from .catalog import EntityCatalog
+
+_LOGGER = logging.getLogger(__name__)
+
+# the grammars only speak about lights and switches
+FAST_PATH_DOMAINS = {"light", "switch"}
+
+_PERCENTAGE_RE = re.compile(r"(\d{1,3})\s*(?:%|percent|procent)")
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+@dataclass(frozen=True)
+class Grammar:
+    """Words the fast path understands in a single language."""
+
+    on_words: frozenset[str]
+    off_words: frozenset[str]
+    toggle_words: frozenset[str]
+    filler_words: frozenset[str]
+    light_words: frozenset[str]
+    replies: dict[str, str]
+    # words that are only filler as the verb, the first word, like "switch on
+    # the lamp" but not "the office switch"
+    verb_words: frozenset[str] = frozenset()
+    # words that only turn on as the last word, like "schakel de lamp in" but
+    # not "de lamp in de keuken"
+    final_on_words: frozenset[str] = frozenset()
+
+
+ENGLISH = Grammar(
+    on_words=frozenset({"on"}),
+    off_words=frozenset({"off"}),
+    toggle_words=frozenset({"toggle"}),
+    filler_words=frozenset(
+        {"turn", "set", "dim", "to", "the", "please", "all", "in", "at"}
+    ),
+    light_words=frozenset({"light", "lights", "lamp", "lamps"}),
+    replies={
+        "turn_on": "Turned on the {target}.",
+        "turn_off": "Turned off the {target}.",
+        "toggle": "Toggled the {target}.",
+        "brightness": "Set the {target} to {percentage}%.",
+    },
+    verb_words=frozenset({"switch"}),
+)
+
+DUTCH = Grammar(
+    on_words=frozenset({"aan"}),
+    off_words=frozenset({"uit"}),
+    toggle_words=frozenset({"toggle", "wissel"}),
+    filler_words=frozenset(
+        {
+            "zet",
+            "doe",
+            "schakel",
+            "dim",
+            "op",
+            "naar",
+            "de",
+            "het",
+            "alle",
+            "graag",
+            "in",
+        }
+    ),
+    light_words=frozenset({"licht", "lichten", "lamp", "lampen", "verlichting"}),
+    replies={
+        "turn_on": "{target} aangezet.",
+        "turn_off": "{target} uitgezet.",
+        "toggle": "{target} omgeschakeld.",
+        "brightness": "{target} op {percentage}% gezet.",
+    },
+    final_on_words=frozenset({"in"}),
+)
+
+
+@dataclass
+class FastPathMatch:
+    """A command resolved without calling OpenAI."""
+
+    service: str
+    entity_ids: list[str]
+    service_data: dict[str, Any] = field(default_factory=dict)
+    reply: str = ""
+
+
+class FastPathMatcher:
+    """Deterministic matcher for simple on, off, toggle and dim commands."""
+
+    def __init__(self, catalog: EntityCatalog) -> None:
+        """Initialize the matcher."""
+        self.catalog = catalog
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, text: str, language: str) -> FastPathMatch | None:
+        """Resolve an utterance, or return None if it is not unambiguous."""
+        grammar = DUTCH if language == "nl" else ENGLISH
+        result = self._match(text, grammar)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        _LOGGER.debug(
+            "Fast path %s (hits: %s, misses: %s)",
+            "hit" if result else "miss",
+            self.hits,
+            self.misses,
+        )
+        return result
+
+    def _match(self, text: str, grammar: Grammar) -> FastPathMatch | None:
+        """Resolve an utterance against a grammar."""
+        text = text.lower()
+        percentage: int | None = None
+        if match := _PERCENTAGE_RE.search(text):
+            percentage = int(match.group(1))
+            if percentage > 100:
+                return None
+            text = text[: match.start()] + text[match.end() :]
+
+        words = _WORD_RE.findall(text)
+        services = set()
+        target: list[str] = []
+        for index, word in enumerate(words):
+            if word in grammar.on_words or (
+                index == len(words) - 1 and word in grammar.final_on_words
+            ):
+                services.add("turn_on")
+            elif word in grammar.off_words:
+                services.add("turn_off")
+            elif word in grammar.toggle_words:
+                services.add("toggle")
+            elif word in grammar.filler_words or (
+                index == 0 and word in grammar.verb_words
+            ):
+                continue
+            else:
+                target.append(word)
+
+        if percentage is not None:
+            if services - {"turn_on"}:
+                return None
+            services = {"turn_on"}
+        if len(services) != 1 or not target:
+            return None
+        service = services.pop()
+
+        entity_ids = self._resolve(target, grammar, percentage is not None)
+        if not entity_ids or any(
+            service not in self.catalog.entities[entity_id].services
+            for entity_id in entity_ids
+        ):
+            return None
+
+        service_data: dict[str, Any] = {}
+        reply_key = service
+        if percentage is not None:
+            service_data["brightness_pct"] = percentage
+            reply_key = "brightness"
+
+        reply = grammar.replies[reply_key].format(
+            target=" ".join(target), percentage=percentage
+        )
+        return FastPathMatch(
+            service=service,
+            entity_ids=entity_ids,
+            service_data=service_data,
+            reply=reply[:1].upper() + reply[1:],
+        )
+
+    def _resolve(
+        self, target: list[str], grammar: Grammar, lights_only: bool
+    ) -> list[str] | None:
+        """Resolve the target words to entity ids."""
+        phrase = " ".join(target)
+        stripped = " ".join(word for word in target if word not in grammar.light_words)
+        lights_only = lights_only or stripped != phrase
+        entities = [
+            entity
+            for entity in self.catalog.entities.values()
+            if entity.domain in FAST_PATH_DOMAINS
+        ]
+
+        # an entity mentioned by its name, alias or object id
+        named = [
+            entity.entity_id
+            for entity in entities
+            if phrase in _names(entity.entity_id, entity.name, entity.aliases)
+        ]
+        if len(named) == 1:
+            return named
+        if named:
+            return None
+
+        if not stripped:
+            return None
+
+        # a room mentioned by name
+        in_area = [
+            entity.entity_id
+            for entity in entities
+            if entity.area
+            and entity.area.lower() == stripped
+            and (not lights_only or entity.domain == "light")
+        ]
+        if in_area:
+            return in_area
+
+        named = [
+            entity.entity_id
+            for entity in entities
+            if stripped in _names(entity.entity_id, entity.name, entity.aliases)
+            and (not lights_only or entity.domain == "light")
+        ]
+        if len(named) == 1:
+            return named
+        return None
+
+
+def _names(entity_id: str, name: str | None, aliases: list[str]) -> set[str]:
+    """Return the lower case names an entity can be referred to by."""
+    names = {entity_id.split(".", 1)[-1].replace("_", " ")}
+    if name:
+        names.add(" ".join(_WORD_RE.findall(name.lower())))
+    names.update(" ".join(_WORD_RE.findall(alias.lower())) for alias in aliases)
+    return names
@@ -0,0 +1,80 @@
+"""Conversation history for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import time
+
+
+@dataclass(frozen=True)
+class Turn:
+    """A single exchange, without the rendered prompt."""
+
+    text: str
+    reply: str
+    actions: tuple[str, ...] = ()
+
+
+class Conversation:
+    """The last turns of a single conversation."""
+
+    __slots__ = ("turns", "last_used")
+
+    def __init__(self, max_turns: int) -> None:
+        """Initialize the conversation."""
+        self.turns: deque[Turn] = deque(maxlen=max_turns)
+        self.last_used = time.monotonic()
+
+
+class ConversationHistory:
+    """Bounded store of conversations keyed by conversation id.
+
+    Only the user text and the compact action/reply of each turn are kept.
+    The store holds at most max_conversations conversations of at most
+    max_turns turns, and drops conversations idle for longer than ttl seconds.
+    """
+
+    def __init__(self, max_conversations: int, max_turns: int, ttl: float) -> None:
+        """Initialize the history."""
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of stored conversations."""
+        return len(self._conversations)
+
+    def __contains__(self, conversation_id: object) -> bool:
+        """Return True if a conversation is stored and not expired."""
+        self._evict_expired()
+        return conversation_id in self._conversations
+
+    def turns(self, conversation_id: str) -> list[Turn]:
+        """Return the stored turns of a conversation."""
+        if (conv := self._conversations.get(conversation_id)) is None:
+            return []
+        return list(conv.turns)
+
+    def append(self, conversation_id: str, turn: Turn) -> None:
+        """Add a turn to a conversation, starting it if needed."""
+        conv = self._conversations.get(conversation_id)
+        if conv is None:
+            conv = self._conversations[conversation_id] = Conversation(self.max_turns)
+        conv.turns.append(turn)
+        conv.last_used = time.monotonic()
+        self._conversations.move_to_end(conversation_id)
+
+        self._evict_expired()
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    def _evict_expired(self) -> None:
+        """Drop conversations that have been idle for longer than the ttl."""
+        deadline = time.monotonic() - self.ttl
+        # conversations are ordered by last use, the oldest come first
+        while self._conversations:
+            conv = next(iter(self._conversations.values()))
+            if conv.last_used >= deadline:
+                break
+            self._conversations.popitem(last=False)
@@ -0,0 +1,230 @@
+"""Language and mode strategies of the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+import logging
+from string import Template
+from typing import Any
+
+from .actions import Action, parse_entity
+from .const import (
+    COLOR_ENTITY_FORMAT,
+    COLOR_PROMPT_TEMPLATE,
+    COMPACT_COLOR_ENTITY_FORMAT,
+    COMPACT_ENTITY_FORMAT,
+    DELTA_STATE_FORMAT,
+    CONF_DELTA_STATE,
+    CONF_ENTITY_FORMAT,
+    CONF_PROMPT_LAYOUT,
+    CONF_RESPONSE_FORMAT,
+    DEFAULT_DELTA_STATE,
+    DEFAULT_ENTITY_FORMAT,
+    DEFAULT_PROMPT_LAYOUT,
+    DEFAULT_RESPONSE_FORMAT,
+    DUTCH_COLOR_ENTITY_FORMAT,
+    DUTCH_COLOR_PROMPT_TEMPLATE,
+    DUTCH_DELTA_STATE_FORMAT,
+    DUTCH_COMPACT_COLOR_ENTITY_FORMAT,
+    DUTCH_COMPACT_ENTITY_FORMAT,
+    DUTCH_ENTITY_FORMAT,
+    DUTCH_FIELDS_FORMAT,
+    DUTCH_PREFIX_COLOR_ENTITY_FORMAT,
+    DUTCH_PREFIX_COMPACT_COLOR_ENTITY_FORMAT,
+    DUTCH_PREFIX_COMPACT_ENTITY_FORMAT,
+    DUTCH_PREFIX_ENTITY_FORMAT,
+    DUTCH_PROMPT_TEMPLATE,
+    DUTCH_TOOLS_PROMPT_TEMPLATE,
+    DUTCH_TOOLS_REPLY,
+    ENTITY_FORMAT,
+    FIELDS_FORMAT,
+    LANGUAGE_AND_MODE,
+    PREFIX_COLOR_ENTITY_FORMAT,
+    PREFIX_COMPACT_COLOR_ENTITY_FORMAT,
+    PREFIX_COMPACT_ENTITY_FORMAT,
+    PREFIX_ENTITY_FORMAT,
+    PROMPT_TEMPLATE,
+    TEST_PROMPT_TEMPLATE,
+    TOOLS_PROMPT_TEMPLATE,
+    TOOLS_REPLY,
+)
+from .domains import DomainRegistry
+from .tools import build_tools
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Mode:
+    """Everything that depends on the language and mode option.
+
+    Resolved once when the options change instead of on every utterance.
+    """
+
+    name: str | None
+    # language of the fast path grammar, None when the fast path is unavailable
+    language: str | None
+    color: bool
+    compact: bool
+    prompt_template: Template
+    entity_format: str
+    # only send brightness and color of the entities the utterance is about
+    delta_state: bool = False
+    # tools sent with every request, None when the reply is free-form JSON
+    tools: list[dict[str, Any]] | None = None
+    # reply when the model only returned tool calls
+    tools_reply: str = TOOLS_REPLY
+    # the states follow the entity list and instructions, the utterance comes last
+    prefix_cache: bool = False
+
+    def render(self, entities: str, prompt: str, states: str = "") -> str:
+        """Render the user message with the entity list and the utterance."""
+        return self.prompt_template.substitute(
+            entities=entities, prompt=prompt, format=self.entity_format, states=states
+        )
+
+    def parse_entity(self, entity: dict[str, Any]) -> Action:
+        """Convert an entry of the "entities" array to an action.
+
+        Raises KeyError when the id or action is missing and TypeError when
+        the entry is malformed.
+        """
+        return parse_entity(entity, self.color)
+
+
+def _describe_fields(domains: DomainRegistry) -> str:
+    """Return the service data fields of the available services."""
+    described = []
+    for domain in domains.domains:
+        for service in domains.services(domain):
+            for name, schema in domains.fields(domain, service).items():
+                description = f'{service} "{name}"'
+                if "enum" in schema:
+                    description += f" ({'/'.join(schema['enum'])})"
+                elif "minimum" in schema and "maximum" in schema:
+                    description += f" ({schema['minimum']}-{schema['maximum']})"
+                if description not in described:
+                    described.append(description)
+    return ", ".join(described)
+
+
+def _prefix_layout(template: str) -> str:
+    """Move the prompt of a template to the end, after the entity states.
+
+    Everything before the states is the same for consecutive requests, so
+    the provider can cache that prefix.
+    """
+    prompt = 'Prompt: "$prompt"\n\n'
+    assert prompt in template
+    template = template.replace(prompt, "", 1).rstrip()
+    return f'{template}\n\nStates:\n$states\nPrompt: "$prompt"\n'
+
+
+def resolve_mode(options: Mapping[str, Any], domains: DomainRegistry) -> Mode:
+    """Resolve the mode from the language and mode and format options."""
+    name = options.get(LANGUAGE_AND_MODE)
+    mode = name or ""
+    color = "color" in mode
+    compact = options.get(CONF_ENTITY_FORMAT, DEFAULT_ENTITY_FORMAT) == "compact"
+    use_tools = options.get(CONF_RESPONSE_FORMAT, DEFAULT_RESPONSE_FORMAT) == "tools"
+    # brightness and color are only part of the entity list in the color modes
+    delta_state = color and options.get(CONF_DELTA_STATE, DEFAULT_DELTA_STATE)
+    prefix_cache = (
+        options.get(CONF_PROMPT_LAYOUT, DEFAULT_PROMPT_LAYOUT) == "prefix_cache"
+    )
+
+    if "English" in mode:
+        language = "en"
+        prompt_template = COLOR_PROMPT_TEMPLATE if color else PROMPT_TEMPLATE
+    elif "Dutch" in mode:
+        language = "nl"
+        prompt_template = DUTCH_COLOR_PROMPT_TEMPLATE if color else DUTCH_PROMPT_TEMPLATE
+    elif mode == "Test":
+        language = None
+        prompt_template = TEST_PROMPT_TEMPLATE
+    else:
+        _LOGGER.warning("Unknown language or mode %s, using the default mode", name)
+        language = None
+        prompt_template = PROMPT_TEMPLATE
+
+    if prefix_cache:
+        # the entity list leaves out the state, which is listed separately
+        if language == "nl" and compact:
+            entity_format = (
+                DUTCH_PREFIX_COMPACT_COLOR_ENTITY_FORMAT
+                if color
+                else DUTCH_PREFIX_COMPACT_ENTITY_FORMAT
+            )
+        elif language == "nl":
+            entity_format = (
+                DUTCH_PREFIX_COLOR_ENTITY_FORMAT
+                if color
+                else DUTCH_PREFIX_ENTITY_FORMAT
+            )
+        elif compact:
+            entity_format = (
+                PREFIX_COMPACT_COLOR_ENTITY_FORMAT
+                if color
+                else PREFIX_COMPACT_ENTITY_FORMAT
+            )
+        else:
+            entity_format = (
+                PREFIX_COLOR_ENTITY_FORMAT if color else PREFIX_ENTITY_FORMAT
+            )
+    elif language == "nl":
+        if compact:
+            entity_format = (
+                DUTCH_COMPACT_COLOR_ENTITY_FORMAT if color else DUTCH_COMPACT_ENTITY_FORMAT
+            )
+        else:
+            entity_format = DUTCH_COLOR_ENTITY_FORMAT if color else DUTCH_ENTITY_FORMAT
+    elif compact:
+        entity_format = COMPACT_COLOR_ENTITY_FORMAT if color else COMPACT_ENTITY_FORMAT
+    else:
+        entity_format = COLOR_ENTITY_FORMAT if color else ENTITY_FORMAT
+
+    # tools describe their fields themselves
+    if not use_tools and (fields := _describe_fields(domains)):
+        entity_format += " " + Template(
+            DUTCH_FIELDS_FORMAT if language == "nl" else FIELDS_FORMAT
+        ).substitute(fields=fields)
+
+    if delta_state:
+        entity_format += " " + (
+            DUTCH_DELTA_STATE_FORMAT if language == "nl" else DELTA_STATE_FORMAT
+        )
+
+    if not use_tools:
+        _LOGGER.info("Mode: %s", name)
+        if prefix_cache:
+            prompt_template = _prefix_layout(prompt_template)
+        return Mode(
+            name,
+            language,
+            color,
+            compact,
+            Template(prompt_template),
+            entity_format,
+            delta_state,
+            prefix_cache=prefix_cache,
+        )
+
+    # the tool definitions replace the JSON template instructions of the prompt
+    _LOGGER.info("Mode: %s with tool calls", name)
+    prompt_template = (
+        DUTCH_TOOLS_PROMPT_TEMPLATE if language == "nl" else TOOLS_PROMPT_TEMPLATE
+    )
+    if prefix_cache:
+        prompt_template = _prefix_layout(prompt_template)
+    return Mode(
+        name,
+        language,
+        color,
+        compact,
+        Template(prompt_template),
+        entity_format,
+        delta_state,
+        build_tools(domains, color),
+        DUTCH_TOOLS_REPLY if language == "nl" else TOOLS_REPLY,
+        prefix_cache,
+    )
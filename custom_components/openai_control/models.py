@@ -0,0 +1,76 @@
+"""Cached model list and API key validation of the OpenAI Control integration."""
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .client import OpenAIClient
+from .const import DOMAIN, MODELS_STORAGE_VERSION, MODELS_TTL
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f"{DOMAIN}.models"
+
+
+def _key_id(api_key: str) -> str:
+    """Return the id an API key is stored under, the key itself is never stored."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class ModelCache:
+    """The models available to an API key, cached in Home Assistant storage.
+
+    A validated model list stays fresh for MODELS_TTL seconds, so a restart
+    doesn't have to wait for OpenAI. The storage file is shared by the config
+    flow and all config entries, keyed by a hash of the API key.
+    """
+
+    def __init__(self, hass: HomeAssistant, api_key: str) -> None:
+        """Initialize the model cache."""
+        self._store: Store[dict[str, Any]] = Store(
+            hass, MODELS_STORAGE_VERSION, STORAGE_KEY
+        )
+        self._key = _key_id(api_key)
+        self.models: list[str] = []
+        # wall clock time of the last successful validation, it survives restarts
+        self.validated_at: float | None = None
+        # why the last validation failed, None when it succeeded
+        self.error: str | None = None
+
+    @property
+    def is_fresh(self) -> bool:
+        """Return True if the key was validated less than MODELS_TTL ago."""
+        return (
+            self.validated_at is not None
+            and time.time() - self.validated_at < MODELS_TTL
+        )
+
+    def chat_models(self) -> list[str]:
+        """Return the cached models that support chat completions."""
+        return [model for model in self.models if model.startswith("gpt-")]
+
+    async def async_load(self) -> None:
+        """Load the cached model list of the API key."""
+        data = await self._store.async_load() or {}
+        if (cached := data.get(self._key)) is not None:
+            self.models = cached["models"]
+            self.validated_at = cached["validated_at"]
+
+    async def async_validate(self, client: OpenAIClient) -> None:
+        """Validate the API key by listing its models and store the list.
+
+        Raises the OpenAIError of the request, the cached list is kept then.
+        """
+        self.models = sorted(await client.async_list_models())
+        self.validated_at = time.time()
+        self.error = None
+        _LOGGER.debug("Available models: %s", self.models)
+
+        data = await self._store.async_load() or {}
+        data[self._key] = {"models": self.models, "validated_at": self.validated_at}
+        await self._store.async_save(data)
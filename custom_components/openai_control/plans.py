@@ -0,0 +1,250 @@
+"""Learned command plans of the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections.abc import Container
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher, get_close_matches
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .actions import Action
+from .cache import normalize_text
+from .const import (
+    DOMAIN,
+    PLAN_FILLER_WORDS,
+    PLAN_TYPO_MIN_LENGTH,
+    PLANS_MAX_SIZE,
+    PLANS_SAVE_DELAY,
+    PLANS_STORAGE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Plan:
+    """The actions and reply an utterance was resolved to."""
+
+    actions: list[Action]
+    reply: str
+    # times in a row the utterance was resolved to these actions
+    repeats: int
+    # wall clock time the plan was last recorded or served
+    last_used: float
+
+
+def _plan_actions(actions: list[Action]) -> list[Action]:
+    """Return actions in the order they are compared and stored in."""
+    return sorted(actions, key=lambda action: (action.entity_id, action.service))
+
+
+def _similar_words(word: str, other: str) -> bool:
+    """Return True if two words only differ by a typo.
+
+    A typo is a single changed, added, left out or swapped character in a word
+    of at least PLAN_TYPO_MIN_LENGTH characters. Words that only differ by an
+    ending, like "light" and "lights", name different things and numbers have
+    to match exactly, "10" and "100" are different commands.
+    """
+    if word == other:
+        return True
+    if len(word) > len(other):
+        word, other = other, word
+    if (
+        len(word) < PLAN_TYPO_MIN_LENGTH
+        or len(other) - len(word) > 1
+        or any(char.isdigit() for char in word + other)
+    ):
+        return False
+
+    if len(word) < len(other):
+        # an added character at the start or end changes the word, not a typo
+        if other.startswith(word) or other.endswith(word):
+            return False
+        return any(
+            other[:index] + other[index + 1 :] == word for index in range(len(other))
+        )
+
+    changed = [
+        index
+        for index, (char, other_char) in enumerate(zip(word, other))
+        if char != other_char
+    ]
+    if len(changed) == 1:
+        return True
+    # two neighbouring characters swapped
+    return (
+        len(changed) == 2
+        and changed[1] == changed[0] + 1
+        and word[changed[0]] == other[changed[1]]
+        and word[changed[1]] == other[changed[0]]
+    )
+
+
+def _similar(text: str, other: str) -> bool:
+    """Return True if two normalized utterances ask for the same thing.
+
+    The utterances are compared word by word, so "turn on" never matches
+    "turn off" the way a character comparison would. Longer words may differ
+    by a typo, and filler words like "please" may be added or left out.
+    """
+    words, other_words = text.split(), other.split()
+    matcher = SequenceMatcher(None, words, other_words, autojunk=False)
+    for tag, start, end, other_start, other_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        changed, other_changed = words[start:end], other_words[other_start:other_end]
+        if tag == "replace" and len(changed) == len(other_changed):
+            if all(
+                _similar_words(word, other_word)
+                or {word, other_word} <= PLAN_FILLER_WORDS
+                for word, other_word in zip(changed, other_changed)
+            ):
+                continue
+        if not {*changed, *other_changed} <= PLAN_FILLER_WORDS:
+            return False
+    return True
+
+
+class PlanStore:
+    """Utterances and the actions OpenAI resolved them to, kept across restarts.
+
+    Every utterance OpenAI resolves to actions is recorded. Once it has been
+    resolved to the same actions `repeats` times in a row, the plan is
+    promoted and served locally, also for utterances that differ only by a
+    typo or a filler word. Plans are dropped when an entity they act on is
+    removed or no longer exposed.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, repeats: int) -> None:
+        """Initialize the plan store."""
+        self.repeats = repeats
+        self._store: Store[dict[str, Any]] = Store(
+            hass, PLANS_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.plans"
+        )
+        self._plans: dict[str, Plan] = {}
+
+    def __len__(self) -> int:
+        """Return the number of recorded plans."""
+        return len(self._plans)
+
+    @property
+    def promoted(self) -> int:
+        """Return the number of plans that are served locally."""
+        return sum(1 for plan in self._plans.values() if self._is_promoted(plan))
+
+    async def async_load(self) -> None:
+        """Load the plans recorded before the last restart."""
+        data = await self._store.async_load() or {}
+        self._plans = {
+            text: Plan(
+                [Action(**action) for action in plan["actions"]],
+                plan["reply"],
+                plan["repeats"],
+                plan["last_used"],
+            )
+            for text, plan in data.get("plans", {}).items()
+        }
+
+    def match(self, text: str, entity_ids: Container[str]) -> Plan | None:
+        """Return the promoted plan of an utterance or one close to it.
+
+        Plans acting on an entity that is not in entity_ids, for example
+        because it has no state yet after a restart, are not served.
+        """
+        if self.repeats <= 0:
+            return None
+
+        text = normalize_text(text)
+        promoted = [
+            key for key, plan in self._plans.items() if self._is_promoted(plan)
+        ]
+        if text in promoted:
+            matches = [text]
+        else:
+            matches = [
+                key
+                for key in get_close_matches(text, promoted, n=3, cutoff=0.6)
+                if _similar(text, key)
+            ]
+
+        for key in matches:
+            plan = self._plans[key]
+            if all(action.entity_id in entity_ids for action in plan.actions):
+                _LOGGER.debug("Serving the plan of %s for %s", key, text)
+                plan.last_used = time.time()
+                self._async_schedule_save()
+                return plan
+        return None
+
+    @callback
+    def async_record(self, text: str, actions: list[Action], reply: str) -> None:
+        """Record the actions OpenAI resolved an utterance to."""
+        if self.repeats <= 0 or not actions:
+            return
+
+        text = normalize_text(text)
+        actions = _plan_actions(actions)
+        plan = self._plans.pop(text, None)
+        if plan is not None and plan.actions == actions:
+            plan.repeats += 1
+            plan.reply = reply
+            plan.last_used = time.time()
+            if plan.repeats == self.repeats:
+                _LOGGER.info("Learned the plan of %s: %s", text, actions)
+        else:
+            plan = Plan(actions, reply, 1, time.time())
+        self._plans[text] = plan
+
+        while len(self._plans) > PLANS_MAX_SIZE:
+            oldest = min(self._plans, key=lambda key: self._plans[key].last_used)
+            del self._plans[oldest]
+        self._async_schedule_save()
+
+    @callback
+    def async_invalidate(self, entity_id: str) -> None:
+        """Drop the plans acting on an entity."""
+        invalid = [
+            text
+            for text, plan in self._plans.items()
+            if any(action.entity_id == entity_id for action in plan.actions)
+        ]
+        for text in invalid:
+            _LOGGER.debug("Dropping the plan of %s, %s is gone", text, entity_id)
+            del self._plans[text]
+        if invalid:
+            self._async_schedule_save()
+
+    @callback
+    def async_clear(self) -> None:
+        """Drop all plans."""
+        self._plans = {}
+        self._async_schedule_save()
+
+    def _is_promoted(self, plan: Plan) -> bool:
+        """Return True if a plan was resolved the same often enough."""
+        return self.repeats > 0 and plan.repeats >= self.repeats
+
+    @callback
+    def _async_schedule_save(self) -> None:
+        """Save the plans after a delay, so bursts of changes are written once."""
+        self._store.async_delay_save(self._data_to_save, PLANS_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the plans to store."""
+        return {
+            "plans": {
+                text: {
+                    "actions": [asdict(action) for action in plan.actions],
+                    "reply": plan.reply,
+                    "repeats": plan.repeats,
+                    "last_used": plan.last_used,
+                }
+                for text, plan in self._plans.items()
+            }
+        }
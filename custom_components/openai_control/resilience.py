@@ -0,0 +1,300 @@
+"""Retries, hedging, model fallback and circuit breaking of OpenAI calls."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass
+import logging
+import random
+import time
+from typing import Any
+
+import async_timeout
+from openai import error
+
+from .client import OpenAIClient
+from .scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+from .stats import Metrics
+from .tokens import count_message_tokens
+
+_LOGGER = logging.getLogger(__name__)
+
+# base and maximum of the exponential backoff between retries in seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+# number of OpenAI requests timed before the p95 is used as hedging delay
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(error.OpenAIError):
+    """Error raised while the circuit breaker is open."""
+
+
+@dataclass
+class CallPolicy:
+    """How a single completion is retried, hedged and falls back."""
+
+    # total time for all attempts in seconds
+    deadline: float
+    max_retries: int
+    hedge: bool
+    fallback_model: str | None = None
+    priority: int = PRIORITY_INTERACTIVE
+    # estimated prompt tokens, counted from the messages when not known
+    tokens: int | None = None
+
+
+class CircuitBreaker:
+    """Stop calling the API after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and calls
+    are rejected for reset_timeout seconds. The first call after that is let
+    through, it closes the breaker when it succeeds and opens it again when it
+    fails.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        """Initialize the circuit breaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        """Return closed, open or half_open."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Return True if a call may be made."""
+        if self.state != "half_open":
+            return self.state == "closed"
+        # let a single probe through until it succeeds or fails
+        self._opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the breaker at the threshold."""
+        self.failures += 1
+        if self.failure_threshold > 0 and self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                _LOGGER.warning(
+                    "OpenAI failed %s times in a row, pausing calls for %s seconds",
+                    self.failures,
+                    self.reset_timeout,
+                )
+            self._opened_at = time.monotonic()
+
+
+def _is_retryable(err: error.OpenAIError) -> bool:
+    """Return True if a call that failed with err may succeed when retried."""
+    if isinstance(
+        err,
+        (
+            error.RateLimitError,
+            error.ServiceUnavailableError,
+            error.Timeout,
+            error.APIConnectionError,
+            error.TryAgain,
+        ),
+    ):
+        return True
+    return (err.http_status or 0) >= 500
+
+
+def _backoff(attempt: int, err: error.OpenAIError) -> float:
+    """Return the jittered delay before a retry."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+    # rate limit errors tell how long to wait
+    try:
+        retry_after = float(err.headers.get("retry-after", 0))
+    except ValueError:
+        retry_after = 0
+    return max(delay, min(retry_after, BACKOFF_MAX))
+
+
+class ResilientClient:
+    """Chat completions with a deadline, retries, hedging and model fallback.
+
+    Every attempt waits for its turn in the scheduler, the wait counts
+    towards the deadline.
+    """
+
+    def __init__(
+        self,
+        client: OpenAIClient,
+        breaker: CircuitBreaker,
+        scheduler: RequestScheduler,
+        metrics: Metrics,
+    ) -> None:
+        """Initialize the resilient client."""
+        self.client = client
+        self.breaker = breaker
+        self.scheduler = scheduler
+        self.metrics = metrics
+
+    async def async_chat_completion(self, policy: CallPolicy, **kwargs: Any) -> Any:
+        """Create a chat completion according to a call policy.
+
+        Raises CircuitOpenError without calling OpenAI while the breaker is
+        open, error.Timeout when the deadline passes and the last error when
+        all attempts failed.
+        """
+        return await self._async_call(policy, self._async_hedged, **kwargs)
+
+    async def async_stream_chat_completion(
+        self, policy: CallPolicy, on_content: Callable[[str], None], **kwargs: Any
+    ) -> None:
+        """Stream a chat completion according to a call policy.
+
+        on_content is called with each piece of content as it arrives. Raises
+        like async_chat_completion, but streams are not hedged and an attempt
+        is only retried or sent to the fallback model while none of its
+        content has arrived, the caller may already have acted on it.
+        """
+        received = False
+
+        async def async_attempt(policy: CallPolicy, **kwargs: Any) -> None:
+            nonlocal received
+            async with self._async_slot(policy, kwargs):
+                async for chunk in self.client.async_stream_chat_completion(**kwargs):
+                    if content := chunk["choices"][0]["delta"].get("content"):
+                        received = True
+                        on_content(content)
+
+        await self._async_call(policy, async_attempt, lambda: not received, **kwargs)
+
+    async def _async_call(
+        self,
+        policy: CallPolicy,
+        attempt: Callable[..., Awaitable[Any]],
+        retryable: Callable[[], bool] = lambda: True,
+        **kwargs: Any,
+    ) -> Any:
+        """Make the attempts of a call within the deadline and circuit breaker."""
+        if not self.breaker.allow():
+            self.metrics.increment("circuit_open_rejections")
+            raise CircuitOpenError("OpenAI is unavailable, try again later")
+
+        models = [kwargs.pop("model")]
+        if policy.fallback_model and policy.fallback_model != models[0]:
+            models.append(policy.fallback_model)
+
+        try:
+            async with async_timeout.timeout(policy.deadline):
+                result = await self._async_attempts(
+                    policy, models, attempt, retryable, **kwargs
+                )
+        except asyncio.TimeoutError as err:
+            self.breaker.record_failure()
+            raise error.Timeout("OpenAI did not answer in time") from err
+        except error.OpenAIError as err:
+            if _is_retryable(err):
+                self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    async def _async_attempts(
+        self,
+        policy: CallPolicy,
+        models: list[str],
+        attempt: Callable[..., Awaitable[Any]],
+        retryable: Callable[[], bool],
+        **kwargs: Any,
+    ) -> Any:
+        """Try each model with retries until one of the attempts succeeds."""
+        last_error: error.OpenAIError | None = None
+        for model in models:
+            if last_error is not None:
+                _LOGGER.warning("Falling back to %s: %s", model, last_error)
+                self.metrics.increment("fallback_model_requests")
+
+            for retry in range(policy.max_retries + 1):
+                try:
+                    return await attempt(policy, model=model, **kwargs)
+                except error.OpenAIError as err:
+                    if not _is_retryable(err) or not retryable():
+                        raise
+                    last_error = err
+                if retry < policy.max_retries:
+                    self.metrics.increment("retries")
+                    await asyncio.sleep(_backoff(retry, last_error))
+
+        assert last_error is not None
+        raise last_error
+
+    async def _async_hedged(self, policy: CallPolicy, **kwargs: Any) -> Any:
+        """Create a completion, sending a second request if the first is slow.
+
+        The hedged request is sent once the first one takes longer than the
+        p95 latency of earlier calls, the first answer wins.
+        """
+        delay = self._hedge_delay() if policy.hedge else None
+        if delay is None:
+            return await self._async_scheduled(policy, **kwargs)
+
+        pending = {asyncio.ensure_future(self._async_scheduled(policy, **kwargs))}
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            self.metrics.increment("hedged_requests")
+            pending.add(asyncio.ensure_future(self._async_scheduled(policy, **kwargs)))
+
+        try:
+            while True:
+                for task in done:
+                    if (err := task.exception()) is None:
+                        return task.result()
+                if not pending:
+                    raise err
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _async_slot(
+        self, policy: CallPolicy, kwargs: dict[str, Any]
+    ) -> AbstractAsyncContextManager[None]:
+        """Return the scheduler slot of a request.
+
+        The tokens per minute limit counts the prompt and the maximum reply.
+        """
+        tokens = policy.tokens
+        if tokens is None:
+            tokens = count_message_tokens(kwargs["messages"], kwargs["model"])
+        return self.scheduler.async_slot(
+            policy.priority, tokens + kwargs.get("max_tokens", 0)
+        )
+
+    async def _async_scheduled(self, policy: CallPolicy, **kwargs: Any) -> Any:
+        """Create a completion once the scheduler lets the request through.
+
+        The latency of each successful request is recorded without the time it
+        waited in the queue, it is what the hedging delay is derived from.
+        """
+        async with self._async_slot(policy, kwargs):
+            start = time.perf_counter()
+            result = await self.client.async_chat_completion(**kwargs)
+            self.metrics.stages["attempt"].observe((time.perf_counter() - start) * 1000)
+            return result
+
+    def _hedge_delay(self) -> float | None:
+        """Return the p95 latency of single OpenAI requests in seconds, if known."""
+        histogram = self.metrics.stages["attempt"]
+        if histogram.count < HEDGE_MIN_SAMPLES:
+            return None
+        return histogram.percentile(95) / 1000
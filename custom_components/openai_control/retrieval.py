@@ -0,0 +1,303 @@
+"""Local relevance pre-filter for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections import defaultdict
+import math
+import re
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# tokens shorter than this are ignored, they match nearly everything
+MIN_TOKEN_LENGTH = 3
+
+# minimum share of a token's trigrams that has to be present in an entity
+MIN_COVERAGE = 0.6
+
+NGRAM_SIZE = 3
+
+# command words that say nothing about which entity is meant
+STOPWORDS = {
+    "all",
+    "and",
+    "please",
+    "set",
+    "the",
+    "turn",
+    "off",
+    "alle",
+    "doe",
+    "een",
+    "het",
+    "uit",
+    "van",
+    "zet",
+}
+
+# words that ask for every entity, the full entity list is sent for them
+QUANTIFIERS = {
+    "all",
+    "every",
+    "everything",
+    "everywhere",
+    "alle",
+    "alles",
+    "elke",
+    "iedere",
+    "overal",
+}
+QUANTIFIER_PHRASES = ("whole house", "entire house", "hele huis")
+
+# words that only name a domain, entity names often contain them as well
+DOMAIN_WORDS = {
+    "light",
+    "lights",
+    "lamp",
+    "lamps",
+    "switch",
+    "switches",
+    "fan",
+    "fans",
+    "cover",
+    "covers",
+    "blind",
+    "blinds",
+    "thermostat",
+    "licht",
+    "lichten",
+    "lampen",
+    "schakelaar",
+    "schakelaars",
+    "ventilator",
+    "rolluik",
+    "rolluiken",
+}
+
+# words that ask for a brightness or color change
+ATTRIBUTE_WORDS = {
+    "dim",
+    "dark",
+    "cozy",
+    "cosy",
+    "warm",
+    "warmer",
+    "cool",
+    "cooler",
+    "red",
+    "green",
+    "blue",
+    "yellow",
+    "orange",
+    "purple",
+    "pink",
+    "white",
+    "dimmen",
+    "fel",
+    "feller",
+    "koel",
+    "rood",
+    "groen",
+    "blauw",
+    "geel",
+    "oranje",
+    "paars",
+    "roze",
+    "wit",
+}
+
+# word stems that ask for a brightness or color change, like "brighter"
+ATTRIBUTE_STEMS = (
+    "bright",
+    "dimm",
+    "darke",
+    "colo",
+    "helder",
+    "donker",
+    "kleur",
+    "gezellig",
+    "sfeer",
+)
+
+_PERCENTAGE_RE = re.compile(r"\d\s*%|percent|procent")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a text in lower case word tokens."""
+    return [
+        token
+        for token in _TOKEN_RE.findall(text.lower())
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def query_tokens(text: str) -> list[str]:
+    """Split an utterance in tokens, dropping command words."""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def is_quantified(text: str) -> bool:
+    """Return True if an utterance asks for all entities, like "all the lights"."""
+    tokens = tokenize(text)
+    joined = " ".join(tokens)
+    return any(token in QUANTIFIERS for token in tokens) or any(
+        phrase in joined for phrase in QUANTIFIER_PHRASES
+    )
+
+
+def mentions_attributes(text: str) -> bool:
+    """Return True if an utterance asks for a brightness or color change."""
+    if _PERCENTAGE_RE.search(text.lower()):
+        return True
+    return any(
+        token in ATTRIBUTE_WORDS or token.startswith(ATTRIBUTE_STEMS)
+        for token in tokenize(text)
+    )
+
+
+def ngrams(token: str) -> set[str]:
+    """Return the character n-grams of a token."""
+    if len(token) <= NGRAM_SIZE:
+        return {token}
+    return {token[i : i + NGRAM_SIZE] for i in range(len(token) - NGRAM_SIZE + 1)}
+
+
+class EntityIndex:
+    """Token and n-gram inverted index over entity ids, names, aliases and areas."""
+
+    def __init__(self) -> None:
+        """Initialize the index."""
+        self._ngrams: dict[str, set[str]] = defaultdict(set)
+        self._entity_ngrams: dict[str, set[str]] = {}
+        self._areas: dict[str, set[str]] = defaultdict(set)
+        self._entity_area: dict[str, tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of indexed entities."""
+        return len(self._entity_ngrams)
+
+    def add(
+        self,
+        entity_id: str,
+        texts: list[str],
+        area: str | None = None,
+    ) -> None:
+        """Index an entity, replacing any previous entry."""
+        self.remove(entity_id)
+
+        # the room of an entity is usually part of the object id
+        texts = [entity_id.split(".", 1)[-1], *texts]
+        if area:
+            texts.append(area)
+
+        grams: set[str] = set()
+        for text in texts:
+            for token in tokenize(text):
+                grams |= ngrams(token)
+
+        self._entity_ngrams[entity_id] = grams
+        for gram in grams:
+            self._ngrams[gram].add(entity_id)
+
+        if area and (area_tokens := tuple(tokenize(area))):
+            self._entity_area[entity_id] = area_tokens
+            self._areas[" ".join(area_tokens)].add(entity_id)
+
+    def remove(self, entity_id: str) -> None:
+        """Remove an entity from the index."""
+        for gram in self._entity_ngrams.pop(entity_id, ()):
+            postings = self._ngrams[gram]
+            postings.discard(entity_id)
+            if not postings:
+                del self._ngrams[gram]
+
+        if (area_tokens := self._entity_area.pop(entity_id, None)) is not None:
+            key = " ".join(area_tokens)
+            self._areas[key].discard(entity_id)
+            if not self._areas[key]:
+                del self._areas[key]
+
+    def match(self, text: str, top_k: int) -> set[str] | None:
+        """Return the candidate entities for an utterance.
+
+        Returns the top_k best scoring entities plus every entity in a room
+        that is mentioned by name, or None when the full list should be used.
+        That is when no token in the utterance narrows down the entity list,
+        or when it asks for all entities outside a room it names, because
+        top_k would cut the list short.
+        """
+        if not self._entity_ngrams or top_k <= 0:
+            return None
+
+        scores, room_matches, confident = self._score(text)
+        if not confident or (is_quantified(text) and not room_matches):
+            return None
+
+        ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+        return set(ranked[:top_k]) | room_matches
+
+    def rank(self, text: str) -> list[str]:
+        """Return the entities matching an utterance, best match first.
+
+        Entities in a room that is mentioned by name come first.
+        """
+        scores, room_matches, _ = self._score(text)
+        return sorted(
+            scores.keys() | room_matches,
+            key=lambda entity_id: (entity_id not in room_matches, -scores[entity_id]),
+        )
+
+    def related(self, text: str) -> set[str]:
+        """Return the entities whose name or room is mentioned in an utterance.
+
+        Tokens that match most entities, like "light", are ignored.
+        """
+        scores, room_matches, _ = self._score(text, selective=True)
+        return set(scores) | room_matches
+
+    def _score(
+        self, text: str, selective: bool = False
+    ) -> tuple[dict[str, float], set[str], bool]:
+        """Score the entities against the tokens of an utterance.
+
+        Returns the scores, the entities in rooms mentioned by name and
+        whether any token narrows down the entity list. With selective only
+        the tokens that narrow down the list are scored.
+        """
+        total = len(self._entity_ngrams)
+        query = query_tokens(text)
+        scores: dict[str, float] = defaultdict(float)
+        confident = False
+
+        for token in query:
+            grams = ngrams(token)
+            hits: dict[str, int] = defaultdict(int)
+            for gram in grams:
+                for entity_id in self._ngrams.get(gram, ()):
+                    hits[entity_id] += 1
+
+            matched = {
+                entity_id: count / len(grams)
+                for entity_id, count in hits.items()
+                if count / len(grams) >= MIN_COVERAGE
+            }
+            if not matched:
+                continue
+
+            # tokens like "light" that match most entities carry little weight,
+            # a domain word never narrows the list down, it may match the
+            # names of only a few of the entities of its domain
+            if len(matched) <= total / 2 and token not in DOMAIN_WORDS:
+                confident = True
+            elif selective:
+                continue
+            weight = math.log(1 + total / len(matched))
+            for entity_id, coverage in matched.items():
+                scores[entity_id] += coverage * weight
+
+        room_matches: set[str] = set()
+        joined = f" {' '.join(tokenize(text))} "
+        for area, entity_ids in self._areas.items():
+            if f" {area} " in joined:
+                room_matches |= entity_ids
+                confident = True
+
+        return scores, room_matches, confident
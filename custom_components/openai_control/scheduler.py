@@ -0,0 +1,196 @@
+"""Priority scheduling and rate limiting of OpenAI requests."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+import logging
+import time
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .stats import Metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# voice commands and other conversations started by a person
+PRIORITY_INTERACTIVE = 0
+# conversations started by automations and scripts, and batches
+PRIORITY_BACKGROUND = 1
+
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "background": PRIORITY_BACKGROUND}
+
+
+class TokenBucket:
+    """A per minute limit that allows a burst of up to a minute's worth.
+
+    A limit of 0 never limits.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        """Initialize the bucket."""
+        self.capacity = per_minute
+        self._level = per_minute
+        self._updated = time.monotonic()
+
+    def delay(self, amount: float) -> float:
+        """Return the seconds until amount can be consumed."""
+        if self.capacity <= 0:
+            return 0
+        self._refill()
+        # a single request larger than the limit waits for a full bucket
+        missing = min(amount, self.capacity) - self._level
+        return max(0, missing * 60 / self.capacity)
+
+    def consume(self, amount: float) -> None:
+        """Take amount out of the bucket."""
+        if self.capacity > 0:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+
+    def _refill(self) -> None:
+        """Add what flowed in since the last update."""
+        now = time.monotonic()
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self.capacity / 60
+        )
+        self._updated = now
+
+
+class RequestScheduler:
+    """Let OpenAI requests through in priority order within the rate limits.
+
+    Each request waits in the queue of its priority until a concurrency slot
+    is free and the requests per minute and tokens per minute buckets allow
+    it. Interactive requests always go before background requests, so a
+    burst of automations doesn't delay a voice command.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        metrics: Metrics,
+        max_concurrency: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+    ) -> None:
+        """Initialize the scheduler, limits of 0 never limit."""
+        self.hass = hass
+        self.metrics = metrics
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.active = 0
+        self._queues: dict[int, deque[tuple[int, asyncio.Future[None]]]] = {
+            priority: deque() for priority in sorted(PRIORITIES.values())
+        }
+        self._timer: asyncio.TimerHandle | None = None
+        self._listeners: list[Callable[[], None]] = []
+
+    def depth(self, priority: int | None = None) -> int:
+        """Return the number of waiting requests, of a single priority if given."""
+        if priority is not None:
+            return len(self._queues[priority])
+        return sum(len(queue) for queue in self._queues.values())
+
+    @callback
+    def async_set_limits(
+        self,
+        max_concurrency: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+    ) -> None:
+        """Change the limits, a changed rate limit starts with a full bucket."""
+        self.max_concurrency = max_concurrency
+        if requests_per_minute != self.requests.capacity:
+            self.requests = TokenBucket(requests_per_minute)
+        if tokens_per_minute != self.tokens.capacity:
+            self.tokens = TokenBucket(tokens_per_minute)
+        self._async_dispatch()
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop the pending dispatch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call listener when a request is queued or let through."""
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    @asynccontextmanager
+    async def async_slot(self, priority: int, tokens: int) -> AsyncIterator[None]:
+        """Wait for the turn of a request of an estimated number of tokens."""
+        await self._async_acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._async_dispatch()
+
+    async def _async_acquire(self, priority: int, tokens: int) -> None:
+        """Queue a request and wait until it may be sent."""
+        start = time.perf_counter()
+        future: asyncio.Future[None] = self.hass.loop.create_future()
+        entry = (tokens, future)
+        self._queues[priority].append(entry)
+        self._async_dispatch()
+
+        if not future.done():
+            self.metrics.increment("throttled_requests")
+            _LOGGER.debug(
+                "Queued a request of %s tokens behind %s others", tokens, self.depth() - 1
+            )
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the caller gave up, for example because its deadline passed,
+            # dispatch may already have dropped the cancelled entry
+            if future.cancelled():
+                if entry in self._queues[priority]:
+                    self._queues[priority].remove(entry)
+            else:
+                self.active -= 1
+            self._async_dispatch()
+            raise
+        finally:
+            self.metrics.stages["queue"].observe((time.perf_counter() - start) * 1000)
+
+    @callback
+    def _async_dispatch(self) -> None:
+        """Let the waiting requests through that fit the limits, in priority order."""
+        self.async_stop()
+        while self.max_concurrency <= 0 or self.active < self.max_concurrency:
+            queue = next((queue for queue in self._queues.values() if queue), None)
+            if queue is None:
+                break
+            tokens, future = queue[0]
+            # a request cancelled in the same tick as a slot was released
+            if future.done():
+                queue.popleft()
+                continue
+            delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+            if delay > 0:
+                self._timer = self.hass.loop.call_later(delay, self._async_dispatch)
+                break
+            queue.popleft()
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.active += 1
+            future.set_result(None)
+        self._async_notify()
+
+    @callback
+    def _async_notify(self) -> None:
+        """Notify the listeners of a changed queue."""
+        for listener in self._listeners:
+            listener()
@@ -0,0 +1,214 @@
+"""Sensors with the latency and usage statistics of OpenAI Control."""
+from __future__ import annotations
+
+import logging
+
+from homeassistant.components.sensor import (
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from . import OpenAIAgent
+from .const import DOMAIN
+from .scheduler import PRIORITIES
+from .stats import COUNTERS, STAGES
+
+_LOGGER = logging.getLogger(__name__)
+
+# seconds between sensor updates, every update sorts the samples of each stage
+UPDATE_COOLDOWN = 10
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the OpenAI Control sensors."""
+    agent: OpenAIAgent = hass.data[DOMAIN][entry.entry_id]
+
+    entities: list[OpenAIStatsSensor] = [
+        OpenAIStageSensor(agent, entry, stage) for stage in STAGES
+    ]
+    entities.extend(OpenAICounterSensor(agent, entry, counter) for counter in COUNTERS)
+    entities.extend(
+        [
+            OpenAIFastPathSensor(agent, entry),
+            OpenAICacheSensor(agent, entry),
+            OpenAIQueueSensor(agent, entry),
+        ]
+    )
+    async_add_entities(entities)
+
+    @callback
+    def async_write_states() -> None:
+        """Write the statistics of all sensors."""
+        for entity in entities:
+            if entity.hass is not None:
+                entity.async_write_ha_state()
+
+    # under load requests finish faster than anyone reads the statistics, the
+    # first request after a quiet period updates right away, the rest after
+    # the cooldown
+    debouncer = Debouncer(
+        hass,
+        _LOGGER,
+        cooldown=UPDATE_COOLDOWN,
+        immediate=True,
+        function=async_write_states,
+    )
+    entry.async_on_unload(debouncer.async_cancel)
+    entry.async_on_unload(
+        agent.metrics.add_listener(
+            lambda: hass.async_create_task(debouncer.async_call())
+        )
+    )
+
+
+class OpenAIStatsSensor(SensorEntity):
+    """Base class for the statistics sensors of an agent."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry, key: str) -> None:
+        """Initialize the sensor."""
+        self.agent = agent
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name=entry.title,
+            manufacturer="OpenAI",
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+
+
+class OpenAIStageSensor(OpenAIStatsSensor):
+    """The p95 latency of a processing stage, with p50 and p99 as attributes."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_suggested_display_precision = 0
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry, stage: str) -> None:
+        """Initialize the sensor."""
+        super().__init__(agent, entry, f"latency_{stage}")
+        self.stage = stage
+        self._attr_name = f"{stage.capitalize()} latency"
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the p95 latency."""
+        return self.agent.metrics.stages[self.stage].percentile(95)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, float | int | None]:
+        """Return the count and percentiles."""
+        return self.agent.metrics.stages[self.stage].as_dict()
+
+
+class OpenAICounterSensor(OpenAIStatsSensor):
+    """A counter of the agent."""
+
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry, counter: str) -> None:
+        """Initialize the sensor."""
+        super().__init__(agent, entry, counter)
+        self.counter = counter
+        self._attr_name = counter.replace("_", " ").capitalize()
+
+    @property
+    def native_value(self) -> int:
+        """Return the counter."""
+        return self.agent.metrics.counters[self.counter]
+
+
+class OpenAIFastPathSensor(OpenAIStatsSensor):
+    """Number of commands handled without calling OpenAI."""
+
+    _attr_name = "Fast path hits"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry) -> None:
+        """Initialize the sensor."""
+        super().__init__(agent, entry, "fast_path_hits")
+
+    @property
+    def native_value(self) -> int:
+        """Return the number of hits."""
+        return self.agent.fast_path.hits
+
+    @property
+    def extra_state_attributes(self) -> dict[str, int]:
+        """Return the number of misses."""
+        return {"misses": self.agent.fast_path.misses}
+
+
+class OpenAICacheSensor(OpenAIStatsSensor):
+    """Share of OpenAI calls served from the response cache."""
+
+    _attr_name = "Cache hit rate"
+    _attr_native_unit_of_measurement = "%"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_suggested_display_precision = 1
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry) -> None:
+        """Initialize the sensor."""
+        super().__init__(agent, entry, "cache_hit_rate")
+
+    @property
+    def native_value(self) -> float:
+        """Return the hit rate."""
+        return self.agent.cache.hit_rate * 100
+
+    @property
+    def extra_state_attributes(self) -> dict[str, int]:
+        """Return the hits, misses and size of the cache."""
+        return {
+            "hits": self.agent.cache.hits,
+            "misses": self.agent.cache.misses,
+            "size": len(self.agent.cache),
+        }
+
+
+class OpenAIQueueSensor(OpenAIStatsSensor):
+    """Number of OpenAI requests waiting for their turn in the scheduler."""
+
+    _attr_name = "Queued requests"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, agent: OpenAIAgent, entry: ConfigEntry) -> None:
+        """Initialize the sensor."""
+        super().__init__(agent, entry, "queued_requests")
+
+    async def async_added_to_hass(self) -> None:
+        """Update the sensor whenever a request is queued or let through."""
+        self.async_on_remove(
+            self.agent.scheduler.async_add_listener(self.async_write_ha_state)
+        )
+
+    @property
+    def native_value(self) -> int:
+        """Return the number of waiting requests."""
+        return self.agent.scheduler.depth()
+
+    @property
+    def extra_state_attributes(self) -> dict[str, int]:
+        """Return the waiting requests of each priority and the running requests."""
+        return {
+            **{
+                name: self.agent.scheduler.depth(priority)
+                for name, priority in PRIORITIES.items()
+            },
+            "active": self.agent.scheduler.active,
+        }
@@ -0,0 +1,83 @@
+"""Services of the OpenAI Control integration."""
+from __future__ import annotations
+
+import asyncio
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+
+from .const import ATTR_CONFIG_ENTRY_ID, DOMAIN, SERVICE_PREPARE, SERVICE_PROCESS_BATCH
+
+PREPARE_SCHEMA = vol.Schema({vol.Optional("language"): cv.string})
+PROCESS_BATCH_SCHEMA = vol.Schema(
+    {
+        vol.Required("utterances"): vol.All(
+            cv.ensure_list, [cv.string], vol.Length(min=1)
+        ),
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services shared by all agents."""
+    if hass.services.has_service(DOMAIN, SERVICE_PREPARE):
+        return
+
+    async def async_prepare(call: ServiceCall) -> None:
+        """Prepare the agents for an utterance that is about to arrive."""
+        await asyncio.gather(
+            *(
+                agent.async_prepare(call.data.get("language"))
+                for agent in hass.data.get(DOMAIN, {}).values()
+            )
+        )
+
+    async def async_process_batch(call: ServiceCall) -> ServiceResponse:
+        """Process a list of utterances and execute their actions together."""
+        agents = hass.data.get(DOMAIN, {})
+        if (entry_id := call.data.get(ATTR_CONFIG_ENTRY_ID)) is not None:
+            if (agent := agents.get(entry_id)) is None:
+                raise HomeAssistantError(
+                    f"OpenAI Control entry {entry_id} is not loaded"
+                )
+        elif not agents:
+            raise HomeAssistantError("OpenAI Control is not loaded")
+        elif len(agents) > 1:
+            raise HomeAssistantError(
+                f"Several OpenAI Control entries are loaded, select one with {ATTR_CONFIG_ENTRY_ID}"
+            )
+        else:
+            agent = next(iter(agents.values()))
+        results = await agent.async_process_batch(call.data["utterances"])
+        return {"results": results}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PREPARE, async_prepare, schema=PREPARE_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROCESS_BATCH,
+        async_process_batch,
+        schema=PROCESS_BATCH_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+@callback
+def async_unload_services(hass: HomeAssistant) -> None:
+    """Remove the services after the last agent is unloaded."""
+    if hass.data.get(DOMAIN):
+        return
+    hass.services.async_remove(DOMAIN, SERVICE_PREPARE)
+    hass.services.async_remove(DOMAIN, SERVICE_PROCESS_BATCH)
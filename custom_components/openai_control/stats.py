@@ -0,0 +1,121 @@
+"""Latency and usage statistics for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import time
+from typing import Any
+
+# number of recent samples the percentiles are computed over
+HISTOGRAM_SIZE = 1000
+
+# "openai" includes retries, backoff and the queue, "attempt" is a single request
+STAGES = [
+    "prompt",
+    "entities",
+    "queue",
+    "attempt",
+    "openai",
+    "parse",
+    "services",
+    "total",
+]
+
+COUNTERS = [
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "json_parse_failures",
+    "fallback_extractions",
+    "coalesced_requests",
+    "retries",
+    "hedged_requests",
+    "fallback_model_requests",
+    "circuit_open_rejections",
+    "prepares",
+    "batches",
+    "skipped_actions",
+    "plan_hits",
+    "throttled_requests",
+]
+
+
+class Histogram:
+    """Percentiles over the most recent samples."""
+
+    def __init__(self, size: int = HISTOGRAM_SIZE) -> None:
+        """Initialize the histogram."""
+        self.count = 0
+        self.last: float | None = None
+        self._samples: deque[float] = deque(maxlen=size)
+        # the samples in order, until the next sample is added
+        self._ordered: list[float] | None = None
+
+    def observe(self, value: float) -> None:
+        """Add a sample."""
+        self.count += 1
+        self.last = value
+        self._samples.append(value)
+        self._ordered = None
+
+    def percentile(self, percentile: float) -> float | None:
+        """Return a percentile (0-100) of the recent samples."""
+        if not self._samples:
+            return None
+        if self._ordered is None:
+            self._ordered = sorted(self._samples)
+        ordered = self._ordered
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the count and the p50, p95 and p99 percentiles."""
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class Metrics:
+    """Per stage timings and counters of the agent."""
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._listeners: list[Callable[[], None]] = []
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Time a stage in milliseconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage].observe((time.perf_counter() - start) * 1000)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        """Increment a counter."""
+        self.counters[counter] += value
+
+    def add_listener(self, listener: Callable[[], None]) -> Callable[[], None]:
+        """Call listener after each request, returns a function to remove it."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def notify(self) -> None:
+        """Notify the listeners that a request finished."""
+        for listener in self._listeners:
+            listener()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return all timings and counters."""
+        return {
+            "stages": {
+                stage: histogram.as_dict() for stage, histogram in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
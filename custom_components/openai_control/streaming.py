@@ -0,0 +1,85 @@
+"""Incremental parsing of streamed OpenAI replies."""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EntityStreamParser:
+    """Incremental JSON parser for the "entities" array of a streamed reply.
+
+    Chunks of the reply are fed as they arrive and every entry of the
+    "entities" array is returned as soon as its closing brace is seen, so
+    the matching service can be called while the model is still generating
+    the rest of the reply.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the parser."""
+        self.content = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: str | None = None
+        self._array_depth: int | None = None
+        self._entry_start: int | None = None
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        """Add a chunk of the reply and return the entries completed by it."""
+        self.content += chunk
+        completed: list[dict[str, Any]] = []
+
+        content = self.content
+        for pos in range(self._pos, len(content)):
+            char = content[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = content[self._string_start : pos]
+                continue
+
+            # text before the JSON object, GPT sometimes prefixes a sentence
+            if self._depth == 0 and char != "{":
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char in "{[":
+                if (
+                    char == "["
+                    and self._depth == 1
+                    and self._last_string == "entities"
+                ):
+                    self._array_depth = self._depth + 1
+                elif char == "{" and self._depth == self._array_depth:
+                    self._entry_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if (
+                    char == "}"
+                    and self._entry_start is not None
+                    and self._depth == self._array_depth
+                ):
+                    entry = content[self._entry_start : pos + 1]
+                    self._entry_start = None
+                    try:
+                        completed.append(json.loads(entry))
+                    except json.JSONDecodeError as err:
+                        _LOGGER.error("Error parsing streamed entity %s: %s", entry, err)
+                elif char == "]" and self._array_depth == self._depth + 1:
+                    self._array_depth = None
+
+        self._pos = len(content)
+        return completed
@@ -0,0 +1,112 @@
+"""Token counting for the OpenAI Control integration."""
+from __future__ import annotations
+
+from collections.abc import Iterable
+from functools import lru_cache
+import logging
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+# average number of characters per token for English text when tiktoken is missing
+CHARS_PER_TOKEN = 4
+
+FALLBACK_ENCODING = "cl100k_base"
+
+# context windows of the chat models by model name prefix, the longest prefix wins
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-0301": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Any:
+    """Return the tiktoken encoding of a model, or None if it can't be loaded."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as err:  # pylint: disable=broad-except
+        # tiktoken downloads its encodings on first use
+        _LOGGER.warning("Unable to load the tiktoken encoding, estimating tokens: %s", err)
+        return None
+
+
+def load_encoding(model: str | None = None) -> None:
+    """Load the encoding of a model, which may read or download a file.
+
+    Run in an executor before tokens are counted in the event loop.
+    """
+    if tiktoken is not None:
+        _encoding(model or "")
+
+
+def is_exact(model: str | None = None) -> bool:
+    """Return True if tokens are counted with tiktoken instead of estimated."""
+    return tiktoken is not None and _encoding(model or "") is not None
+
+
+def context_window(model: str) -> int:
+    """Return the number of tokens the context window of a model holds."""
+    prefixes = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not prefixes:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(prefixes, key=len)]
+
+
+def _count(text: str, model: str | None) -> int:
+    """Return the number of tokens in a text without caching it."""
+    encoding = _encoding(model or "") if tiktoken is not None else None
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+# the entity block is the same string object until an entity changes
+@lru_cache(maxsize=16)
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Return the number of tokens in a text that is repeated across requests.
+
+    Uses tiktoken when it is installed, otherwise an estimate.
+    """
+    return _count(text, model)
+
+
+def count_message_tokens(
+    messages: list[dict[str, Any]],
+    model: str | None = None,
+    blocks: Iterable[str] = (),
+) -> int:
+    """Return the number of prompt tokens of a list of chat messages.
+
+    Blocks are parts of the messages that are the same across requests, like
+    the entity list. They are counted once, the rest of the messages, which
+    holds the utterance, is counted on every call.
+    """
+    blocks = [block for block in blocks if block]
+    # every message carries a few tokens of overhead for its role and separators
+    tokens = 3
+    for message in messages:
+        content = message.get("content") or ""
+        for block in blocks:
+            if block in content:
+                tokens += count_tokens(block, model)
+                content = content.replace(block, "", 1)
+        tokens += 4 + _count(content, model)
+    return tokens
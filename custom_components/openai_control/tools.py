@@ -0,0 +1,124 @@
+"""OpenAI tool definitions and tool call parsing for OpenAI Control."""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+from .actions import Action
+from .domains import DomainRegistry
+
+_LOGGER = logging.getLogger(__name__)
+
+ENTITY_IDS_SCHEMA = {
+    "type": "array",
+    "items": {"type": "string"},
+    "description": "Ids of the entities from the entity list",
+}
+BRIGHTNESS_SCHEMA = {
+    "type": "integer",
+    "minimum": 0,
+    "maximum": 255,
+    "description": "Brightness, only if requested",
+}
+HS_COLOR_SCHEMA = {
+    "type": "array",
+    "items": {"type": "number"},
+    "minItems": 2,
+    "maxItems": 2,
+    "description": "Hue (0-360) and saturation (0-100), only if requested",
+}
+
+
+def _tool(
+    domain: str, service: str, color: bool, domains: DomainRegistry
+) -> dict[str, Any]:
+    """Return the tool of a single service."""
+    properties: dict[str, Any] = {
+        "entity_ids": ENTITY_IDS_SCHEMA,
+        **domains.fields(domain, service),
+    }
+    if color and domain == "light" and service == "turn_on":
+        properties["brightness"] = BRIGHTNESS_SCHEMA
+        properties["hs_color"] = HS_COLOR_SCHEMA
+
+    return {
+        "type": "function",
+        "function": {
+            "name": f"{domain}_{service}",
+            "description": f"{service.replace('_', ' ').capitalize()} {domain} entities",
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": ["entity_ids"],
+            },
+        },
+    }
+
+
+def build_tools(domains: DomainRegistry, color: bool) -> list[dict[str, Any]]:
+    """Return a tool for every available service of every controlled domain."""
+    return [
+        _tool(domain, service, color, domains)
+        for domain in domains.domains
+        for service in domains.services(domain)
+    ]
+
+
+def _service(name: str, domains: DomainRegistry) -> tuple[str, str] | None:
+    """Return the domain and service of a tool name."""
+    for domain in domains.domains:
+        if name.startswith(f"{domain}_"):
+            service = name[len(domain) + 1 :]
+            if service in domains.services(domain):
+                return domain, service
+    return None
+
+
+def parse_tool_calls(
+    message: dict[str, Any], domains: DomainRegistry
+) -> list[Action]:
+    """Convert the tool calls of a reply message to actions.
+
+    Entity ids are returned as given, they may still be compact handles.
+    Calls with an unknown tool or invalid arguments are skipped.
+    """
+    actions = []
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") if isinstance(tool_call, dict) else None
+        if not isinstance(function, dict):
+            _LOGGER.warning("Ignoring malformed tool call: %s", tool_call)
+            continue
+        if (service := _service(function.get("name", ""), domains)) is None:
+            _LOGGER.warning("Ignoring call of unknown tool: %s", function.get("name"))
+            continue
+
+        try:
+            arguments = json.loads(function.get("arguments") or "{}")
+        except json.JSONDecodeError as err:
+            _LOGGER.error("Invalid arguments for tool %s: %s", function["name"], err)
+            continue
+        if not isinstance(arguments, dict):
+            _LOGGER.error("Invalid arguments for tool %s: %s", function["name"], arguments)
+            continue
+
+        data: dict[str, Any] = {}
+        brightness = arguments.get("brightness")
+        if isinstance(brightness, (int, float)) and not isinstance(brightness, bool):
+            data["brightness"] = max(0, min(255, int(brightness)))
+        hs_color = arguments.get("hs_color")
+        if (
+            isinstance(hs_color, list)
+            and len(hs_color) == 2
+            and all(isinstance(value, (int, float)) for value in hs_color)
+        ):
+            data["hs_color"] = [float(value) for value in hs_color]
+        data.update(domains.parse_fields(*service, arguments))
+
+        entity_ids = arguments.get("entity_ids")
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        for entity_id in entity_ids or []:
+            actions.append(Action(str(entity_id), service[0], service[1], dict(data)))
+
+    return actions
@@ -0,0 +1,175 @@
+"""Helpers for the OpenAI Control tests."""
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+import json
+from types import SimpleNamespace
+from typing import Any
+
+from homeassistant.components import conversation
+from homeassistant.core import Context, HomeAssistant
+from homeassistant.helpers import area_registry, device_registry, entity_registry
+
+from custom_components.openai_control import OpenAIAgent
+from custom_components.openai_control.catalog import EntityCatalog
+from custom_components.openai_control.const import (
+    CONF_CACHE_SIZE,
+    CONF_FAST_PATH,
+    CONF_PLAN_REPEATS,
+    DEFAULT_DOMAINS,
+    DEFAULT_LANGUAGE_AND_MODE,
+    LANGUAGE_AND_MODE,
+)
+from custom_components.openai_control.domains import DomainRegistry
+from custom_components.openai_control.models import ModelCache
+
+ROOMS = ["kitchen", "living room", "office", "bedroom", "hallway"]
+
+
+class StubClient:
+    """Stand-in for OpenAIClient that answers every request with the same reply.
+
+    A reply that is not a string is sent as JSON. Errors in errors are raised
+    and replies in replies are sent by the next requests, in order.
+    """
+
+    def __init__(self, reply: Any) -> None:
+        """Initialize the stub."""
+        self.reply = reply
+        self.errors: list[Exception] = []
+        self.replies: list[Any] = []
+        self.requests: list[dict[str, Any]] = []
+        self.connect_timeout = 5
+        self.request_timeout = 30
+
+    def _content(self) -> str:
+        """Return the content of the next reply."""
+        reply = self.replies.pop(0) if self.replies else self.reply
+        if isinstance(reply, str):
+            return reply
+        return json.dumps(reply)
+
+    async def async_chat_completion(self, **kwargs: Any) -> Any:
+        """Return a completion of the reply."""
+        self.requests.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return {
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self._content()},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20},
+        }
+
+    async def async_stream_chat_completion(
+        self, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Return the reply in chunks of a few characters."""
+        self.requests.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        content = self._content()
+        for start in range(0, len(content), 7):
+            yield {"choices": [{"delta": {"content": content[start : start + 7]}}]}
+
+    async def async_warm_up(self) -> None:
+        """Do nothing, there is no connection to warm up."""
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Create an in-memory Home Assistant instance with empty registries."""
+    try:
+        hass = HomeAssistant(config_dir)  # type: ignore[call-arg]
+    except TypeError:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    await area_registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    return hass
+
+
+def populate(hass: HomeAssistant, size: int) -> list[str]:
+    """Register and expose size lights and switches spread over the rooms."""
+    areas = area_registry.async_get(hass)
+    entities = entity_registry.async_get(hass)
+    area_ids = [areas.async_get_or_create(room).id for room in ROOMS]
+
+    entity_ids = []
+    for index in range(size):
+        domain = "switch" if index % 5 == 4 else "light"
+        room = ROOMS[index % len(ROOMS)]
+        entry = entities.async_get_or_create(
+            domain,
+            "test",
+            f"{domain}_{index}",
+            suggested_object_id=f"{room.replace(' ', '_')}_{domain}_{index}",
+            get_initial_options=lambda: {"conversation": {"should_expose": True}},
+        )
+        entities.async_update_entity(
+            entry.entity_id, area_id=area_ids[index % len(area_ids)]
+        )
+        attributes: dict[str, Any] = {"friendly_name": f"{room} {domain} {index}"}
+        if domain == "light":
+            attributes.update({"brightness": 128, "hs_color": (30.0, 80.0)})
+        hass.states.async_set(entry.entity_id, "on", attributes)
+        entity_ids.append(entry.entity_id)
+    return entity_ids
+
+
+def register_services(hass: HomeAssistant) -> list[tuple[str, str, dict[str, Any]]]:
+    """Register the light and switch services and return the list of their calls."""
+    calls: list[tuple[str, str, dict[str, Any]]] = []
+
+    async def async_service(call: Any) -> None:
+        calls.append((call.domain, call.service, dict(call.data)))
+
+    for domain in ("light", "switch"):
+        for service in ("turn_on", "turn_off", "toggle"):
+            hass.services.async_register(domain, service, async_service)
+    return calls
+
+
+def create_agent(
+    hass: HomeAssistant, client: StubClient, **options: Any
+) -> OpenAIAgent:
+    """Create an agent for the exposed entities with the fast path and caches off."""
+    entry = SimpleNamespace(
+        entry_id="test",
+        title="test",
+        data={},
+        options={
+            LANGUAGE_AND_MODE: DEFAULT_LANGUAGE_AND_MODE,
+            CONF_FAST_PATH: False,
+            CONF_CACHE_SIZE: 0,
+            CONF_PLAN_REPEATS: 0,
+            **options,
+        },
+        async_on_unload=lambda func: None,
+    )
+    domains = DomainRegistry(hass, DEFAULT_DOMAINS)
+    domains.async_start()
+    catalog = EntityCatalog(hass, domains)
+    catalog.async_start()
+    return OpenAIAgent(hass, entry, catalog, client, ModelCache(hass, "sk-test"))
+
+
+def conversation_input(
+    text: str, conversation_id: str | None = None
+) -> conversation.ConversationInput:
+    """Create a conversation input for the agent."""
+    kwargs: dict[str, Any] = {
+        "text": text,
+        "context": Context(),
+        "conversation_id": conversation_id,
+        "device_id": None,
+        "language": "en",
+    }
+    try:
+        return conversation.ConversationInput(**kwargs)
+    except TypeError:
+        return conversation.ConversationInput(agent_id=None, **kwargs)
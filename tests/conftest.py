@@ -0,0 +1,10 @@
+"""Test configuration of the OpenAI Control integration."""
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+# the conversation component has to be imported after bootstrap
+import homeassistant.bootstrap  # noqa: F401  pylint: disable=unused-import
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,239 @@
+"""Tests of the parsing, merging, optimization and execution of actions."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from homeassistant.core import State
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.openai_control.actions import (
+    Action,
+    async_execute_actions,
+    merge_actions,
+    optimize_actions,
+    parse_entity,
+)
+
+from .common import async_create_hass, register_services
+
+
+def test_parse_entity() -> None:
+    """Test the brightness and color of an entry are only parsed in color mode."""
+    entity = {
+        "id": "light.kitchen",
+        "action": "turn_on",
+        "brightness": "128",
+        "hs_color": "30,80",
+    }
+
+    assert parse_entity(entity, True) == Action(
+        "light.kitchen", "light", "turn_on", {"brightness": 128, "hs_color": [30, 80]}
+    )
+    assert parse_entity(entity, False) == Action("light.kitchen", "light", "turn_on")
+    assert parse_entity({**entity, "brightness": "bright"}, True).data == {
+        "hs_color": [30, 80]
+    }
+
+
+def test_parse_malformed_entity() -> None:
+    """Test malformed entries raise TypeError and malformed values are dropped."""
+    entity = {"id": "light.kitchen", "action": "turn_on"}
+
+    assert parse_entity({**entity, "hs_color": [30, "80"]}, True).data == {
+        "hs_color": [30, 80]
+    }
+    assert parse_entity({**entity, "hs_color": [30]}, True).data == {}
+    assert parse_entity({**entity, "hs_color": {"h": 30}}, True).data == {}
+    assert parse_entity({**entity, "brightness": [128]}, True).data == {}
+    for malformed in ("light.kitchen", ["light.kitchen"], {**entity, "id": 3}):
+        with pytest.raises(TypeError):
+            parse_entity(malformed, True)
+
+
+def test_merge_keeps_the_last_call() -> None:
+    """Test duplicate and superseded actions are dropped."""
+    actions = [
+        Action("light.kitchen", "light", "turn_on"),
+        Action("light.hall", "light", "turn_on"),
+        Action("light.kitchen", "light", "turn_off"),
+        Action("light.hall", "light", "turn_on"),
+    ]
+
+    assert merge_actions(actions) == [
+        Action("light.kitchen", "light", "turn_off"),
+        Action("light.hall", "light", "turn_on"),
+    ]
+
+
+async def _async_execute(actions: list[Action]) -> tuple[list[str], list]:
+    """Execute actions and return the failed entities and the service calls."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        calls = register_services(hass)
+        failed = await async_execute_actions(hass, actions)
+        await hass.async_block_till_done()
+        await hass.async_stop(force=True)
+    return failed, calls
+
+
+def test_identical_calls_are_grouped() -> None:
+    """Test actions with the same service and data share a single call."""
+    failed, calls = asyncio.run(
+        _async_execute(
+            [
+                Action("light.kitchen", "light", "turn_on", {"brightness": 50}),
+                Action("light.hall", "light", "turn_on", {"brightness": 50}),
+                Action("light.office", "light", "turn_on", {"brightness": 200}),
+                Action("switch.tv", "switch", "turn_off"),
+            ]
+        )
+    )
+
+    assert failed == []
+    assert sorted(calls, key=repr) == sorted(
+        [
+            (
+                "light",
+                "turn_on",
+                {"brightness": 50, "entity_id": ["light.kitchen", "light.hall"]},
+            ),
+            ("light", "turn_on", {"brightness": 200, "entity_id": ["light.office"]}),
+            ("switch", "turn_off", {"entity_id": ["switch.tv"]}),
+        ],
+        key=repr,
+    )
+
+
+def test_failed_calls_are_reported() -> None:
+    """Test the entities of a failed call are returned and the others executed."""
+    failed, calls = asyncio.run(
+        _async_execute(
+            [
+                Action("cover.garage", "cover", "open_cover"),
+                Action("light.kitchen", "light", "turn_on"),
+            ]
+        )
+    )
+
+    assert failed == ["cover.garage"]
+    assert calls == [("light", "turn_on", {"entity_id": ["light.kitchen"]})]
+
+
+def test_errors_raised_by_a_service_are_reported() -> None:
+    """Test a call whose service raises or doesn't finish in time counts as failed."""
+
+    async def _async_test() -> tuple[list[str], list]:
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await async_create_hass(config_dir)
+            calls = register_services(hass)
+            release = asyncio.Event()
+
+            async def async_fail(call: Any) -> None:
+                raise HomeAssistantError("Device unavailable")
+
+            async def async_hang(call: Any) -> None:
+                await release.wait()
+
+            hass.services.async_register("cover", "open_cover", async_fail)
+            hass.services.async_register("cover", "close_cover", async_hang)
+            with patch("custom_components.openai_control.actions.ACTION_TIMEOUT", 0.1):
+                failed = await async_execute_actions(
+                    hass,
+                    [
+                        Action("cover.garage", "cover", "open_cover"),
+                        Action("cover.shed", "cover", "close_cover"),
+                        Action("light.kitchen", "light", "turn_on"),
+                    ],
+                )
+            release.set()
+            await hass.async_block_till_done()
+            await hass.async_stop(force=True)
+        return failed, calls
+
+    failed, calls = asyncio.run(_async_test())
+
+    assert failed == ["cover.garage", "cover.shed"]
+    assert calls == [("light", "turn_on", {"entity_id": ["light.kitchen"]})]
+
+
+def _optimize(actions: list[Action], states: list[State]) -> list[Action]:
+    """Optimize actions against the given states."""
+    hass = SimpleNamespace(states={state.entity_id: state for state in states})
+    return optimize_actions(hass, actions)
+
+
+def test_no_ops_are_skipped() -> None:
+    """Test actions that would leave an entity as it is are dropped."""
+    states = [
+        State("light.kitchen", "on", {"brightness": 128, "hs_color": (30.0, 80.0)}),
+        State("switch.tv", "off"),
+        State("cover.garage", "open", {"current_position": 50}),
+        State("climate.living_room", "heat", {"temperature": 21}),
+    ]
+    actions = [
+        Action("light.kitchen", "light", "turn_on"),
+        Action("light.kitchen", "light", "turn_on", {"brightness": 128}),
+        Action("switch.tv", "switch", "turn_off"),
+        Action("cover.garage", "cover", "set_cover_position", {"position": 50}),
+        Action("climate.living_room", "climate", "set_temperature", {"temperature": 21}),
+        Action("climate.living_room", "climate", "set_hvac_mode", {"hvac_mode": "heat"}),
+    ]
+
+    assert _optimize(actions, states) == []
+
+
+def test_changes_are_kept() -> None:
+    """Test only the service data that changes an entity is kept."""
+    states = [
+        State("light.kitchen", "on", {"brightness": 128, "hs_color": (30.0, 80.0)}),
+        State("switch.tv", "on"),
+    ]
+    actions = [
+        Action(
+            "light.kitchen",
+            "light",
+            "turn_on",
+            {"brightness": 255, "hs_color": [30.1, 80.0]},
+        ),
+        Action("switch.tv", "switch", "turn_off"),
+    ]
+
+    assert _optimize(actions, states) == [
+        Action("light.kitchen", "light", "turn_on", {"brightness": 255}),
+        Action("switch.tv", "switch", "turn_off"),
+    ]
+
+
+def test_toggle_becomes_explicit() -> None:
+    """Test a toggle becomes the turn_on or turn_off it amounts to."""
+    states = [State("light.kitchen", "on"), State("light.hall", "off")]
+    actions = [
+        Action("light.kitchen", "light", "toggle", {"brightness": 50}),
+        Action("light.hall", "light", "toggle", {"brightness": 50}),
+    ]
+
+    assert _optimize(actions, states) == [
+        Action("light.kitchen", "light", "turn_off"),
+        Action("light.hall", "light", "turn_on", {"brightness": 50}),
+    ]
+
+
+def test_groups_and_unknown_entities_are_kept() -> None:
+    """Test actions on groups, entities without a state and other domains are kept."""
+    states = [
+        State("light.downstairs", "on", {"entity_id": ["light.kitchen", "light.hall"]}),
+        State("lock.door", "locked"),
+    ]
+    actions = [
+        Action("light.downstairs", "light", "turn_on"),
+        Action("light.unknown", "light", "turn_on"),
+        Action("lock.door", "lock", "lock"),
+    ]
+
+    assert _optimize(actions, states) == actions
@@ -0,0 +1,250 @@
+"""Tests of the agent against a stubbed OpenAI client."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from typing import Any
+from unittest.mock import patch
+
+from openai import error
+
+from custom_components.openai_control.const import (
+    CONF_FAST_PATH,
+    CONF_RESPONSE_FORMAT,
+    CONF_STREAM,
+    LANGUAGE_AND_MODE,
+)
+from custom_components.openai_control.stats import STAGES, Histogram
+
+from .common import (
+    StubClient,
+    async_create_hass,
+    conversation_input,
+    create_agent,
+    populate,
+    register_services,
+)
+
+REPLY = {
+    "entities": [{"id": "light.kitchen_light_0", "action": "turn_off"}],
+    "assistant": "The kitchen light is off.",
+}
+
+
+async def _async_process(
+    client: StubClient, text: str = "turn off the kitchen light", **options: Any
+) -> tuple[Any, Any, list[tuple[str, str, dict[str, Any]]]]:
+    """Process a sentence and return the agent, the result and the service calls."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        populate(hass, 10)
+        calls = register_services(hass)
+        agent = create_agent(hass, client, **options)
+        result = await agent.async_process(conversation_input(text))
+        await hass.async_block_till_done()
+        await hass.async_stop(force=True)
+    return agent, result, calls
+
+
+def test_stages_and_usage_are_measured() -> None:
+    """Test every stage is timed and the token usage is counted."""
+    agent, result, calls = asyncio.run(_async_process(StubClient(REPLY)))
+
+    assert result.response.speech["plain"]["speech"] == "The kitchen light is off."
+    assert calls == [("light", "turn_off", {"entity_id": ["light.kitchen_light_0"]})]
+    for stage in STAGES:
+        assert agent.metrics.stages[stage].count == 1, stage
+    assert agent.metrics.counters["requests"] == 1
+    assert agent.metrics.counters["prompt_tokens"] == 100
+    assert agent.metrics.counters["completion_tokens"] == 20
+
+
+def test_streamed_reply_executes_actions() -> None:
+    """Test the actions of a streamed reply are executed."""
+    client = StubClient(REPLY)
+    agent, result, calls = asyncio.run(
+        _async_process(client, **{CONF_STREAM: True})
+    )
+
+    assert result.response.speech["plain"]["speech"] == "The kitchen light is off."
+    assert calls == [("light", "turn_off", {"entity_id": ["light.kitchen_light_0"]})]
+    assert agent.metrics.stages["openai"].count == 1
+
+
+def test_json_after_a_sentence_is_extracted() -> None:
+    """Test a reply with a sentence before the JSON is still parsed."""
+    client = StubClient(
+        'Sure! {"entities": [{"id": "light.kitchen_light_0", "action": "turn_off"}],'
+        ' "assistant": "Done."}'
+    )
+    agent, _, calls = asyncio.run(_async_process(client))
+
+    assert agent.metrics.counters["fallback_extractions"] == 1
+    assert agent.metrics.counters["json_parse_failures"] == 0
+    assert len(calls) == 1
+
+
+def test_malformed_entities_are_skipped() -> None:
+    """Test entries that are not objects or have malformed values are skipped."""
+    client = StubClient(
+        {
+            "entities": [
+                "light.kitchen_light_0",
+                {"id": "light.kitchen_light_0", "action": "turn_off", "hs_color": [1]},
+            ],
+            "assistant": "Done.",
+        }
+    )
+    _, result, calls = asyncio.run(
+        _async_process(
+            client, **{LANGUAGE_AND_MODE: "English + brightness + color control"}
+        )
+    )
+
+    assert result.response.speech["plain"]["speech"] == "Done."
+    assert calls == [("light", "turn_off", {"entity_id": ["light.kitchen_light_0"]})]
+
+
+def test_malformed_batch_replies_are_reported_per_sentence() -> None:
+    """Test a malformed reply only fails its own sentence of a batch."""
+
+    async def _async_test() -> list[dict[str, Any]]:
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await async_create_hass(config_dir)
+            populate(hass, 10)
+            register_services(hass)
+            client = StubClient(REPLY)
+            client.replies = [
+                ["light.kitchen_light_0"],
+                {
+                    "entities": [
+                        {
+                            "id": "light.kitchen_light_0",
+                            "action": "turn_on",
+                            "hs_color": [30, 80],
+                        }
+                    ],
+                    "assistant": "Done.",
+                },
+            ]
+            agent = create_agent(
+                hass,
+                client,
+                **{LANGUAGE_AND_MODE: "English + brightness + color control"},
+            )
+            results = await agent.async_process_batch(
+                ["turn off the kitchen", "make the kitchen orange", "kitchen off"]
+            )
+            await hass.async_block_till_done()
+            await hass.async_stop(force=True)
+        return results
+
+    results = asyncio.run(_async_test())
+
+    assert len(results) == 3
+    errors = [result["error"] for result in results]
+    assert errors.count(None) == 2
+    failed = next(result for result in results if result["error"] is not None)
+    assert not failed["success"]
+    assert failed["actions"] == []
+
+
+class ToolStubClient(StubClient):
+    """Stand-in for OpenAIClient that answers with tool calls."""
+
+    async def async_chat_completion(self, **kwargs: Any) -> Any:
+        """Return a completion calling the tools in reply."""
+        self.requests.append(kwargs)
+        return {
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": self.reply,
+                    },
+                    "finish_reason": "tool_calls",
+                }
+            ],
+        }
+
+
+def test_tool_calls_are_executed() -> None:
+    """Test valid tool calls are executed and malformed ones skipped."""
+    client = ToolStubClient(
+        [
+            "light_turn_off",
+            {"function": {"name": "light_turn_off", "arguments": "[1]"}},
+            {
+                "function": {
+                    "name": "light_turn_off",
+                    "arguments": '{"entity_ids": ["light.kitchen_light_0"]}',
+                }
+            },
+        ]
+    )
+    _, result, calls = asyncio.run(
+        _async_process(client, **{CONF_RESPONSE_FORMAT: "tools"})
+    )
+
+    assert result.response.speech["plain"]["speech"] == "Done."
+    assert calls == [("light", "turn_off", {"entity_id": ["light.kitchen_light_0"]})]
+
+
+def test_reply_without_json_is_counted() -> None:
+    """Test a reply without JSON counts as a parse failure."""
+    agent, _, calls = asyncio.run(_async_process(StubClient("I can't do that.")))
+
+    assert agent.metrics.counters["json_parse_failures"] == 1
+    assert calls == []
+
+
+def test_rate_limited_request_is_retried() -> None:
+    """Test a rate limited request is retried and counted."""
+    client = StubClient(REPLY)
+    client.errors.append(error.RateLimitError("Slow down"))
+    with patch("custom_components.openai_control.resilience._backoff", return_value=0):
+        agent, result, calls = asyncio.run(_async_process(client))
+
+    assert len(client.requests) == 2
+    assert agent.metrics.counters["retries"] == 1
+    assert result.response.speech["plain"]["speech"] == "The kitchen light is off."
+    assert len(calls) == 1
+
+
+def test_openai_error_is_reported() -> None:
+    """Test the error is spoken when OpenAI fails for good."""
+    client = StubClient(REPLY)
+    client.errors.append(error.InvalidRequestError("Bad request", None))
+    _, result, calls = asyncio.run(_async_process(client))
+
+    assert result.response.error_code is not None
+    assert "Bad request" in result.response.speech["plain"]["speech"]
+    assert calls == []
+
+
+def test_fast_path_off_is_not_a_fallback() -> None:
+    """Test a disabled fast path doesn't handle commands when OpenAI fails."""
+    client = StubClient(REPLY)
+    client.errors.append(error.InvalidRequestError("Bad request", None))
+    _, result, calls = asyncio.run(
+        _async_process(client, "turn off the kitchen", **{CONF_FAST_PATH: False})
+    )
+
+    assert result.response.error_code is not None
+    assert calls == []
+
+
+def test_histogram_percentiles() -> None:
+    """Test the percentiles of the most recent samples."""
+    histogram = Histogram(size=100)
+    assert histogram.percentile(50) is None
+
+    for value in range(200):
+        histogram.observe(value)
+
+    assert histogram.count == 200
+    assert histogram.as_dict() == {"count": 200, "p50": 150, "p95": 195, "p99": 199}
+    histogram.observe(1000)
+    assert histogram.percentile(99) == 1000
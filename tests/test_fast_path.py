@@ -0,0 +1,88 @@
+"""Tests of the local fast path."""
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from custom_components.openai_control.fast_path import FastPathMatcher
+
+SERVICES = ("toggle", "turn_off", "turn_on")
+
+
+def _matcher() -> FastPathMatcher:
+    """Return a matcher for a few lights and switches."""
+    entities = [
+        ("light.kitchen_ceiling", "Kitchen ceiling", "Kitchen"),
+        ("light.kitchen_counter", "Kitchen counter", "Kitchen"),
+        ("switch.kitchen_kettle", "Kettle", "Kitchen"),
+        ("light.office_lamp", "Office lamp", "Office"),
+        ("switch.office_switch", "Office switch", "Office"),
+        ("light.woonkamer_lamp", "Woonkamer lamp", "Woonkamer"),
+    ]
+    catalog = SimpleNamespace(
+        entities={
+            entity_id: SimpleNamespace(
+                entity_id=entity_id,
+                domain=entity_id.split(".", 1)[0],
+                name=name,
+                aliases=[],
+                area=area,
+                services=SERVICES,
+            )
+            for entity_id, name, area in entities
+        }
+    )
+    return FastPathMatcher(catalog)
+
+
+def test_english_commands() -> None:
+    """Test simple English commands are resolved locally."""
+    matcher = _matcher()
+
+    match = matcher.match("Turn off the kitchen lights", "en")
+    assert match is not None
+    assert match.service == "turn_off"
+    assert match.entity_ids == ["light.kitchen_ceiling", "light.kitchen_counter"]
+
+    match = matcher.match("dim the office lamp to 30%", "en")
+    assert match is not None
+    assert (match.service, match.entity_ids) == ("turn_on", ["light.office_lamp"])
+    assert match.service_data == {"brightness_pct": 30}
+    assert match.reply == "Set the office lamp to 30%."
+
+
+def test_switch_is_only_a_verb_at_the_start() -> None:
+    """Test "switch" is part of the target unless it is the verb."""
+    matcher = _matcher()
+
+    match = matcher.match("turn on the office switch", "en")
+    assert match is not None
+    assert match.entity_ids == ["switch.office_switch"]
+
+    match = matcher.match("switch on the kettle", "en")
+    assert match is not None
+    assert (match.service, match.entity_ids) == ("turn_on", ["switch.kitchen_kettle"])
+
+
+def test_dutch_in_only_turns_on_at_the_end() -> None:
+    """Test "in" turns on as the last word and is filler elsewhere."""
+    matcher = _matcher()
+
+    match = matcher.match("schakel de woonkamer lamp in", "nl")
+    assert match is not None
+    assert (match.service, match.entity_ids) == ("turn_on", ["light.woonkamer_lamp"])
+
+    match = matcher.match("doe het licht in de woonkamer uit", "nl")
+    assert match is not None
+    assert (match.service, match.entity_ids) == ("turn_off", ["light.woonkamer_lamp"])
+
+
+def test_ambiguous_commands_go_to_openai() -> None:
+    """Test commands that are not unambiguous are not resolved."""
+    matcher = _matcher()
+
+    assert matcher.match("turn on the kitchen", "en") is not None
+    assert matcher.match("turn on and off the office lamp", "en") is None
+    assert matcher.match("make the office cozy", "en") is None
+    assert matcher.match("set the office lamp to 120%", "en") is None
+    assert matcher.hits == 1
+    assert matcher.misses == 3
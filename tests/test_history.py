@@ -0,0 +1,101 @@
+"""Tests of the conversation history."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+from custom_components.openai_control.const import (
+    CONF_HISTORY_TURNS,
+    HISTORY_MAX_CONVERSATIONS,
+)
+from custom_components.openai_control.history import ConversationHistory, Turn
+
+from .common import (
+    StubClient,
+    async_create_hass,
+    conversation_input,
+    create_agent,
+    populate,
+    register_services,
+)
+
+
+def _fill(history: ConversationHistory, start: int, count: int) -> None:
+    """Add three turns to each of count conversations."""
+    for index in range(start, start + count):
+        for turn in range(3):
+            history.append(
+                f"conversation-{index}",
+                Turn(f"turn on light {turn}", "Done.", (f"turn_on light.l{turn}",)),
+            )
+
+
+def test_memory_is_bounded() -> None:
+    """Test the memory of the history stops growing at the conversation limit."""
+    history = ConversationHistory(100, 10, 1800)
+    tracemalloc.start()
+    try:
+        _fill(history, 0, 1000)
+        filled, _ = tracemalloc.get_traced_memory()
+        _fill(history, 1000, 10000)
+        driven, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(history) == 100
+    assert driven - filled < 64 * 1024
+    # the most recent conversations are kept
+    assert "conversation-10999" in history
+    assert "conversation-0" not in history
+
+
+def test_turn_limit() -> None:
+    """Test only the last turns of a conversation are kept."""
+    history = ConversationHistory(100, 2, 1800)
+    for index in range(5):
+        history.append("conversation", Turn(f"text {index}", "Done."))
+
+    assert [turn.text for turn in history.turns("conversation")] == ["text 3", "text 4"]
+
+
+def test_idle_conversations_expire() -> None:
+    """Test conversations idle for longer than the ttl are dropped."""
+    history = ConversationHistory(100, 10, 60)
+    with patch("custom_components.openai_control.history.time.monotonic") as now:
+        now.return_value = 1000
+        history.append("old", Turn("turn on the lamp", "Done."))
+        now.return_value = 1050
+        history.append("new", Turn("turn off the lamp", "Done."))
+
+        now.return_value = 1070
+        assert "old" not in history
+        assert "new" in history
+        assert len(history) == 1
+
+
+async def _async_drive_conversations(count: int) -> None:
+    """Start count conversations with the agent and check what it keeps."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        populate(hass, 20)
+        register_services(hass)
+        client = StubClient({"entities": [], "assistant": "Done."})
+        agent = create_agent(hass, client, **{CONF_HISTORY_TURNS: 3})
+
+        for index in range(count):
+            await agent.async_process(conversation_input(f"turn on light {index}"))
+
+        assert len(agent.history) == HISTORY_MAX_CONVERSATIONS
+        for conversation_id in list(agent.history._conversations):
+            for turn in agent.history.turns(conversation_id):
+                # the rendered prompt with the entity list is not stored
+                assert turn.text.startswith("turn on light")
+                assert turn.reply == "Done."
+        await hass.async_stop(force=True)
+
+
+def test_agent_keeps_a_bounded_history() -> None:
+    """Test thousands of conversations with the agent keep the history bounded."""
+    asyncio.run(_async_drive_conversations(2000))
@@ -0,0 +1,148 @@
+"""Tests of the learned command plans."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from unittest.mock import AsyncMock, patch
+
+from custom_components.openai_control.actions import Action
+from custom_components.openai_control.const import CONF_CACHE_SIZE, CONF_PLAN_REPEATS
+from custom_components.openai_control.plans import PlanStore, _similar
+
+from .common import (
+    StubClient,
+    async_create_hass,
+    conversation_input,
+    create_agent,
+    populate,
+    register_services,
+)
+
+ACTIONS = [
+    Action("light.living_room", "light", "turn_off"),
+    Action("light.tv_lamp", "light", "turn_on", {"brightness": 50}),
+]
+
+
+def test_similar_utterances() -> None:
+    """Test utterances only differing by a typo or filler word match."""
+    assert _similar("movie time in the living room", "movie time in the livng room")
+    assert _similar("movie time in the living room", "moive time in the living room")
+    assert _similar("movie time in the living room", "movie time in the livinq room")
+    assert _similar("turn off the kitchen lights", "please turn off kitchen lights")
+    # a plural or comparative names something else than a typo does
+    assert not _similar("turn off the kitchen lights", "turn off the kitchen light")
+    assert not _similar("make it bright", "make it brighter")
+    assert not _similar("open the oven", "open the open")
+    assert not _similar("turn on the kitchen lights", "turn off the kitchen lights")
+    assert not _similar("set the heating to 20", "set the heating to 200")
+    assert not _similar("movie time in the living room", "movie time in the bedroom")
+
+
+async def _async_record_and_restart() -> None:
+    """Promote a plan, restart and check it is still served."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        plans = PlanStore(hass, "test", 2)
+        await plans.async_load()
+        entity_ids = {action.entity_id for action in ACTIONS}
+
+        plans.async_record("Movie time in the living room", ACTIONS, "Enjoy.")
+        assert plans.match("movie time in the living room", entity_ids) is None
+        # the actions are compared regardless of their order
+        plans.async_record("movie time in the living room.", ACTIONS[::-1], "Enjoy!")
+        assert plans.promoted == 1
+
+        plan = plans.match("Movie time in living room please", entity_ids)
+        assert plan is not None
+        assert plan.reply == "Enjoy!"
+        # plans acting on an entity without a state are not served
+        assert plans.match("movie time in the living room", {"light.tv_lamp"}) is None
+        await hass.async_stop(force=True)
+
+        hass = await async_create_hass(config_dir)
+        plans = PlanStore(hass, "test", 2)
+        await plans.async_load()
+        plan = plans.match("movie time in the living room", entity_ids)
+        assert plan is not None
+        assert plan.actions == sorted(ACTIONS, key=lambda action: action.entity_id)
+
+        plans.async_invalidate("light.tv_lamp")
+        assert len(plans) == 0
+        await hass.async_stop(force=True)
+
+
+def test_plans_survive_a_restart() -> None:
+    """Test a promoted plan is served after a restart until it is invalidated."""
+    asyncio.run(_async_record_and_restart())
+
+
+def test_different_actions_start_over() -> None:
+    """Test a plan needs the same actions in a row to be promoted."""
+
+    async def _async_test() -> None:
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await async_create_hass(config_dir)
+            plans = PlanStore(hass, "test", 2)
+            plans.async_record("movie time", ACTIONS, "Enjoy.")
+            plans.async_record("movie time", ACTIONS[:1], "Enjoy.")
+            assert plans.promoted == 0
+            plans.async_record("movie time", ACTIONS[:1], "Enjoy.")
+            assert plans.promoted == 1
+            await hass.async_stop(force=True)
+
+    asyncio.run(_async_test())
+
+
+async def _async_requests(count: int, **options: object) -> tuple[int, int]:
+    """Send the same sentence count times and return the requests and plans."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        populate(hass, 10)
+        register_services(hass)
+        client = StubClient(
+            {
+                "entities": [{"id": "light.kitchen_light_0", "action": "toggle"}],
+                "assistant": "Done.",
+            }
+        )
+        agent = create_agent(hass, client, **options)
+        await agent.plans.async_load()
+        for _ in range(count):
+            await agent.async_process(conversation_input("toggle the kitchen light"))
+            await hass.async_block_till_done()
+        promoted = agent.plans.promoted
+        await hass.async_stop(force=True)
+    return len(client.requests), promoted
+
+
+def test_agent_serves_learned_plans() -> None:
+    """Test the agent stops calling OpenAI once a plan is learned."""
+    requests, promoted = asyncio.run(_async_requests(4, **{CONF_PLAN_REPEATS: 2}))
+
+    assert promoted == 1
+    assert requests == 2
+
+
+def test_cached_replies_are_not_learned() -> None:
+    """Test replies replayed from the response cache don't promote a plan."""
+    requests, promoted = asyncio.run(
+        _async_requests(3, **{CONF_PLAN_REPEATS: 2, CONF_CACHE_SIZE: 10})
+    )
+
+    assert requests == 1
+    assert promoted == 0
+
+
+def test_failed_replies_are_not_learned() -> None:
+    """Test replies with an action that failed don't promote a plan."""
+    with patch(
+        "custom_components.openai_control.async_execute_actions",
+        AsyncMock(return_value=["light.kitchen_light_0"]),
+    ):
+        requests, promoted = asyncio.run(
+            _async_requests(3, **{CONF_PLAN_REPEATS: 2})
+        )
+
+    assert requests == 3
+    assert promoted == 0
@@ -0,0 +1,104 @@
+"""Tests of the prefix cache friendly prompt layout."""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from typing import Any
+
+from custom_components.openai_control.const import (
+    CONF_ENTITY_FORMAT,
+    CONF_PROMPT_LAYOUT,
+    LANGUAGE_AND_MODE,
+)
+
+from .common import (
+    StubClient,
+    async_create_hass,
+    conversation_input,
+    create_agent,
+    populate,
+    register_services,
+)
+
+UTTERANCES = [
+    "Turn off all the lights",
+    "turn on every light",
+    "Turn off all the lights",
+]
+
+
+def _request(messages: list[dict[str, Any]]) -> str:
+    """Return the messages of a request as the provider sees them."""
+    return "".join(f"{message['role']}\n{message['content']}\n" for message in messages)
+
+
+async def _async_requests(**options: Any) -> list[str]:
+    """Send the utterances, changing a state before each, and return the requests."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        entity_ids = populate(hass, 50)
+        register_services(hass)
+        client = StubClient({"entities": [], "assistant": "Done."})
+        agent = create_agent(hass, client, **options)
+
+        for index, text in enumerate(UTTERANCES):
+            state = hass.states.get(entity_ids[index])
+            hass.states.async_set(
+                entity_ids[index],
+                "off" if state.state == "on" else "on",
+                state.attributes,
+            )
+            await agent.async_process(conversation_input(text))
+        await hass.async_stop(force=True)
+    return [_request(request["messages"]) for request in client.requests]
+
+
+def _check_prefix(requests: list[str]) -> None:
+    """Check everything up to the states is identical across the requests."""
+    prefix = requests[0][: requests[0].rindex("\nStates:\n")]
+    # the whole entity list is part of the shared prefix
+    assert "Entities:" in prefix
+    # the compact encoding leaves the area of the group header out of the name
+    assert "switch_49" in prefix
+    for request in requests:
+        assert request.startswith(prefix)
+        assert request.rindex("\nStates:\n") == len(prefix)
+
+
+def test_prefix_is_byte_identical() -> None:
+    """Test consecutive requests share everything up to the entity states."""
+    for entity_format in ("standard", "compact"):
+        _check_prefix(
+            asyncio.run(
+                _async_requests(
+                    **{
+                        CONF_PROMPT_LAYOUT: "prefix_cache",
+                        CONF_ENTITY_FORMAT: entity_format,
+                    }
+                )
+            )
+        )
+
+
+def test_prefix_is_byte_identical_with_color() -> None:
+    """Test the brightness and color of the lights are left out of the prefix."""
+    _check_prefix(
+        asyncio.run(
+            _async_requests(
+                **{
+                    CONF_PROMPT_LAYOUT: "prefix_cache",
+                    LANGUAGE_AND_MODE: "English + brightness + color control",
+                }
+            )
+        )
+    )
+
+
+def test_standard_layout_prefix_ends_at_the_utterance() -> None:
+    """Test the standard layout only shares the text before the utterance."""
+    requests = asyncio.run(_async_requests(**{CONF_PROMPT_LAYOUT: "standard"}))
+
+    shared = os.path.commonprefix(requests[:2])
+    assert 'Prompt: "' in shared
+    assert "Entities:" not in shared
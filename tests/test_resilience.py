@@ -0,0 +1,115 @@
+"""Tests of the retries, circuit breaker and hedging of OpenAI calls."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+import json
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+from openai import error
+import pytest
+
+from custom_components.openai_control.resilience import (
+    CallPolicy,
+    CircuitBreaker,
+    ResilientClient,
+)
+from custom_components.openai_control.scheduler import RequestScheduler
+from custom_components.openai_control.stats import Metrics
+
+from .common import StubClient
+
+MESSAGES = [{"role": "user", "content": "turn off the kitchen light"}]
+
+
+class InterruptedStubClient(StubClient):
+    """Stand-in for OpenAIClient whose streams break off after the first chunk."""
+
+    async def async_stream_chat_completion(
+        self, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Return a chunk of the reply and fail."""
+        self.requests.append(kwargs)
+        yield {"choices": [{"delta": {"content": '{"entities": ['}}]}
+        raise error.APIConnectionError("Connection reset")
+
+
+def _resilient(client: StubClient, threshold: int = 5) -> ResilientClient:
+    """Return a resilient client on the running event loop."""
+    metrics = Metrics()
+    hass = SimpleNamespace(loop=asyncio.get_running_loop())
+    return ResilientClient(
+        client,
+        CircuitBreaker(threshold, 60),
+        RequestScheduler(hass, metrics, 0, 0, 0),
+        metrics,
+    )
+
+
+async def _async_stream(
+    resilient: ResilientClient, max_retries: int = 2
+) -> list[str]:
+    """Stream a completion and return its pieces of content."""
+    content: list[str] = []
+    await resilient.async_stream_chat_completion(
+        CallPolicy(5, max_retries, False),
+        content.append,
+        model="gpt-3.5-turbo",
+        messages=MESSAGES,
+    )
+    return content
+
+
+def test_stream_is_retried_before_its_content() -> None:
+    """Test a stream that fails before any content arrived is retried."""
+
+    async def _async_test() -> None:
+        client = StubClient({"assistant": "Done."})
+        client.errors.append(error.RateLimitError("Slow down"))
+        resilient = _resilient(client)
+        with patch("custom_components.openai_control.resilience._backoff", return_value=0):
+            content = await _async_stream(resilient)
+
+        assert "".join(content) == json.dumps(client.reply)
+        assert len(client.requests) == 2
+        assert resilient.metrics.counters["retries"] == 1
+
+    asyncio.run(_async_test())
+
+
+def test_interrupted_stream_is_not_retried() -> None:
+    """Test a stream that breaks off raises and counts towards the breaker."""
+
+    async def _async_test() -> None:
+        client = InterruptedStubClient({})
+        resilient = _resilient(client, threshold=1)
+
+        with pytest.raises(error.APIConnectionError):
+            await _async_stream(resilient)
+        assert len(client.requests) == 1
+        assert resilient.breaker.state == "open"
+
+        # the open breaker rejects the next stream without calling OpenAI
+        with pytest.raises(error.OpenAIError, match="unavailable"):
+            await _async_stream(resilient)
+        assert len(client.requests) == 1
+
+    asyncio.run(_async_test())
+
+
+def test_hedge_delay_is_the_latency_of_single_requests() -> None:
+    """Test the hedging delay ignores the retries and queueing of whole calls."""
+
+    async def _async_test() -> None:
+        resilient = _resilient(StubClient({}))
+        assert resilient._hedge_delay() is None
+
+        for _ in range(20):
+            resilient.metrics.stages["openai"].observe(10000)
+            resilient.metrics.stages["attempt"].observe(200)
+
+        assert resilient._hedge_delay() == 0.2
+
+    asyncio.run(_async_test())
@@ -0,0 +1,87 @@
+"""Tests of the entity index."""
+from __future__ import annotations
+
+from custom_components.openai_control.retrieval import (
+    EntityIndex,
+    is_quantified,
+    mentions_attributes,
+)
+
+ROOMS = ["kitchen", "living room", "office", "bedroom", "hallway"]
+
+
+def _index(size: int = 200) -> EntityIndex:
+    """Return an index of size lights and switches spread over the rooms."""
+    index = EntityIndex()
+    for number in range(size):
+        domain = "switch" if number % 3 == 2 else "light"
+        room = ROOMS[number % len(ROOMS)]
+        index.add(
+            f"{domain}.{room.replace(' ', '_')}_{domain}_{number}",
+            [f"{room} {domain} {number}"],
+            room,
+        )
+    index.add("light.desk_lamp", ["Desk lamp"], "office")
+    return index
+
+
+def test_room_returns_all_its_entities() -> None:
+    """Test every entity of a room mentioned by name is a candidate."""
+    candidates = _index().match("Turn off the living room lights", 5)
+
+    assert candidates is not None
+    assert len(candidates) >= 40
+    assert all(
+        entity_id.split(".", 1)[1].startswith("living_room") for entity_id in candidates
+    )
+
+
+def test_name_narrows_down_to_top_k() -> None:
+    """Test an utterance naming an entity is narrowed down to the best matches."""
+    candidates = _index().match("dim the desk lamp", 5)
+
+    assert candidates is not None
+    assert "light.desk_lamp" in candidates
+    assert len(candidates) <= 5
+
+
+def test_full_list_without_a_narrowing_token() -> None:
+    """Test the full list is used when no token narrows the entities down."""
+    index = _index()
+
+    assert index.match("turn off the lights", 5) is None
+    assert index.match("it is too dark", 5) is None
+
+
+def test_full_list_for_quantified_sentences() -> None:
+    """Test sentences about all entities outside a named room use the full list."""
+    index = _index()
+
+    assert index.match("Turn off all the lights", 5) is None
+    assert index.match("switch off every light in the whole house", 5) is None
+    assert index.match("doe alle lampen uit", 5) is None
+    # a named room still narrows the list down to that room
+    assert index.match("turn off all the lights in the kitchen", 5) is not None
+
+
+def test_top_k_zero_uses_the_full_list() -> None:
+    """Test a top_k of 0 disables the pre-filter."""
+    assert _index().match("dim the desk lamp", 0) is None
+
+
+def test_removed_entities_are_not_matched() -> None:
+    """Test removing an entity drops it from the index and its room."""
+    index = _index(10)
+    index.remove("light.kitchen_light_0")
+
+    assert len(index) == 10
+    assert "light.kitchen_light_0" not in index.rank("kitchen")
+
+
+def test_quantifiers_and_attributes() -> None:
+    """Test the detection of quantifiers and brightness or color changes."""
+    assert is_quantified("Turn off everything")
+    assert is_quantified("lights off in the entire house")
+    assert not is_quantified("turn off the kitchen light")
+    assert mentions_attributes("make the office light blue")
+    assert not mentions_attributes("turn on the office light")
@@ -0,0 +1,130 @@
+"""Tests of the request scheduler."""
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from custom_components.openai_control.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
+)
+from custom_components.openai_control.stats import Metrics
+
+
+def _scheduler(
+    max_concurrency: int, requests_per_minute: float = 0, tokens_per_minute: float = 0
+) -> RequestScheduler:
+    """Return a scheduler on the running event loop."""
+    hass = SimpleNamespace(loop=asyncio.get_running_loop())
+    return RequestScheduler(
+        hass, Metrics(), max_concurrency, requests_per_minute, tokens_per_minute
+    )
+
+
+def test_token_bucket() -> None:
+    """Test the bucket allows a burst of a minute's worth and then refills."""
+    with patch("custom_components.openai_control.scheduler.time.monotonic") as now:
+        now.return_value = 0
+        bucket = TokenBucket(60)
+        assert bucket.delay(60) == 0
+        bucket.consume(60)
+        assert bucket.delay(1) == 1
+        # a request larger than the limit waits for a full bucket
+        assert bucket.delay(1000) == 60
+
+        now.return_value = 30
+        assert bucket.delay(30) == 0
+        assert TokenBucket(0).delay(1000) == 0
+
+
+def test_interactive_requests_go_first() -> None:
+    """Test a voice command queued behind automations is let through first."""
+
+    async def _async_test() -> None:
+        scheduler = _scheduler(1)
+        order: list[str] = []
+        release = asyncio.Event()
+
+        async def async_request(name: str, priority: int) -> None:
+            async with scheduler.async_slot(priority, 10):
+                order.append(name)
+                await release.wait()
+
+        tasks = [
+            asyncio.create_task(async_request(f"automation {index}", PRIORITY_BACKGROUND))
+            for index in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(
+            asyncio.create_task(async_request("voice", PRIORITY_INTERACTIVE))
+        )
+        await asyncio.sleep(0)
+
+        assert scheduler.active == 1
+        assert scheduler.depth() == 3
+        assert scheduler.depth(PRIORITY_INTERACTIVE) == 1
+        release.set()
+        await asyncio.gather(*tasks)
+
+        assert order == ["automation 0", "voice", "automation 1", "automation 2"]
+        assert scheduler.active == 0
+        assert scheduler.metrics.counters["throttled_requests"] == 3
+
+    asyncio.run(_async_test())
+
+
+def test_tokens_per_minute_delays_requests() -> None:
+    """Test a request waits until the tokens per minute limit allows it."""
+
+    async def _async_test() -> None:
+        # 6000 tokens per minute refill 100 tokens per second
+        scheduler = _scheduler(0, tokens_per_minute=6000)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def async_request(tokens: int) -> float:
+            async with scheduler.async_slot(PRIORITY_BACKGROUND, tokens):
+                return loop.time() - start
+
+        first, second = await asyncio.gather(async_request(6000), async_request(20))
+        assert first < 0.1
+        assert 0.1 < second < 0.5
+        scheduler.async_stop()
+
+    asyncio.run(_async_test())
+
+
+def test_cancelled_requests_free_their_place() -> None:
+    """Test a request cancelled while queued or just let through frees its place."""
+
+    async def _async_test() -> None:
+        scheduler = _scheduler(1)
+        release = asyncio.Event()
+
+        async def async_hold() -> None:
+            async with scheduler.async_slot(PRIORITY_INTERACTIVE, 1):
+                await release.wait()
+
+        async def async_request() -> str:
+            async with scheduler.async_slot(PRIORITY_INTERACTIVE, 1):
+                return "done"
+
+        holder = asyncio.create_task(async_hold())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(async_request())
+        await asyncio.sleep(0)
+        assert scheduler.depth() == 1
+
+        # cancelled in the same tick as the slot is released
+        release.set()
+        queued.cancel()
+        await asyncio.gather(holder, queued, return_exceptions=True)
+        assert scheduler.active == 0
+        assert scheduler.depth() == 0
+
+        assert await asyncio.wait_for(async_request(), 1) == "done"
+
+    asyncio.run(_async_test())
@@ -0,0 +1,69 @@
+"""Tests of the services of the integration."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.openai_control.const import DOMAIN, SERVICE_PROCESS_BATCH
+from custom_components.openai_control.services import async_setup_services
+
+from .common import async_create_hass
+
+
+def _agent(name: str) -> SimpleNamespace:
+    """Return a stand-in agent answering a batch with its name."""
+    return SimpleNamespace(async_process_batch=AsyncMock(return_value=[name]))
+
+
+async def _async_process_batch(
+    agents: dict[str, SimpleNamespace], **data: str
+) -> dict[str, list[str]]:
+    """Call the process_batch service with the agents loaded."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        hass.data[DOMAIN] = agents
+        async_setup_services(hass)
+        try:
+            return await hass.services.async_call(
+                DOMAIN,
+                SERVICE_PROCESS_BATCH,
+                {"utterances": ["turn off the lights"], **data},
+                blocking=True,
+                return_response=True,
+            )
+        finally:
+            await hass.async_stop(force=True)
+
+
+def test_batch_goes_to_the_only_agent() -> None:
+    """Test a single loaded agent processes the batch without an entry id."""
+    response = asyncio.run(_async_process_batch({"first": _agent("first")}))
+
+    assert response == {"results": ["first"]}
+
+
+def test_batch_goes_to_the_selected_agent() -> None:
+    """Test the agent of the given entry processes the batch."""
+    agents = {"first": _agent("first"), "second": _agent("second")}
+    response = asyncio.run(_async_process_batch(agents, config_entry_id="second"))
+
+    assert response == {"results": ["second"]}
+    agents["first"].async_process_batch.assert_not_called()
+
+
+def test_batch_needs_an_entry_id_with_several_agents() -> None:
+    """Test an error is raised when the agent to use is ambiguous or unknown."""
+    agents = {"first": _agent("first"), "second": _agent("second")}
+
+    with pytest.raises(HomeAssistantError, match="config_entry_id"):
+        asyncio.run(_async_process_batch(agents))
+    with pytest.raises(HomeAssistantError, match="third"):
+        asyncio.run(_async_process_batch(agents, config_entry_id="third"))
+    with pytest.raises(HomeAssistantError, match="not loaded"):
+        asyncio.run(_async_process_batch({}))
@@ -0,0 +1,71 @@
+"""Tests of the incremental parser of streamed replies."""
+from __future__ import annotations
+
+import json
+
+from custom_components.openai_control.streaming import EntityStreamParser
+
+REPLY = {
+    "entities": [
+        {"id": "light.kitchen", "action": "turn_on", "brightness": "128"},
+        {"id": "light.hall {1}", "action": "turn_off"},
+        {"id": "switch.tv", "action": "toggle", "hs_color": "[30, 80]"},
+    ],
+    "assistant": "Done, the {kitchen} is on.",
+}
+
+
+def _feed(content: str, size: int) -> list[list[dict]]:
+    """Feed content in chunks of size and return the entries of each chunk."""
+    parser = EntityStreamParser()
+    results = [
+        parser.feed(content[start : start + size])
+        for start in range(0, len(content), size)
+    ]
+    assert parser.content == content
+    return results
+
+
+def test_entries_are_returned_once_complete() -> None:
+    """Test every entry is returned by the chunk that completes it."""
+    content = json.dumps(REPLY)
+    for size in (1, 3, 7, len(content)):
+        results = _feed(content, size)
+        assert [entry for result in results for entry in result] == REPLY["entities"]
+
+    # one character at a time, an entry is returned as soon as its brace is seen
+    results = _feed(content, 1)
+    first_end = content.index("}") + 1
+    assert results[first_end - 1] == [REPLY["entities"][0]]
+
+
+def test_text_before_the_json_is_skipped() -> None:
+    """Test a sentence before the JSON object is ignored."""
+    content = 'Sure, turning it on: ' + json.dumps(REPLY)
+    results = _feed(content, 5)
+
+    assert [entry for result in results for entry in result] == REPLY["entities"]
+
+
+def test_nested_objects_outside_entities_are_ignored() -> None:
+    """Test only the entries of the "entities" array are returned."""
+    content = json.dumps(
+        {
+            "meta": {"entities": [{"id": "light.wrong"}]},
+            "entities": [{"id": "light.right", "action": "turn_on"}],
+        }
+    )
+    results = _feed(content, 4)
+
+    assert [entry for result in results for entry in result] == [
+        {"id": "light.right", "action": "turn_on"}
+    ]
+
+
+def test_escaped_quotes_in_strings() -> None:
+    """Test escaped quotes and braces inside strings don't end an entry."""
+    entity = {"id": 'light.say_\\"hi\\"_}', "action": "turn_on"}
+    content = json.dumps({"entities": [entity], "assistant": "ok"})
+    results = _feed(content, 2)
+
+    assert [entry for result in results for entry in result] == [entity]
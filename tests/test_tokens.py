@@ -0,0 +1,128 @@
+"""Tests of the token counting and the compact entity encoding."""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+
+import pytest
+
+from homeassistant.helpers import area_registry, entity_registry
+
+from custom_components.openai_control.const import (
+    CONF_ENTITY_FORMAT,
+    LANGUAGE_AND_MODE,
+)
+from custom_components.openai_control.tokens import (
+    count_message_tokens,
+    count_tokens,
+    is_exact,
+)
+
+from .common import (
+    StubClient,
+    async_create_hass,
+    conversation_input,
+    create_agent,
+    populate,
+    register_services,
+)
+
+
+async def _async_prompt_tokens(language_and_mode: str, entity_format: str) -> int:
+    """Return the prompt tokens of a request about all entities of a large house."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        populate(hass, 200)
+        register_services(hass)
+        client = StubClient({"entities": [], "assistant": "Done."})
+        agent = create_agent(
+            hass,
+            client,
+            **{LANGUAGE_AND_MODE: language_and_mode, CONF_ENTITY_FORMAT: entity_format},
+        )
+        await agent.async_process(conversation_input("Turn off all the lights"))
+        await hass.async_stop(force=True)
+    return count_message_tokens(client.requests[-1]["messages"], "gpt-3.5-turbo")
+
+
+# the cut is measured in tokens of the model, an estimate by characters
+# doesn't see that a separator or number is a single token
+exact = pytest.mark.skipif(
+    not is_exact("gpt-3.5-turbo"), reason="the tiktoken encoding is unavailable"
+)
+
+
+@exact
+@pytest.mark.parametrize(
+    "language_and_mode", ["English", "English + brightness + color control"]
+)
+def test_compact_encoding_cuts_prompt_tokens(language_and_mode: str) -> None:
+    """Test the compact encoding cuts the prompt by at least 40%.
+
+    In the color mode every light is on and keeps its brightness and color.
+    """
+    standard = asyncio.run(_async_prompt_tokens(language_and_mode, "standard"))
+    compact = asyncio.run(_async_prompt_tokens(language_and_mode, "compact"))
+    assert compact <= standard * 0.6, (standard, compact)
+
+
+def test_compact_lines_leave_out_the_group_area() -> None:
+    """Test a compact line drops its area, rounds its color and follows moves."""
+
+    async def _async_test() -> None:
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = await async_create_hass(config_dir)
+            populate(hass, 5)
+            hass.states.async_set(
+                "light.kitchen_light_0",
+                "on",
+                {"brightness": 128, "hs_color": (30.4, 79.6)},
+            )
+            agent = create_agent(hass, StubClient({}))
+            catalog = agent.catalog
+            entity = catalog.entities["light.kitchen_light_0"]
+            line = entity.lines["compact_color"]
+            assert line == f"{entity.handle}<>light_0<>on<>128<>30,80\n"
+
+            hass.states.async_set("light.kitchen_light_0", "off", {"brightness": 128})
+            await hass.async_block_till_done()
+            assert entity.lines["compact_color"] == f"{entity.handle}<>light_0<>off\n"
+
+            areas = area_registry.async_get(hass)
+            entity_registry.async_get(hass).async_update_entity(
+                "light.kitchen_light_0", area_id=areas.async_get_or_create("garage").id
+            )
+            await hass.async_block_till_done()
+            assert entity.lines["compact"] == f"{entity.handle}<>kitchen_light_0<>off\n"
+            assert "light garage:" in catalog.async_render(None, None, True)
+            await hass.async_stop(force=True)
+
+    asyncio.run(_async_test())
+
+
+def test_blocks_are_counted_like_the_whole_message() -> None:
+    """Test counting the cached blocks separately gives about the same count."""
+    entities = "\n".join(f"light.kitchen_{index}<>on" for index in range(100))
+    messages = [
+        {"role": "system", "content": "You control a smart home."},
+        {"role": "user", "content": f'Prompt: "lights off"\n\nEntities: {entities}\n'},
+    ]
+
+    whole = count_message_tokens(messages, "gpt-3.5-turbo")
+    split = count_message_tokens(
+        messages, "gpt-3.5-turbo", (messages[0]["content"], entities, "")
+    )
+    assert abs(whole - split) <= 3
+
+
+def test_utterances_do_not_evict_the_entity_block() -> None:
+    """Test the entity block stays cached while the utterance changes."""
+    entities = "\n".join(f"switch.office_{index}<>off" for index in range(50))
+    count_tokens.cache_clear()
+    for text in ("turn on the office", "turn off the office", "office lamp on") * 10:
+        messages = [{"role": "user", "content": f"{text}\n{entities}"}]
+        count_message_tokens(messages, "gpt-3.5-turbo", (entities,))
+
+    info = count_tokens.cache_info()
+    assert info.misses == 1
+    assert info.hits == 29